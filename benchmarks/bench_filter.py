@@ -0,0 +1,69 @@
+"""
+Benchmark for filtering the scanned DataFrame
+
+Build a synthetic Processing DataFrame and compare the time of the indexed filter engine (FilterIndex)
+with the row-wise filtering (isin and str.contains on every row) for the typical queries of step.
+
+usage: python benchmarks/bench_filter.py [n_rows]
+"""
+from __future__ import print_function
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+from pynit.handler.selector import FilterIndex
+
+QUERIES = [('pipeline+step', [None, None, ['A_fMRI'], ['003_Step']], None),
+           ('subject+session+step', [['sub-0042'], ['ses-01'], ['A_fMRI'], ['003_Step']], None),
+           ('subject+file_tag', [['sub-0042'], None, None, None, ['run-0001'], None], None),
+           ('ext only', [None] * 6, ['.nii', '.nii.gz'])]
+
+
+def make_frame(n_rows, n_subj=500, n_step=10):
+    """ Generate DataFrame with the columns of Processing dataclass
+    """
+    idx = np.arange(n_rows)
+    subj = np.array(['sub-{0:04d}'.format(i) for i in range(n_subj)], dtype=object)[idx % n_subj]
+    sess = np.array(['ses-00', 'ses-01'], dtype=object)[(idx // n_subj) % 2]
+    step = np.array(['{0:03d}_Step'.format(i + 1) for i in range(n_step)], dtype=object)[(idx // (2 * n_subj)) % n_step]
+    ext = np.array(['.nii.gz', '.1D', '.json'], dtype=object)[idx % 3]
+    filename = ['{0}_{1}_run-{2:04d}{3}'.format(a, b, i // (20 * n_subj), e)
+                for a, b, i, e in zip(subj, sess, idx, ext)]
+    df = pd.DataFrame(dict(Pipeline='A_fMRI', Step=step, Subject=subj, Session=sess, Filename=filename),
+                      columns=['Pipeline', 'Step', 'Subject', 'Session', 'Filename'])
+    df['Abspath'] = '/prj/Processing/' + df.Pipeline + '/' + df.Step + '/' + df.Subject + '/' + df.Filename
+    return df
+
+
+def rowwise(df, filters, ext):
+    """ Row-wise filtering (same as Project.applying_filters without index)
+    """
+    for column, values in zip(['Subject', 'Session', 'Pipeline', 'Step'], filters[:4]):
+        if values:
+            df = df[df[column].isin(values)]
+    if len(filters) > 4 and filters[4] is not None:
+        df = df[df.Filename.str.contains('|'.join(filters[4]))]
+    if ext:
+        df = df[df.Filename.str.contains('|'.join([r"{ext}$".format(ext=e) for e in ext]))]
+    return df
+
+
+def main(n_rows):
+    df = make_frame(n_rows)
+    engine = FilterIndex(df, 1)
+    start = timeit.default_timer()
+    for _, filters, ext in QUERIES:
+        engine.select(filters + [None] * (6 - len(filters)), ext)
+    print('rows: {0}, index built in {1:.3f} sec'.format(n_rows, timeit.default_timer() - start))
+    print('{0:>22} {1:>10} {2:>14} {3:>14}'.format('query', 'selected', 'rowwise(ms)', 'indexed(ms)'))
+    for name, filters, ext in QUERIES:
+        filters = filters + [None] * (6 - len(filters))
+        selected = engine.select(filters, ext)
+        assert len(selected) == len(rowwise(df, filters, ext))
+        slow = min(timeit.repeat(lambda: rowwise(df, filters, ext), number=1, repeat=3))
+        fast = min(timeit.repeat(lambda: engine.select(filters, ext), number=100, repeat=3)) / 100
+        print('{0:>22} {1:>10} {2:>14.3f} {3:>14.3f}'.format(name, len(selected), slow * 1e3, fast * 1e3))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
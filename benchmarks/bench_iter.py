@@ -0,0 +1,41 @@
+"""
+Benchmark for iterating the project DataFrame
+
+Compare the row iteration with pandas.DataFrame.iterrows (previous iteration protocol of Project)
+with the record iterator and the columnar batch accessor of Snapshot.
+
+usage: python benchmarks/bench_iter.py [n_rows]
+"""
+from __future__ import print_function
+import sys
+import timeit
+from pynit.handler.records import Snapshot
+from bench_filter import make_frame
+
+
+def iterrows(df):
+    return [row.Abspath for _, row in df.iterrows()]
+
+
+def records(snapshot):
+    return [row.Abspath for _, row in enumerate(snapshot.records())]
+
+
+def batch(snapshot):
+    return list(snapshot.batch(['Abspath', 'Subject', 'Session']).Abspath)
+
+
+def main(n_rows):
+    df = make_frame(n_rows)
+    snapshot = Snapshot(df)
+    base = min(timeit.repeat(lambda: iterrows(df), number=1, repeat=3))
+    print('rows: {0}'.format(n_rows))
+    print('{0:>10} {1:>10} {2:>10}'.format('method', 'sec', 'speedup'))
+    print('{0:>10} {1:>10.4f} {2:>10.1f}'.format('iterrows', base, 1))
+    for name, func in [('records', records), ('batch', batch)]:
+        sec = min(timeit.repeat(lambda: func(snapshot), number=1, repeat=3))
+        print('{0:>10} {1:>10.4f} {2:>10.1f}'.format(name, sec, base / sec))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,79 @@
+"""
+Benchmark for memory usage of the scanned DataFrame
+
+Build the records of synthetic Processing tree in memory (same as the scanner does for real tree),
+and compare the memory of the scanned DataFrame with its compact form (categorical hierarchy columns,
+interned directory prefix instead of 'Abspath').
+The memory is counted from numpy buffers and unique python objects, since the strings of hierarchy columns
+are shared by all files in the same directory.
+
+usage: python benchmarks/bench_memory.py [n_files]
+"""
+from __future__ import print_function
+import os
+import sys
+import timeit
+import numpy as np
+from pynit.handler.scanner import TreeRecords
+from pynit.handler.project import update_columns, reorder_columns
+from pynit.handler.compact import compacting, expanding
+
+
+def make_records(root, n_files, n_pipe=2, n_step=10, n_subj=500, n_sess=2):
+    """ Generate records of Processing/<pipeline>/<step>/<subject>/<session>/<files>
+    """
+    n_dirs = n_pipe * n_step * n_subj * n_sess
+    n_per_dir = max(1, n_files // n_dirs)
+    records = TreeRecords()
+    for pp in range(n_pipe):
+        for st in range(n_step):
+            for sj in range(n_subj):
+                for ss in range(n_sess):
+                    dirpath = os.path.join(root, 'Processing', 'Pipeline_{0}'.format(pp),
+                                           '{0:03d}_Step-func'.format(st + 1), 'sub-{0:04d}'.format(sj),
+                                           'ses-{0:02d}'.format(ss))
+                    files = ['sub-{0:04d}_ses-{1:02d}_task-rest_run-{2:02d}_bold.nii.gz'.format(sj, ss, i)
+                             for i in range(n_per_dir)]
+                    records.append_dir(root, dirpath, files)
+    return records
+
+
+def frame_size(df):
+    """ Bytes of DataFrame, the python object referred by multiple rows is counted once
+    """
+    size = 0
+    seen = set()
+    for column in df.columns:
+        values = df[column].values
+        if hasattr(values, 'codes'):
+            size += values.codes.nbytes
+            values = np.asarray(values.categories, dtype=object)
+        size += values.nbytes
+        if values.dtype == object:
+            for value in values:
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    size += sys.getsizeof(value)
+    return size
+
+
+def main(n_files):
+    root = '/mnt/nfs/projects/study_2018'
+    records = make_records(root, n_files)
+    df = records.to_dataframe()
+    df = df.rename(columns=update_columns(1, False))[reorder_columns(1, False)]
+    start = timeit.default_timer()
+    compact = compacting(df)
+    elapsed = timeit.default_timer() - start
+    full, small = frame_size(df), frame_size(compact)
+    print('files: {0}'.format(len(df)))
+    print('{0:>12} {1:>12}'.format('form', 'MB'))
+    print('{0:>12} {1:>12.1f}'.format('scanned', full / 1e6))
+    print('{0:>12} {1:>12.1f}'.format('compact', small / 1e6))
+    print('reduction: {0:.1f}x, compacting: {1:.2f} sec'.format(float(full) / small, elapsed))
+    sample = compact.take(np.arange(0, len(compact), 1000))
+    assert expanding(sample).Abspath.tolist() == df.take(np.arange(0, len(df), 1000)).Abspath.tolist()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,53 @@
+"""
+Benchmark for project tree scanning
+
+Build synthetic Processing trees with increasing number of files and measure the time of
+'parsing_datatree'. The time per file should stay flat while the number of files grows (linear scaling).
+
+usage: python benchmarks/bench_scan.py [n_files ...]
+"""
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+from pynit.handler.project import parsing_datatree
+
+DS_TYPE = ['Data', 'Processing', 'Results']
+
+
+def make_tree(root, n_files, n_subj=20, n_step=5):
+    """ Generate empty files under Processing/<pipeline>/<step>/<subject>/<session>
+    """
+    n_per_dir = max(1, n_files // (n_subj * n_step * 2))
+    count = 0
+    for st in range(n_step):
+        for sj in range(n_subj):
+            for ss in range(2):
+                path = os.path.join(root, DS_TYPE[1], 'A_fMRI', '{0:03d}_Step'.format(st + 1),
+                                    'sub-{0:03d}'.format(sj), 'ses-{0:02d}'.format(ss))
+                os.makedirs(path)
+                for i in range(n_per_dir):
+                    open(os.path.join(path, 'sub-{0:03d}_run-{1:04d}.nii.gz'.format(sj, i)), 'w').close()
+                    count += 1
+    return count
+
+
+def main(sizes):
+    print('{0:>10} {1:>10} {2:>14}'.format('files', 'sec', 'usec/file'))
+    for size in sizes:
+        root = tempfile.mkdtemp()
+        try:
+            n_files = make_tree(root, size)
+            sec = min(timeit.repeat(lambda: parsing_datatree(root, DS_TYPE, 1), number=1, repeat=3))
+            print('{0:>10} {1:>10.3f} {2:>14.2f}'.format(n_files, sec, sec / n_files * 1e6))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main([int(n) for n in sys.argv[1:]])
+    else:
+        main([1000, 5000, 20000, 40000])
@@ -0,0 +1,71 @@
+"""
+Benchmark for parallel directory walking on slow filesystem
+
+The latency of network filesystem (NFS) is emulated by adding a delay to every 'stat' and directory listing
+under the benchmark tree, and 'parsing_datatree' is measured with different number of scan workers.
+
+usage: python benchmarks/bench_walk.py [latency_ms]
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+import timeit
+from pynit.handler import scanner
+from pynit.handler.project import parsing_datatree
+from bench_scan import make_tree, DS_TYPE
+
+
+class SlowFilesystem(object):
+    """ Stand-in of network filesystem, which delays stat and listing calls under the root
+    """
+    def __init__(self, root, latency):
+        self.root = root
+        self.latency = latency
+        self.__stat = os.stat
+        self.__listing = scanner.listing_dir
+
+    def stat(self, path, *args, **kwargs):
+        if str(path).startswith(self.root):
+            time.sleep(self.latency)
+        return self.__stat(path, *args, **kwargs)
+
+    def listing_dir(self, path):
+        if path.startswith(self.root):
+            time.sleep(self.latency)
+        return self.__listing(path)
+
+    def __enter__(self):
+        os.stat = self.stat
+        scanner.listing_dir = self.listing_dir
+        return self
+
+    def __exit__(self, *args):
+        os.stat = self.__stat
+        scanner.listing_dir = self.__listing
+
+
+def main(latency):
+    root = tempfile.mkdtemp()
+    try:
+        n_files = make_tree(root, 4000, n_subj=40, n_step=5)
+        reference = parsing_datatree(root, DS_TYPE, 1)[0]
+        print('files: {0}, latency: {1} ms'.format(n_files, latency * 1e3))
+        print('{0:>8} {1:>10} {2:>10}'.format('workers', 'sec', 'speedup'))
+        base = None
+        with SlowFilesystem(root, latency):
+            for workers in [1, 2, 4, 8, 16]:
+                df = parsing_datatree(root, DS_TYPE, 1, workers=workers)[0]
+                assert df.Abspath.tolist() == reference.Abspath.tolist()
+                sec = min(timeit.repeat(lambda: parsing_datatree(root, DS_TYPE, 1, workers=workers),
+                                        number=1, repeat=2))
+                base = base or sec
+                print('{0:>8} {1:>10.3f} {2:>10.1f}'.format(workers, sec, base / sec))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) / 1e3 if len(sys.argv) > 1 else 0.002)
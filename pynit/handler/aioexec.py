@@ -0,0 +1,272 @@
+"""
+Asyncio execution engine of step (Python 3 only)
+The shell commands of the tasks are launched as asyncio subprocesses from a single thread, so a lot of
+lightweight commands (e.g. 3dinfo, 3dcopy, 1d_tool.py) can be in flight without a thread for each of them.
+The number of running commands is bounded by a semaphore.
+"""
+import shlex
+import asyncio
+import threading
+from queue import Queue
+from asyncio.subprocess import PIPE
+from .scheduler import thread_environ, process_memory, available_memory, MemoryBudget, psutil
+
+
+async def reading(stream, logger=None, name='stdout', size=65536):
+    """ Read the output stream of the command by chunks, each line is written to the logger as soon as it's read
+
+    :param stream: asyncio.StreamReader
+    :param logger: logger of the lines (the lines are only collected if None)
+    :param name: str, name of the stream in the log
+    :param size: int, maximum bytes of a chunk
+    :return: bytes, all output of the stream
+    """
+    chunks = []
+    pending = b''
+    while True:
+        chunk = await stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if logger is not None:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                logger.debug("Shell::{} [{}]".format(name, line.decode(errors='replace')))
+    if pending and logger is not None:
+        logger.debug("Shell::{} [{}]".format(name, pending.decode(errors='replace')))
+    return b''.join(chunks)
+
+
+async def communicate(processor, logger=None):
+    """ Read stdout and stderr of the process incrementally and wait for it, instead of Process.communicate
+    which holds all output until the process is exited
+
+    :param processor: asyncio.subprocess.Process
+    :param logger: logger of the output lines
+    :return: stdout, stderr
+    """
+    out, err = await asyncio.gather(reading(processor.stdout, logger, 'stdout'),
+                                    reading(processor.stderr, logger, 'stderr'))
+    await processor.wait()
+    return out, err
+
+
+async def shell(cmd, logger=None, env=None):
+    """ Execute shell command asynchronously, same as methods.execute
+
+    :param cmd: str, command to execute
+    :param logger: logger of the command and its output lines
+    :param env: dict, environment variables of the command (default: inherited)
+    :return: stdout, error, exit status (None if the command can't be executed)
+    """
+    try:
+        processor = await asyncio.create_subprocess_exec(*shlex.split(cmd), stdout=PIPE, stderr=PIPE, env=env)
+        if logger is not None:
+            logger.info("Shell::Success [{}]".format(cmd))
+        out, err = await communicate(processor, logger)
+        return out, err, processor.returncode
+    except OSError as e:
+        if logger is not None:
+            logger.info("Shell::Error [{}]".format(e))
+        return None, None, None
+
+
+async def measured_shell(cmd, env=None, interval=0.2, logger=None):
+    """ Execute shell command asynchronously and sample its peak memory, same as scheduler.measured_shell
+
+    :param cmd: str, command to execute
+    :param env: dict, environment variables of the command (default: inherited)
+    :param interval: sampling interval (seconds)
+    :param logger: logger of the output lines
+    :return: stdout, error, exit status, peak memory (bytes)
+    """
+    try:
+        processor = await asyncio.create_subprocess_exec(*shlex.split(cmd), stdout=PIPE, stderr=PIPE, env=env)
+    except OSError:
+        return None, None, None, 0
+    communicating = asyncio.ensure_future(communicate(processor, logger))
+    peak = 0
+    try:
+        process = psutil.Process(processor.pid)
+    except psutil.Error:
+        process = None
+    while not communicating.done():
+        if process is not None:
+            try:
+                peak = max(peak, process_memory(process))
+            except psutil.Error:
+                process = None
+        await asyncio.wait([communicating], timeout=interval)
+    out, err = communicating.result()
+    return out, err, processor.returncode, peak
+
+
+def stepping(interpreter, value=None):
+    """ Send the value to the interpreter of plan, which runs the python code blocks until the next launch
+
+    :return: next Launch, None if the interpreter is finished (StopIteration can't be set to the future of loop)
+    """
+    try:
+        return interpreter.send(value)
+    except StopIteration:
+        return None
+
+
+class AsyncBudget(object):
+    """ Budget on the event loop, same as the budget of scheduler (ThreadBudget or MemoryBudget)
+    """
+    def __init__(self, budget):
+        """ Initiate budget
+
+        :param budget: scheduler.Budget, which gives the capacity
+        """
+        self.capacity = budget.capacity
+        self.interval = budget.interval
+        self.memory = isinstance(budget, MemoryBudget)
+        self.used = 0
+        self.__condition = asyncio.Condition()
+
+    def fits(self, amount):
+        if self.used + amount > self.capacity:
+            return False
+        available = available_memory() if self.memory else None
+        return available is None or amount <= available
+
+    async def acquire(self, amount):
+        """ Wait until the amount fits in the budget and reserve it
+
+        :return: reserved amount (the amount is limited to the capacity)
+        """
+        amount = min(amount, self.capacity)
+        async with self.__condition:
+            while self.used and not self.fits(amount):
+                try:
+                    await asyncio.wait_for(self.__condition.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.used += amount
+        return amount
+
+    async def release(self, amount):
+        async with self.__condition:
+            self.used -= amount
+            self.__condition.notify_all()
+
+
+class reserving(object):
+    """ Asynchronous context to reserve the demand in the budget, nothing is reserved if the budget is None
+    (same as scheduler.reserving, implemented without contextlib.asynccontextmanager for Python 3.6)
+    """
+    def __init__(self, budget, amount):
+        self.budget = budget
+        self.amount = amount
+
+    async def __aenter__(self):
+        if self.budget is not None:
+            self.amount = await self.budget.acquire(self.amount)
+        return self.amount
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.budget is not None:
+            await self.budget.release(self.amount)
+        return False
+
+
+class AsyncExecutor(object):
+    """ Executor of the task chains of ExecutionPlan on asyncio event loop
+    The event loop runs in a background thread and the results of the chains are taken in completion order,
+    as the imap_unordered of the pools. The preparation, the python code blocks of the commands and the closing
+    of the tasks are blocking, so they are executed in the default executor of the loop.
+    """
+    def __init__(self, inflight=64):
+        """ Initiate executor
+
+        :param inflight: maximum number of shell commands running at the same time
+        """
+        self.inflight = inflight
+
+    def imap_unordered(self, plan, chains):
+        """ Execute the chains of tasks
+
+        :param plan: ExecutionPlan
+        :param chains: list of list of Task
+        :return: generator of outputs of chains (list of outputs of the executed tasks)
+        """
+        results = Queue()
+        done = object()
+        errors = []
+
+        def running():
+            loop = asyncio.new_event_loop()
+            try:
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(self.__executing(plan, chains, results.put))
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                loop.close()
+                results.put(done)
+
+        thread = threading.Thread(target=running)
+        thread.daemon = True
+        thread.start()
+        while True:
+            output = results.get()
+            if output is done:
+                break
+            yield output
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    async def __executing(self, plan, chains, callback):
+        semaphore = asyncio.Semaphore(self.inflight)
+        budget = None if plan.budget is None else AsyncBudget(plan.budget)
+        memory = None if plan.memory is None else AsyncBudget(plan.memory)
+
+        async def executing(tasks):
+            callback(await self.execute_chain(plan, tasks, semaphore, budget, memory))
+
+        await asyncio.gather(*[executing(tasks) for tasks in chains])
+
+    @staticmethod
+    async def execute_chain(plan, tasks, semaphore, budget=None, memory=None):
+        """ Execute the tasks in order, the error is logged and the rest of tasks are not executed
+
+        :param plan: ExecutionPlan
+        :param tasks: list of Task
+        :param semaphore: asyncio.Semaphore, bounds the running commands
+        :param budget: AsyncBudget, bounds the threads of running commands
+        :param memory: AsyncBudget, bounds the peak memory of running commands
+        :return: list of outputs of the executed tasks
+        """
+        loop = asyncio.get_event_loop()
+        logger = plan.proc.logger
+        output = []
+        for task in tasks:
+            try:
+                namespace = await loop.run_in_executor(None, plan.prepare, task)
+                if namespace is None:
+                    continue
+                try:
+                    interpreter = plan.interpret(namespace)
+                    launch = await loop.run_in_executor(None, stepping, interpreter)
+                    while launch is not None:
+                        async with semaphore, reserving(budget, launch.threads) as threads, \
+                                reserving(memory, launch.memory):
+                            env = thread_environ(threads)
+                            if plan.profile is None:
+                                result = await shell(launch.command, logger=logger, env=env)
+                            else:
+                                out, err, code, peak = await measured_shell(launch.command, env=env, logger=logger)
+                                plan.profile.record(launch.key, peak)
+                                result = out, err, code
+                        launch = await loop.run_in_executor(None, stepping, interpreter, result)
+                    output.append(await loop.run_in_executor(None, plan.close, task, namespace))
+                finally:
+                    await loop.run_in_executor(None, plan.discard, task, namespace)
+            except Exception as e:
+                plan.failed(task, e)
+                break
+        return output
@@ -8,6 +8,18 @@ from collections import namedtuple
 import datetime
 from time import sleep
 from ..tools import display, clear_output, progressbar
+from .scanner import walk_tree
+from .manifest import writing_manifest, removing_manifest
+from .inputs import InputTable, Query
+from .cache import StepCache, hashing
+from .scheduler import ThreadBudget, MemoryBudget, MemoryProfile, parse_size, psutil
+from .plan import ExecutionPlan, Command, Task, Unit, Initializer, initializing, executing
+try:
+    from .aioexec import AsyncExecutor
+except (ImportError, SyntaxError, AttributeError):    # asyncio engine is only available on Python 3
+    AsyncExecutor = None
+
+STAGING = '.staging'    # staging folder of the outputs under project root, which is not scanned
 
 
 ########################################################################################################################
@@ -38,8 +50,8 @@ _dset = namedtuple('Dataset', ['name', 'idx'])
 _vset = namedtuple('Variable', ['name', 'value', 'type'])
 _gset = namedtuple('Group', ['name', 'args', 'kwargs'])
 _oset = namedtuple('OutputParam', ['name', 'code', 'type', 'ext', 'prefix'])
-_fltr = namedtuple('Filters', ['name', 'code'])
-_cmds = namedtuple('Command', ['name', 'command', 'nscode', 'type', 'level'])
+_fltr = namedtuple('Filters', ['name', 'query'])
+_cmds = namedtuple('Command', ['name', 'command', 'nscode', 'type', 'level', 'threads', 'memory'])
 
 
 class BaseProcessor(object):
@@ -61,13 +73,16 @@ class BaseProcessor(object):
      err:
 
     """
-    def __init__(self, procobj, n_thread='max'):
+    def __init__(self, procobj, n_thread='max', executor='thread'):
         """ Initiating class
 
         :param procobj: Activated Process instance
+        :param n_thread: Number of workers for parallel computing, or 'max'
+        :param executor: 'thread', 'process' or 'async', backend of the workers
         """
         self.__init_container(procobj)
         self.set_parallel(n_thread=n_thread)
+        self.set_executor(executor)
 
     def __init_container(self, procobj):
         """ Initiating containers for objects
@@ -78,6 +93,9 @@ class BaseProcessor(object):
         # Environment related containers
         self.__proc = procobj
         self._parallel = 1
+        self._executor = 'thread'
+        self._inflight = 64
+        self._memory = None             # budget and interval of memory admission control (set_memory)
         self.__prj = procobj.prj
         self.__pipeline = procobj.processing
         self.__import = list()
@@ -92,8 +110,7 @@ class BaseProcessor(object):
         self.__output = list()
         self.__assigned_namespace = ['title', 'subj', 'sess', 'i', 'idx',
                                      'output_checker', 'flist_checker']
-        self.__mkdir = list()
-        self.__opened_temps = list()
+        self.__initializers = list()
         # Command containers
         self.__cmd = list()
         self.__dc = None
@@ -122,11 +139,9 @@ class BaseProcessor(object):
             if len(overlapped):
                 if verbose:
                     print('Notice: existing path')
-                checked_files = []
-                for f in os.walk(os.path.join(processing_path, overlapped[0])):
-                    checked_files.extend(f[2])
-                if len(checked_files):
-                    if verbose:
+                if verbose:
+                    # stop walking at the first directory which has any file
+                    if any(files for _, files, _ in walk_tree(os.path.join(processing_path, overlapped[0]))):
                         print('Notice: Last step path is not empty')
                 return os.path.join(processing_path, overlapped[0])
             else:
@@ -163,6 +178,77 @@ class BaseProcessor(object):
         else:
             methods.raiseerror(messages.Errors.InputTypeError, 'Wrong parameter')
 
+    def set_executor(self, executor, inflight=None):
+        """ Method to select the backend of parallel computing
+        The 'process' executor runs the tasks in the worker processes (forkserver or spawn if available),
+        which avoids the GIL for the python commands. Every value used in the commands has to be picklable,
+        and 'self' in the worker is a stand-in of Process which has prj, logger, path and subjects (sessions)
+        The 'async' executor launches the shell commands as asyncio subprocesses from a single thread,
+        for the steps of many lightweight commands (Python 3 only)
+
+        :param executor:    'thread', 'process' or 'async'
+        :param inflight:    maximum number of running shell commands for 'async' executor
+        :type executor:     str
+        :type inflight:     int
+        """
+        if executor not in ['thread', 'process', 'async']:
+            methods.raiseerror(messages.Errors.InputValueError, 'Wrong executor')
+        elif executor == 'async' and AsyncExecutor is None:
+            methods.raiseerror(messages.Errors.InsufficientEnv, 'Async executor requires Python 3')
+        else:
+            self._executor = executor
+            if inflight is not None:
+                if isinstance(inflight, int) and inflight >= 1:
+                    self._inflight = inflight
+                else:
+                    methods.raiseerror(messages.Errors.InputValueError, 'Wrong number of inflight commands')
+
+    def set_worker_init(self, name, func, *args, **kwargs):
+        """ Method to assign namespace of the resource loaded once in each worker (e.g. template image or model),
+        the function is called with given arguments when the worker is started and its return value can be used
+        in the custom code by the name
+
+        :param name:    namespace for the resource
+        :param func:    function to load the resource, it needs to be importable at module level for process executor
+        :param args:    arguments of the function
+        :param kwargs:  keyword arguments of the function
+        """
+        if not callable(func):
+            methods.raiseerror(messages.Errors.InputTypeError, 'Worker initializer should be callable')
+        else:
+            self.__check_namespace(name)
+            self.__initializers.append(Initializer(name=name, func=func, args=args, kwargs=kwargs))
+
+    def set_memory(self, budget=None, interval=1.0):
+        """ Method to enable the memory admission control of the shell commands (disabled by default)
+        The launch of the command is delayed while its peak memory (declared in set_cmd, or measured in
+        the previous runs of the pipeline) does not fit in the budget or in the available memory.
+        The peak memory of commands is measured with psutil and kept in the pipeline folder ('.memory')
+
+        :param budget:      memory for the commands of the step, bytes or str with unit (e.g. '16G'),
+                            float for the fraction of available memory (default: 0.9), or False to disable
+        :param interval:    seconds to check the available memory again
+        """
+        if budget is False:
+            self._memory = None
+        elif budget is None or isinstance(budget, float) and 0 < budget <= 1:
+            self._memory = (budget, interval)
+        else:
+            try:
+                self._memory = (parse_size(budget), interval)
+            except ValueError:
+                methods.raiseerror(messages.Errors.InputValueError, 'Wrong memory budget')
+
+    @property
+    def threads_per_task(self):
+        """ Share of cores for each parallel task with current settings, use this for the thread option of
+        multi-threaded tools instead of the number of cores, so the parallel tasks do not run cores x cores threads.
+        The share is resolved again when the step is executed, so the variable of the thread option should be
+        set as the expression 'threads_per_task' (e.g. set_var(name='thread', value='threads_per_task'))
+        """
+        workers = self._inflight if self._executor == 'async' else self._parallel
+        return max(multiprocessing.cpu_count() // workers, 1)
+
     def set_input(self, name, path, filters=None, idx=None, type=0, args=None, kwargs=None):
         """ Method to assign namespace of inputs
 
@@ -188,19 +274,19 @@ class BaseProcessor(object):
                     methods.raiseerror(messages.InputObjectError, 'Main input had been assigned already')
                 self.__mainset = _dset(name=name, idx=idx)
                 self.__filters['main'] = _fltr(name=name,
-                                               code=self.__convert_filtercode(dc, path, filters, type))
+                                               query=self.__convert_filterquery(dc, path, filters, type))
             elif type == 1:
                 self.__sideset.append(_dset(name=name, idx=idx))
                 self.__filters['side'][name] = _fltr(name=name,
-                                                     code=self.__convert_filtercode(dc, path, filters, type))
+                                                     query=self.__convert_filterquery(dc, path, filters, type))
             elif type == 2:
                 self.__multi.append(_gset(name=name, args=args, kwargs=kwargs))
                 self.__filters['multi'][name] = _fltr(name=name,
-                                                      code=self.__convert_filtercode(dc, path, filters, type))
+                                                      query=self.__convert_filterquery(dc, path, filters, type))
             elif type == 3:
                 self.__group.append(_gset(name=name, args=args, kwargs=kwargs))
                 self.__filters['group'][name] = _fltr(name=name,
-                                                      code=self.__convert_filtercode(dc, path, filters, type))
+                                                      query=self.__convert_filterquery(dc, path, filters, type))
         else:
             methods.raiseerror(messages.Errors.InputTypeError, 'Wrong input type')
 
@@ -282,7 +368,7 @@ class BaseProcessor(object):
             self.__check_namespace(name)
             self.__convert_outputcode(name, level, dc, ext, prefix, type)
 
-    def set_cmd(self, command, name=None, type=0, level=0):
+    def set_cmd(self, command, name=None, type=0, level=0, threads=None, memory=None):
         """ Method to set command for inputs
 
         :param name:        namespace for output of command
@@ -290,6 +376,12 @@ class BaseProcessor(object):
         :param type:        0=local shell
                             1=python methods
                             2=scheduler
+        :param threads:     number of threads of the shell command, which is counted in the thread budget
+                            and given to the command as OMP_NUM_THREADS and ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS.
+                            if not given, it is inferred from the thread option of known tools (e.g. antsSyN -n),
+                            otherwise the share of cores for each parallel task (threads_per_task)
+        :param memory:      peak memory of the shell command, bytes or str with unit (e.g. '8G'),
+                            if not given, the peak measured in the previous runs is used (set_memory)
         :return:
         """
         for cmd in self.__cmd:
@@ -306,9 +398,18 @@ class BaseProcessor(object):
         if type not in [0, 1, 2]:
             methods.raiseerror(messages.Errors.InputTypeError,
                                'Wrong command type')
+        elif threads is not None and not (isinstance(threads, int) and threads >= 0):
+            methods.raiseerror(messages.Errors.InputValueError,
+                               'Wrong number of threads')
         else:
+            if memory is not None:
+                try:
+                    memory = parse_size(memory)
+                except ValueError:
+                    methods.raiseerror(messages.Errors.InputValueError, 'Wrong size of memory')
             self.__proc.logger.info('CMD_Pattern:{}'.format(command))
-            self.__cmd.append(_cmds(name=name, command=command, nscode=nscode, type=type, level=level))
+            self.__cmd.append(_cmds(name=name, command=command, nscode=nscode, type=type, level=level,
+                                    threads=threads, memory=memory))
 
     def reset(self):
         """ Method to reset all containers
@@ -436,95 +537,70 @@ class BaseProcessor(object):
             leveldir = 'subj'
         return leveldir
 
-    def __convert_filtercode(self, dataclass, path, filters, type):
-        """ Method to convert filter code feasible for Project handler
+    def __convert_filterquery(self, dataclass, path, filters, type):
+        """ Method to convert filters into the query for Project handler, the subject and session are
+        not included since the files of all tasks are queried at once (see 'InputTable')
 
         :param dataclass: dataclass
         :param path: input path
         :param filters: filters
-        :return: filter code for Project handler
+        :return: Query
         """
-        filter_ref = ['ext', 'file_tag', 'ignore']
-        group_filter_ref = ['subj', 'sess', 'group']
         if dataclass == 0:
-            output_filters = [dataclass, '"{0}"'.format(path)]
+            args = [dataclass, path]
         else:
-            output_filters = [dataclass, '"{0}"'.format(self.__pipeline), '"{0}"'.format(path)]
+            args = [dataclass, self.__pipeline, path]
+        kwargs = dict()
         if type in [0, 1]:
-            if self.__proc.sessions:
-                output_filters.extend(['subj', 'sess'])
-            else:
-                output_filters.extend(['subj'])
+            level = ('Subject', 'Session') if self.__proc.sessions else ('Subject',)
+        elif type == 2:
+            level = ('Subject',)
         else:
-            if type == 2:
-                output_filters.extend(['subj'])
-            elif type == 3:
-                if isinstance(filters, dict):
-                    for k, vs in filters.items():
-                        if k in group_filter_ref:
-                            if isinstance(vs, list):
-                                output_filters.extend(['"{0}"'.format(v) for v in vs])
-                            elif isinstance(vs, str):
-                                output_filters.append('"{0}"'.format(vs))
-                            else:
-                                methods.raiseerror(messages.Errors.InputTypeError, 'Value type must be str or list')
-                            del(filters[k])
+            level = ()
+        filter_ref = ['ext', 'file_tag', 'ignore']
+        group_filter_ref = ['subj', 'sess', 'group']
         if isinstance(filters, dict):
-            if any(k not in filter_ref for k in filters.keys()):
-                methods.raiseerror(messages.Errors.KeywordError, 'Unable filter keyword')
-            else:
-                kwargs = ['{key}="{value}"'.format(key=k, value=v) for k, v in filters.items() if isinstance(v, str)]
-                output_filters.extend(kwargs)
-                kwargs = ['{key}={value}'.format(key=k, value=v) for k, v in filters.items() if isinstance(v, list)]
-                output_filters.extend(kwargs)
-        return ', '.join(map(str, output_filters))
+            for k, v in filters.items():
+                if type == 3 and k in group_filter_ref:
+                    if isinstance(v, list):
+                        args.extend(v)
+                    elif isinstance(v, str):
+                        args.append(v)
+                    else:
+                        methods.raiseerror(messages.Errors.InputTypeError, 'Value type must be str or list')
+                elif k not in filter_ref:
+                    methods.raiseerror(messages.Errors.KeywordError, 'Unable filter keyword')
+                elif isinstance(v, (str, list)):
+                    kwargs[k] = v
+        return Query(args=args, kwargs=kwargs, level=level)
 
-    def __convert_inputcode(self):
-        """ Method to convert input code for building custom code
+    def __resolve_inputs(self):
+        """ Method to resolve the inputs of all tasks at once
 
-        :return:
+        :return: InputTable
         """
-        inputcodes = []
+        table = InputTable(self.__prj)
+        filters = []
         if self.__mainset:
-            main_input = self.__mainset
-            inputcode = '{0} = self.prj({1})'.format(main_input.name, self.__filters['main'].code)
-            if main_input.idx:
-                inputcode += '[{}]'.format(main_input.idx)
-            inputcodes.append(inputcode)
-            if self.__sideset:
-                for sip in self.__sideset:
-                    inputcode = '{0} = self.prj({1})'.format(sip.name,
-                                                               self.__filters['side'][sip.name].code)
-                    if sip.idx:
-                        inputcode += '[{}]'.format(sip.idx)
-                    inputcodes.append(inputcode)
-        else:
-            if self.__multi:
-                inputcodes = []
-                for grp in self.__multi:
-                    inputcodes.append('{0} = self.prj({1})'.format(grp.name,
-                                                                   self.__filters['multi'][grp.name].code))
-            else:
-                if self.__group:
-                    inputcodes = []
-                    for grp in self.__group:
-                        inputcodes.append('{0} = self.prj({1})'.format(grp.name,
-                                                                         self.__filters['group'][grp.name].code))
-                else:
-                    methods.raiseerror(messages.Errors.InputTypeError, 'Inputs are not sufficiently assigned')
-        if self.__var:
-            for var in self.__var:
-                if var.type == 0:
-                    inputcodes.append('{0} = {1}'.format(var.name, var.value))
-        return inputcodes
-
-
-    def __convert_mkdir(self):
-        """ Method to convert code for making directory for output
+            filters.append(self.__filters['main'])
+            filters.extend(self.__filters['side'][sip.name] for sip in self.__sideset)
+        elif self.__multi:
+            filters.extend(self.__filters['multi'][grp.name] for grp in self.__multi)
+        elif self.__group:
+            filters.extend(self.__filters['group'][grp.name] for grp in self.__group)
+        for fltr in filters:
+            table.resolve(fltr.name, fltr.query)
+        return table
+
+    def __convert_mkpathes(self, outputs):
+        """ Method to convert the path code of directories for outputs
+
+        :param outputs: list of outputs
+        :return: list of code
         """
         mk_pathes = []
-        if self.__mkdir:
-            for op in self.__mkdir:
+        if outputs:
+            for op in outputs:
                 if op.type == 0:
                     mk_pathes.append('os.path.dirname({0})'.format(op.name))
                 elif op.type == 1:
@@ -539,9 +615,7 @@ class BaseProcessor(object):
                         mk_pathes.append(op.name)
                 else:
                     mk_pathes.append(op.name)
-            return ['methods.mkdir({0})'.format(', '.join(mk_pathes))]
-        else:
-            return None
+        return mk_pathes
 
     def __convert_outputcode(self, name, level, dc, ext, prefix, type):
         """ Method to convert output information to sufficient code for input
@@ -732,56 +806,36 @@ class BaseProcessor(object):
                             ns_code.append('{0}={0}'.format(op.name))
         return nspace, ns_code
 
-    def __convert_cmdcode(self):
-        list_cmd = []
-        for i, cmd in enumerate(self.__cmd):
-
-            if cmd.type == 0: #command line tool
-                # list_cmd.append("self.logger.info('command::{0}'.format({1}))".format(cmd.command, ', '.join(cmd.nscode)))
-                if cmd.name:
-                    list_cmd.append("{0}, err = methods.shell('{1}'.format({2}))".format(cmd.name, cmd.command, ', '.join(cmd.nscode)))
-                    list_cmd.append("stdout_collector.append(('{0}'.format({1}), {2}, err))".format(cmd.command,
-                                                                                                    ', '.join(cmd.nscode),
-                                                                                                    cmd.name))
-                else:
-                    list_cmd.append("out, err = methods.shell('{0}'.format({1}))".format(cmd.command,
-                                                                                         ', '.join(cmd.nscode)))
-                    list_cmd.append("stdout_collector.append(('{0}'.format({1}), out, err))".format(cmd.command,
-                                                                                                    ', '.join(cmd.nscode)))
-
-            elif cmd.type == 1: #python methods
-                if cmd.name:
-                    adtn_cmd = list()
-                    if cmd.nscode:
-                        updated_cmd = str(cmd.command)
-                        for nsc in cmd.nscode:
-                            ns_key, ns_value = nsc.split('=')
-                            updated_cmd = updated_cmd.replace('{'+ns_key+'}', ns_value)
-                        adtn_cmd.append('{0} = {1}'.format(cmd.name, updated_cmd))
-                    else:
-                        adtn_cmd.append('{0} = {1}'.format(cmd.name, cmd.command))
-                    adtn_cmd.append('stdout_collector.append(({0}, None))'.format(cmd.command))
-                    list_cmd.extend(self.__indent(adtn_cmd, level=cmd.level))
-                else:
-                    if cmd.nscode:
-                        updated_cmd = str(cmd.command)
-                        for nsc in cmd.nscode:
-                            ns_key, ns_value = nsc.split('=')
-                            updated_cmd = updated_cmd.replace('{'+ns_key+'}', ns_value)
-                        adtn_cmd = ['try:', self.__indent(updated_cmd),
-                                    'except:',
-                                    self.__indent("methods.raiseerror(messages.CommandExecutionFailure, 'Error')")]
-                        list_cmd.extend(self.__indent(adtn_cmd, level=cmd.level))
-                    else:
-                        adtn_cmd = self.__indent('{0}'.format(cmd.command), level=cmd.level)
-                        list_cmd.append(adtn_cmd)
-
-            elif cmd.type == 2:
-                methods.raiseerror(messages.Errors.InputTypeError, 'Scheduler is not available yet')
+    def __convert_pycode(self, cmd):
+        """ Method to convert python command into the lines of code
 
+        :param cmd: python command
+        :return: list of code
+        """
+        if cmd.name:
+            adtn_cmd = list()
+            if cmd.nscode:
+                updated_cmd = str(cmd.command)
+                for nsc in cmd.nscode:
+                    ns_key, ns_value = nsc.split('=')
+                    updated_cmd = updated_cmd.replace('{'+ns_key+'}', ns_value)
+                adtn_cmd.append('{0} = {1}'.format(cmd.name, updated_cmd))
             else:
-                methods.raiseerror(messages.Errors.InputTypeError, 'Wrong command type')
-        return list_cmd
+                adtn_cmd.append('{0} = {1}'.format(cmd.name, cmd.command))
+            adtn_cmd.append('stdout_collector.append(({0}, {1}, None))'.format(repr(cmd.command), cmd.name))
+            return self.__indent(adtn_cmd, level=cmd.level)
+        else:
+            if cmd.nscode:
+                updated_cmd = str(cmd.command)
+                for nsc in cmd.nscode:
+                    ns_key, ns_value = nsc.split('=')
+                    updated_cmd = updated_cmd.replace('{'+ns_key+'}', ns_value)
+                adtn_cmd = ['try:', self.__indent(updated_cmd),
+                            'except:',
+                            self.__indent("methods.raiseerror(messages.CommandExecutionFailure, 'Error')")]
+                return self.__indent(adtn_cmd, level=cmd.level)
+            else:
+                return [self.__indent('{0}'.format(cmd.command), level=cmd.level)]
 
     def __retreive_namespaces_from_command(self, command):
         """ Retreive namespaces from the command
@@ -821,26 +875,6 @@ class BaseProcessor(object):
         else:
             return objs
 
-    def __configure_function_header(self, name):
-        """ Method to configure platform of function,
-
-        :param name: namespace for built function
-        :return:
-        """
-        if self.__multi:
-            header = ['def {0}(self, title, idx, subj):'.format(name)]
-        else:
-            if self.__group:
-                header = ['def {0}(self, title):'.format(name)]
-            else:
-                if self.__proc.sessions:
-                    args = 'subj, sess'
-                else:
-                    args = 'subj'
-                header = ['def {0}(self, title, idx, {1}):'.format(name, args)]
-        header += self.__indent(self.__configure_environment() + ['stdout_basket = []'], level=1)
-        return header
-
     def __configure_module(self, module, sub=None, rename=None):
         """ Method to import module during steps
         Only one module can be imported, for importing multiple modules
@@ -897,128 +931,126 @@ class BaseProcessor(object):
         else:
             pass
 
-    def __configure_environment(self):
-        """ Method to configure module and input code
-        :return: list of codes to build function
-        """
-        return self.__import + self.__convert_inputcode()
+    def __convert_plancmds(self):
+        """ Method to convert commands into the commands of execution plan,
+        the consecutive python commands are merged into single code block
 
-    def __configure_output(self):
-        code = []
-        for output in self.__output:
-            code.append('{0} = {1}'.format(output.name, output.code))
-            if output.type in [3, 4]:
-                pass
-            else:
-                if output not in self.__mkdir:
-                    self.__mkdir.append(output)
-        return code
-
-    def __configure_loop_contents(self, level=2):
-        output = self.__configure_output()
-        if self.__mkdir:
-            output.extend(self.__convert_mkdir())
-        return self.__indent(output, level=level)
-
-    def __configure_tempobj(self, level):
-        tmps = [op.name for op in self.__output if op.type == 3]
-        if tmps:
-            output = []
-            for tmp in tmps:
-                output.append(self.set_logging('"SYS::TempFolder[{0}] is generated"'.format(tmp)))
-                if tmp not in self.__opened_temps:
-                    self.__opened_temps.append(tmp)
-            return self.__indent(output, level=level)
-        else:
-            return []
+        :return: list of Command
+        """
+        commands = []
+        block = []
 
-    def __configure_tempobj_closure(self):
-        output = []
-        for tmp in self.__opened_temps:
-                output.append('rmtree({0})'.format(tmp))
-                output.append(self.set_logging('"SYS::TempFolder[{0}] is closed"'.format(tmp)))
-        return output
+        def closing():
+            if block:
+                code = '\n'.join(block)
+                commands.append(Command(name=None, command=code, values=None, type=1, threads=None, memory=None))
+                del block[:]
 
-    def __configure_tail(self, level):
-        output = []
-        output.append(self.__indent('stdout_basket.append(stdout_collector)', level=level))
-        output.append(self.__indent('return stdout_basket', level=1))
-        return output
+        for cmd in self.__cmd:
+            if cmd.type == 0:
+                closing()
+                values = []
+                for nsc in cmd.nscode:
+                    ns_key, ns_value = nsc.split('=', 1)
+                    values.append((ns_key.strip(), ns_value.strip()))
+                commands.append(Command(name=cmd.name, command=cmd.command, values=values, type=0,
+                                        threads=cmd.threads, memory=cmd.memory))
+            elif cmd.type == 1:
+                for line in self.__convert_pycode(cmd):
+                    indent = len(line) - len(line.lstrip())
+                    block.append(line[:indent].replace('\t', ' ' * 4) + line[indent:])
+            elif cmd.type == 2:
+                methods.raiseerror(messages.Errors.InputTypeError, 'Scheduler is not available yet')
+            else:
+                methods.raiseerror(messages.Errors.InputTypeError, 'Wrong command type')
+        closing()
+        return commands
 
-    def build_func(self, name):
-        """ Method to build processor function
+    def build_plan(self, title, inputs=None):
+        """ Method to build execution plan of the step, which is executed instead of the generated function.
+        Each task of the plan carries the resolved inputs, outputs, temporary folders of a file
+        (or subject, session, group), and the commands are shared by all tasks
 
-        :param name:    namespace of processor function
-        :return:
+        :param title:   path of step folder
+        :param inputs:  InputTable, the inputs are resolved from current project if not given
+        :return:        ExecutionPlan
         """
-        level = None
-        func = []
-        func += self.__configure_function_header(name)
-        outputs = self.__output_sorter()
-        pad = 0
+        if inputs is None:
+            inputs = self.__resolve_inputs()
+        variables = [(var.name, var.value) for var in self.__var if var.type == 0]
+        plan = ExecutionPlan(self.__proc, globals(), self.__import, variables, self.__convert_plancmds(),
+                             initializers=self.__initializers)
+        outputs = [(op.name, compile(op.code, '<output>', 'eval')) for op in self.__output if op.type != 3]
+        temps = [op.name for op in self.__output if op.type == 3]
+        mkpathes = [compile(code, '<output>', 'eval') for code in
+                    self.__convert_mkpathes([op for op in self.__output if op.type not in [3, 4]])]
+        checker = None
         if self.__mainset:
-            name = self.__mainset.name
-            if isinstance(self.__mainset.idx, int):
-                name_checker = '{0}[{1}].Filename'.format(name, self.__mainset.idx)
-                level = 1
-            else:
-                name_checker = '{0}[i].Filename'.format(name)
-                level = 2
-                func += self.__indent(
-                    ['for i in progressbar(range(len({0})), desc="Files", leave=False):'.format(name)])
-            if 0 in outputs.keys():     # output name is same as input's
-                file_output = outputs[0].keys()[0]
-                func += self.__configure_loop_contents(level=level)
-                func += self.__indent(
-                    ['output_checker = methods.splitnifti({0})'.format(name_checker),
-                     'flist_checker = [f for f in os.listdir(os.path.dirname({0}))]'.format(file_output),
-                     'stdout_collector = []',
-                     'if any(output_checker in f for f in flist_checker):'], level=level)
-                func += self.__indent(
-                    [self.set_logging('"Step::Skipped because the file[{0}] is exist".format(output_checker)')],
-                    level=level+1)
-                func += self.__indent(['else:'], level=level)
-                pad = 1
-                func += self.__configure_tempobj(level=level+pad)
-                func += self.__indent(self.__convert_cmdcode(), level=level+pad)
-                if self.__opened_temps:
-                    func += self.__indent(self.__configure_tempobj_closure(), level=level+pad)
-            else:
-                if 4 in outputs.keys():
-                    func += self.__configure_loop_contents(level=level)
-                    func += self.__indent(['stdout_collector = []'], level=level)
-                    func += self.__indent(self.__convert_cmdcode(), level=level)
-                else: # if type is 1 or 2
-                    func += self.__configure_loop_contents(level=level)
-                    func += self.__indent(['stdout_collector = []'], level=level)
-                    func += self.__configure_tempobj(level=level)
-                    func += self.__indent(self.__convert_cmdcode(), level=level)
-                    if self.__opened_temps:
-                        func += self.__indent(self.__configure_tempobj_closure(), level=level)
+            file_outputs = [op.name for op in self.__output if op.type == 0]
+            if file_outputs:
+                index = self.__mainset.idx if isinstance(self.__mainset.idx, int) else 'i'
+                checker = (compile('methods.splitnifti({0}[{1}].Filename)'.format(self.__mainset.name, index),
+                                   '<checker>', 'eval'),
+                           compile('os.path.dirname({0})'.format(file_outputs[0]), '<checker>', 'eval'))
+            names = [self.__mainset.name] + [sip.name for sip in self.__sideset]
+            plan.consumed = dict((dset.name, dset.idx if isinstance(dset.idx, int) else 'i')
+                                 for dset in [self.__mainset] + self.__sideset)
+        elif self.__multi:
+            names = [grp.name for grp in self.__multi]
+        elif self.__group:
+            names = [grp.name for grp in self.__group]
         else:
-            if self.__multi:
-                level = 1
-                func += self.__configure_loop_contents(level=level)
-                func += self.__indent(['stdout_collector = []'], level=level)
-                func += self.__indent(self.__convert_cmdcode(), level=level)
+            methods.raiseerror(messages.Errors.InputTypeError, 'Inputs are not sufficiently assigned')
+
+        def planning(idx, subj, sess, key):
+            files = dict((name, inputs.get(name, *key)) for name in names)
+            if self.__mainset:
+                if isinstance(self.__mainset.idx, int):
+                    indices = [None] if len(files[self.__mainset.name]) > self.__mainset.idx else []
+                else:
+                    indices = range(len(files[self.__mainset.name]))
             else:
-                if self.__group:
-                    level = 1
-                    func += self.__configure_loop_contents(level=level)
-                    func += self.__indent(['stdout_collector = []'], level=level)
-                    func += self.__indent(self.__convert_cmdcode(), level=level)
+                indices = [None]
+            tasks = []
+            for i in indices:
+                namespace = plan.scope(dict(files, self=self.__proc, title=title, idx=idx, subj=subj, sess=sess, i=i))
+                values = dict()
+                for name, code in outputs:
+                    values[name] = namespace[name] = eval(code, namespace)
+                mkdirs = [eval(code, namespace) for code in mkpathes]
+                if checker is not None:
+                    task_checker = (eval(checker[0], namespace), eval(checker[1], namespace))
                 else:
-                    methods.raiseerror(messages.Errors.InputTypeError, 'Main or group input was not assigned')
-        func += self.__configure_tail(level+pad)
+                    task_checker = None
+                tasks.append(Task(title=title, idx=idx, subj=subj, sess=sess, i=i, inputs=files, values=values,
+                                  mkdirs=mkdirs, checker=task_checker, temps=temps))
+            return Unit(idx=idx, subj=subj, sess=sess, tasks=tasks)
 
-        return '\n'.join(func)
+        if self.__mainset:
+            for idx, subj in enumerate(self.__proc.subjects):
+                if self.__proc.sessions:
+                    for sess in self.__proc.sessions:
+                        plan.units.append(planning(idx, subj, sess, (subj, sess)))
+                else:
+                    plan.units.append(planning(idx, subj, None, (subj,)))
+        elif self.__multi:
+            for idx, subj in enumerate(self.__proc.subjects):
+                plan.units.append(planning(idx, subj, None, (subj,)))
+        else:
+            plan.units.append(planning(None, None, None, ()))
+        return plan
 
-    def run(self, title, surfix=None, debug=False):
+    def run(self, title, surfix=None, debug=False, resume=None):
         """Generate loop commands for step
+        The outputs of each task are written in its staging folder and moved into place when all commands
+        of the task are exited successfully, so the interrupted task leaves no partial output.
 
         :param title:
         :param surfix:
         :param debug:
+        :param resume:  if True, only the unfinished tasks (not in the step cache) are executed,
+                        the finished tasks are not executed again even if they are changed.
+                        (default: the resume mode of Process, which is set by Pipelines.run)
         :return: None
         """
         if self.__message:
@@ -1047,44 +1079,63 @@ class BaseProcessor(object):
         output_path = self.init_path("{0}-{1}".format(title, surfix), dc=self.__dc)
 
         if debug:
+            self.__prj.reload()
             print("-="*30)
-            print(self.build_func('debug'))
+            print(self.build_plan(output_path).render())
             return output_path
         else:
             self.__prj.reload()
+            plan = self.build_plan(output_path)
+            plan.cache = StepCache(output_path)
+            plan.cache.load()
+            plan.resume = getattr(self.__proc, '_resume', False) if resume is None else resume
+            plan.staging(os.path.join(self.__prj.path, STAGING, hashing(output_path)[:16]))
+            plan.clear_staging()
+            removing_manifest(output_path)
+            if plan.resume:
+                self.__proc.logger.info("Step::[{0}] is resumed".format(title))
             thread = self._parallel
-            pool = ThreadPool(thread)
-            self.__proc.logger.info("Step::[{0}] is executed with {1} thread(s).".format(title, thread))
+            if self._executor == 'process':
+                pool = self.__process_pool(thread, plan)
+                self.__proc.logger.info("Step::[{0}] is executed with {1} process(es).".format(title, thread))
+            elif self._executor == 'async':
+                plan.schedule(ThreadBudget(), self._inflight, *self.__memory_budget())
+                plan.initialize()
+                pool = None
+                self.__proc.logger.info("Step::[{0}] is executed with {1} inflight command(s).".format(
+                    title, self._inflight))
+            else:
+                plan.schedule(ThreadBudget(), thread, *self.__memory_budget())
+                plan.initialize()
+                pool = ThreadPool(thread)
+                self.__proc.logger.info("Step::[{0}] is executed with {1} thread(s).".format(title, thread))
             if self.__multi:
-                for idx, subj in enumerate(progressbar(self.__proc.subjects, desc='Subjects')):
-                    self.__proc.logger.info("Step::The inputs are identified as multi type")
-                    outputs = self.worker([self.__proc, output_path, idx, subj])
-                    output_writer(outputs, output_path)
+                self.__proc.logger.info("Step::The inputs are identified as multi type")
+            elif self.__group:
+                self.__proc.logger.info("Step::The inputs are identified as groups type")
+            elif self.__proc.sessions:
+                self.__proc.logger.info("Step::The inputs are identified as multi-session scans")
             else:
-                if self.__group:
-                    self.__proc.logger.info("Step::The inputs are identified as groups type")
-                    outputs = self.worker([self.__proc, output_path])
+                self.__proc.logger.info("Step::The inputs are identified as single-session scans")
+            # All tasks (files, subjects of multi inputs, or group) are queued at once
+            if self._executor == 'process':
+                iteritem = plan.chains()
+                results = pool.imap_unordered(executing, iteritem)
+            elif self._executor == 'async':
+                iteritem = plan.chains()
+                results = AsyncExecutor(self._inflight).imap_unordered(plan, iteritem)
+            else:
+                iteritem = [(plan, chain) for chain in plan.chains()]
+                results = pool.imap_unordered(self.worker, iteritem)
+            for outputs in progressbar(results, desc='Tasks', total=len(iteritem)):
+                if 4 not in [o.type for o in self.__output]:
                     output_writer(outputs, output_path)
                 else:
-                    if self.__proc.sessions:
-                        self.__proc.logger.info("Step::The inputs are identified as multi-session scans")
-                        for idx, subj in enumerate(progressbar(self.__proc.subjects, desc='Subjects')):
-                            iteritem = [(self.__proc, output_path, idx, subj, sess) for sess in self.__proc.sessions]
-                            for outputs in progressbar(pool.imap_unordered(self.worker, iteritem), desc='Sessions',
-                                                       leave=False, total=len(iteritem)):
-                                if 4 not in [o.type for o in self.__output]:
-                                    output_writer(outputs, output_path)
-                                else:
-                                    pass
-                    else:
-                        self.__proc.logger.info("Step::The inputs are identified as single-session scans")
-                        iteritem = [(self.__proc, output_path, idx, subj) for idx, subj in enumerate(self.__proc.subjects)]
-                        for outputs in progressbar(pool.imap_unordered(self.worker, iteritem), desc='Subjects',
-                                                   total=len(iteritem)):
-                            if 4 not in [o.type for o in self.__output]:
-                                output_writer(outputs, output_path)
-                            else:
-                                pass
+                    pass
+            if pool is not None:
+                pool.close()
+                pool.join()
+            writing_manifest(output_path)
             self.__proc._history[os.path.basename(output_path)] = output_path
             self.__proc.update()
             self.__proc._save_history(self.__proc._path, self.__proc._history)
@@ -1096,18 +1147,49 @@ class BaseProcessor(object):
             clear_output()
             return output_path
 
-    def worker(self, args, name='built_func'):
-        """The worker for parallel computing
+    def worker(self, args):
+        """The worker for parallel computing, the tasks are executed in order by the interpreter of plan
 
-        :param args: list, Arguments for step execution
-        :return: str
+        :param args: tuple, ExecutionPlan and list of Task
+        :return: list of outputs of the tasks (list of (command, stdout, stderr))
         """
-        funccode = self.build_func(name)
-        # self.__proc.logger.debug("Executed_Function::\n{}".format(funccode)) # for debug only
-        output = None
-        exec (funccode)  # load step function on memory
+        plan, tasks = args
+        return plan.execute_chain(tasks)
+
+    def __memory_budget(self, context=None):
+        """ Memory budget and profile of the run
+
+        :param context: multiprocessing context (or module) to share the budget across processes
+        :return: MemoryBudget and MemoryProfile (None if disabled, or psutil is not installed)
+        """
+        if self._memory is None:
+            return None, None
+        budget, interval = self._memory
+        profile = None
+        if psutil is not None:
+            profile = MemoryProfile(os.path.join(self.__proc.path, '.memory'))
+            profile.load()
         try:
-            exec ('output = {0}(*args)'.format(name))  # execute function
-        except Exception as e:
-            self.__proc.logger.debug("ERROR::{}".format(e))
-        return output
+            memory = MemoryBudget(budget, interval=interval, context=context)
+        except EnvironmentError:
+            self.__proc.logger.info("Step::Memory admission control is disabled, psutil is not installed")
+            memory = None
+        return memory, profile
+
+    def __process_pool(self, processes, plan):
+        """ Process pool for the plan, the plan is sent to each worker once by the initializer.
+        The workers are started by forkserver (or spawn) where available, so the threads and
+        open files of the parent (e.g. project watcher) are not inherited.
+        The thread budget of the plan is shared by the workers
+
+        :param processes: number of worker processes
+        :param plan: ExecutionPlan
+        :return: multiprocessing.Pool
+        """
+        if hasattr(multiprocessing, 'get_context'):
+            start_methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+        else:
+            context = multiprocessing
+        plan.schedule(ThreadBudget(context=context), processes, *self.__memory_budget(context))
+        return context.Pool(processes, initializer=initializing, initargs=(plan,))
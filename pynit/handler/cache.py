@@ -0,0 +1,147 @@
+"""
+Result cache of step tasks
+Each task is keyed on the hash of the fingerprints of its input files, its rendered commands (and python code)
+and the executables of the tools. The key of finished task is recorded in the step folder, so the task is skipped
+when the key is not changed and it is executed again when any of them is changed (e.g. parameter of command).
+"""
+import os
+import json
+import hashlib
+
+CACHE = '.stepcache'        # hidden file, which is not listed as project file
+
+
+def file_fingerprint(path):
+    """ Fingerprint of the file (size and modified time)
+
+    :param path: absolute path of file
+    :return: list of [path, size, mtime], size and mtime are None if the file is not existing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_size, stat.st_mtime]
+
+
+def which(tool):
+    """ Absolute path of the executable
+
+    :param tool: str, name or path of the executable
+    :return: str, None if it is not found
+    """
+    if os.path.dirname(tool):
+        return tool if os.access(tool, os.X_OK) else None
+    for dirpath in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(dirpath, tool)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def tool_fingerprint(tool):
+    """ Fingerprint of the executable of the tool (resolved path, size and modified time), it is used instead of
+    the version since the tools (AFNI, ANTs, FSL) do not report their version in the same way.
+    So the tasks are executed again when the executable is re-installed or moved (even with the same version),
+    and they are not executed again when only the libraries or scripts called by the executable are changed.
+
+    :param tool: str, name of the executable
+    :return: list of [tool, path, size, mtime]
+    """
+    path = which(tool)
+    if path is None:
+        return [tool, None, None, None]
+    return [tool] + file_fingerprint(os.path.realpath(path))
+
+
+def hashing(components):
+    """ Hash of the components
+
+    :param components: json serializable object (the other objects are converted into str)
+    :return: str, hex digest
+    """
+    encoded = json.dumps(components, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class StepCache(object):
+    """ Keys of the finished tasks of the step
+    The keys are appended to the cache file as json lines, so the workers (threads or processes)
+    can record them without locking. The cache is compacted into the last key of each task when it is loaded
+    """
+    def __init__(self, step_path):
+        """ Initiate cache
+
+        :param step_path: absolute path of step folder
+        """
+        self.path = os.path.join(step_path, CACHE)
+        self.keys = dict()
+        self.exists = False     # False if the step is executed before the cache (or never executed)
+        self.__files = dict()   # fingerprints of files, the files are checked once in a run
+        self.__tools = dict()   # fingerprints of tools
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_StepCache__files'] = dict()
+        state['_StepCache__tools'] = dict()
+        return state
+
+    def load(self):
+        """ Load and compact the cache
+
+        :return: dict, task to key
+        """
+        keys = dict()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        task_id, key = json.loads(line)
+                    except ValueError:
+                        continue
+                    keys[task_id] = key
+            self.exists = True
+        except (IOError, OSError):
+            self.exists = False
+        self.keys = keys
+        if keys:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps([task_id, key]) + '\n' for task_id, key in sorted(keys.items()))
+            os.rename(tmp_path, self.path)
+        return keys
+
+    def file(self, path):
+        if path not in self.__files:
+            self.__files[path] = file_fingerprint(path)
+        return self.__files[path]
+
+    def tool(self, tool):
+        if tool not in self.__tools:
+            self.__tools[tool] = tool_fingerprint(tool)
+        return self.__tools[tool]
+
+    def hit(self, task_id, key):
+        """ Check if the task is finished with the same key
+        """
+        return key is not None and self.keys.get(task_id) == key
+
+    def finished(self, task_id):
+        """ Check if the task is finished, regardless of its key
+        """
+        return self.keys.get(task_id) is not None
+
+    def record(self, task_id, key):
+        """ Record the key of the finished task
+
+        :param task_id: str, identifier of task (hash of its outputs)
+        :param key: str, key of task, None when the task is started (or failed)
+        """
+        self.keys[task_id] = key
+        if not os.path.isdir(os.path.dirname(self.path)):
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps([task_id, key]) + '\n')
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,54 @@
+"""
+Compact in-memory representation of the scanned DataFrame
+"""
+import os
+import numpy as np
+import pandas as pd
+
+
+def compacting(df):
+    """ Convert the scanned DataFrame into compact form
+    The hierarchical columns are stored as categoricals, and the 'Abspath' is replaced with 'Dirpath',
+    the categorical of the directory (interned prefix shared by all files in the directory)
+
+    :param df: scanned DataFrame (columns follow 'reorder_columns')
+    :return: pandas.DataFrame
+    """
+    if not len(df) or 'Abspath' not in df.columns:
+        return df
+    data = dict()
+    columns = []
+    for column in df.columns:
+        if column == 'Abspath':
+            continue
+        elif column == 'Filename':
+            data[column] = df[column].values
+        else:
+            data[column] = pd.Categorical(df[column].values)
+        columns.append(column)
+    data['Dirpath'] = pd.Categorical([os.path.dirname(path) for path in df['Abspath'].values])
+    return pd.DataFrame(data, columns=columns + ['Dirpath'], index=df.index)
+
+
+def expanding(df):
+    """ Build 'Abspath' of the compact DataFrame from the directory prefix and filename,
+    the categorical columns are converted back to object columns (same dtypes as the scanned DataFrame,
+    so groupby or comparison on the columns are not changed by the compact form)
+
+    :param df: compact DataFrame (or any DataFrame, returned as is if it has no 'Dirpath')
+    :return: pandas.DataFrame with 'Abspath' as the last column
+    """
+    if 'Dirpath' not in df.columns:
+        return df
+    dirpath = df['Dirpath'].values
+    prefixes = np.array([path + os.sep for path in dirpath.categories], dtype=object)
+    if len(df):
+        abspath = prefixes[dirpath.codes] + df['Filename'].values.astype(object)
+    else:
+        abspath = np.array([], dtype=object)
+    output = df.drop('Dirpath', axis=1)
+    for column in output.columns:
+        if isinstance(output[column].dtype, pd.CategoricalDtype):
+            output[column] = output[column].astype(object)
+    output['Abspath'] = abspath
+    return output
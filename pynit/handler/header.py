@@ -0,0 +1,116 @@
+"""
+Image header metadata of project files
+"""
+import os
+import nibabel as nib
+import pandas as pd
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+HEADER_COLUMNS = ['dims', 'n_volumes', 'voxel_size', 'tr', 'datatype', 'nbytes']
+Header = namedtuple('Header', ['Abspath'] + HEADER_COLUMNS)
+
+
+def file_key(path):
+    """ Key of the file to check if the cached header is still valid
+
+    :param path: absolute path of file
+    :return: (inode, modified time, size), None if the file is not existing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime, stat.st_size
+
+
+def reading_header(path):
+    """ Read the metadata from the image header only, the image data is not loaded
+
+    :param path: absolute path of image
+    :return: tuple of (dims, n_volumes, voxel_size, tr, datatype), all None if the file is not readable image
+    """
+    try:
+        header = nib.load(path).header
+        shape = header.get_data_shape()
+        zooms = header.get_zooms()
+        datatype = str(header.get_data_dtype())
+    except Exception:
+        return None, None, None, None, None
+    n_volumes = int(shape[3]) if len(shape) > 3 else 1
+    tr = None
+    if len(zooms) > 3:
+        tr = float(zooms[3])
+        try:
+            unit = header.get_xyzt_units()[1]
+        except (AttributeError, IndexError):
+            unit = None
+        if unit == 'msec':
+            tr /= 1000.0
+        elif unit == 'usec':
+            tr /= 1000000.0
+    dims = 'x'.join(str(int(d)) for d in shape)
+    voxel_size = 'x'.join('{0:g}'.format(float(z)) for z in zooms[:3])
+    return dims, n_volumes, voxel_size, tr, datatype
+
+
+def parsing_header(path, values):
+    """ Convert the stored values into Header, dims and voxel_size are converted into tuple
+
+    :param path: absolute path of file
+    :param values: tuple of stored values in the order of HEADER_COLUMNS
+    :return: Header
+    """
+    dims, n_volumes, voxel_size, tr, datatype, nbytes = values
+    if dims is not None:
+        dims = tuple(int(d) for d in dims.split('x'))
+    if voxel_size is not None:
+        voxel_size = tuple(float(v) for v in voxel_size.split('x'))
+    return Header(path, dims, n_volumes, voxel_size, tr, datatype, nbytes)
+
+
+def collecting_headers(index, paths, workers=1):
+    """ Return the header metadata of the files, only the file which is not cached in the index or changed
+    since then (inode, modified time or size) is read, and the headers are read concurrently if 'workers' > 1
+
+    :param index: ProjectIndex
+    :param paths: list of absolute paths
+    :param workers: number of threads
+    :return: list of Header in the same order of paths (all values are None if the file is not existing)
+    """
+    paths = list(paths)
+    pool = ThreadPool(workers) if workers > 1 and len(paths) > 1 else None
+    try:
+        mapper = pool.map if pool is not None else lambda func, items: [func(item) for item in items]
+        keys = mapper(file_key, paths)
+        cached = index.cached_headers(paths)
+        missing = [i for i, (path, key) in enumerate(zip(paths, keys))
+                   if key is not None and (path not in cached or tuple(cached[path][:3]) != key)]
+        values = mapper(reading_header, [paths[i] for i in missing])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    rows = []
+    for i, value in zip(missing, values):
+        key = keys[i]
+        cached[paths[i]] = key + value + (key[2],)
+        rows.append((paths[i],) + cached[paths[i]])
+    if rows:
+        index.store_headers(rows)
+    headers = []
+    for path, key in zip(paths, keys):
+        if key is None:
+            headers.append(Header(path, *([None] * len(HEADER_COLUMNS))))
+        else:
+            headers.append(parsing_header(path, cached[path][3:]))
+    return headers
+
+
+def header_frame(headers):
+    """ DataFrame of header metadata
+
+    :param headers: list of Header
+    :return: pandas.DataFrame with the columns of HEADER_COLUMNS
+    """
+    return pd.DataFrame([h[1:] for h in headers], columns=HEADER_COLUMNS)
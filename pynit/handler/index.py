@@ -0,0 +1,222 @@
+"""
+Persistent project index
+"""
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from ..tools import methods, messages
+
+SCHEMA_VERSION = 3
+
+_columns = ['Subject', 'Session', 'DataType', 'Pipeline', 'Step', 'Report', 'Filename', 'Abspath']
+_schema = ["CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+           "CREATE TABLE IF NOT EXISTS classes (dataclass INTEGER PRIMARY KEY, "
+           "single_session INTEGER, empty INTEGER)",
+           "CREATE TABLE IF NOT EXISTS files (dataclass INTEGER, Subject TEXT, Session TEXT, DataType TEXT, "
+           "Pipeline TEXT, Step TEXT, Report TEXT, Filename TEXT, Abspath TEXT PRIMARY KEY, Dirpath TEXT)",
+           "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, dataclass INTEGER, "
+           "mtime REAL, n_entries INTEGER)",
+           "CREATE TABLE IF NOT EXISTS headers (Abspath TEXT PRIMARY KEY, inode INTEGER, mtime REAL, size INTEGER, "
+           "dims TEXT, n_volumes INTEGER, voxel_size TEXT, tr REAL, datatype TEXT, nbytes INTEGER)",
+           "CREATE INDEX IF NOT EXISTS idx_files_dataclass ON files (dataclass)",
+           "CREATE INDEX IF NOT EXISTS idx_files_dirpath ON files (Dirpath)",
+           "CREATE INDEX IF NOT EXISTS idx_dirs_dataclass ON dirs (dataclass)"]
+
+
+def _null(value):
+    """ Convert NaN value in DataFrame into None (NULL)
+    """
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+class ProjectIndex(object):
+    """ SQLite backed index of project files
+
+    Each file in the dataclass is stored as a row with the hierarchical columns (Subject, Session, DataType,
+    Pipeline, Step, Report), and the stamp (modified time, number of entries) of each scanned directory
+    is stored to detect the changes afterward.
+    The image header metadata (see handler.header) is stored separately when it is requested first,
+    with the (inode, modified time, size) of the file at the reading time.
+    The index is located at the project root ('.project_index') and it is rebuilt from scratch
+    if the schema version is not matched.
+    """
+    def __init__(self, prj_path, name='.project_index', timeout=30):
+        """ Initiate index
+
+        :param prj_path: project root path
+        :param name: filename of index
+        :param timeout: seconds to wait for the lock of other connection (e.g. worker process)
+        """
+        self.__path = os.path.join(prj_path, name)
+        self.__timeout = timeout
+        self.__local = threading.local()
+        self.__check_schema()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def conn(self):
+        """ Connection for current thread (sqlite connection can't be shared over threads)
+
+        :return: sqlite3.Connection
+        """
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.__path, timeout=self.__timeout)
+            conn.text_factory = str
+            self.__local.conn = conn
+        return conn
+
+    def __check_schema(self):
+        """ Create tables, drop all if the schema version is not matched
+        """
+        try:
+            with self.conn as conn:
+                version = None
+                if conn.execute("SELECT name FROM sqlite_master WHERE name='meta'").fetchone():
+                    version = conn.execute("SELECT value FROM meta WHERE key='schema_version'").fetchone()
+                if version is None or int(version[0]) != SCHEMA_VERSION:
+                    for table in ['meta', 'classes', 'files', 'dirs', 'headers']:
+                        conn.execute("DROP TABLE IF EXISTS {}".format(table))
+                for statement in _schema:
+                    conn.execute(statement)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        except sqlite3.DatabaseError as e:
+            methods.raiseerror(messages.Errors.ProjectScanFailure,
+                               'Failed to initiate project index [{}]'.format(e))
+
+    def store(self, dc_idx, df, single_session, stamps=None):
+        """ Replace all rows of the dataclass with the given DataFrame
+
+        :param dc_idx: index of dataclass
+        :param df: scanned DataFrame (columns follow 'reorder_columns')
+        :param single_session: True if the dataclass is single session
+        :param stamps: dict of {dirpath: (mtime, n_entries)}
+        """
+        with self.conn as conn:
+            conn.execute("DELETE FROM files WHERE dataclass=?", (dc_idx,))
+            self.__insert(conn, dc_idx, df)
+            conn.execute("INSERT OR REPLACE INTO classes VALUES (?, ?, ?)",
+                         (dc_idx, int(bool(single_session)), int(not len(df))))
+            if stamps is not None:
+                conn.execute("DELETE FROM dirs WHERE dataclass=?", (dc_idx,))
+                self.__insert_stamps(conn, dc_idx, stamps)
+
+    def patch(self, dc_idx, df, relisted, removed, stamps):
+        """ Patch the rows of the re-listed or removed directories in place
+
+        :param dc_idx: index of dataclass
+        :param df: DataFrame of files in re-listed directories
+        :param relisted: list of re-listed directories
+        :param removed: list of removed directories
+        :param stamps: dict of {dirpath: (mtime, n_entries)} of re-listed directories
+        :return: boolean, True if any file is added or removed,
+                 None if the index is busy (e.g. locked by other process) and it is not patched
+        """
+        try:
+            return self.__patch(dc_idx, df, relisted, removed, stamps)
+        except sqlite3.OperationalError:
+            return None
+
+    def __patch(self, dc_idx, df, relisted, removed, stamps):
+        with self.conn as conn:
+            dirpaths = list(relisted) + list(removed)
+            before = set()
+            for i in range(0, len(dirpaths), 500):
+                chunk = dirpaths[i:i + 500]
+                rows = conn.execute("SELECT Abspath FROM files WHERE dataclass=? AND Dirpath IN ({})".format(
+                    ', '.join(['?'] * len(chunk))), [dc_idx] + chunk)
+                before.update(row[0] for row in rows)
+            conn.executemany("DELETE FROM files WHERE dataclass=? AND Dirpath=?",
+                             ((dc_idx, path) for path in dirpaths))
+            conn.executemany("DELETE FROM dirs WHERE path=?", ((path,) for path in removed))
+            self.__insert(conn, dc_idx, df)
+            self.__insert_stamps(conn, dc_idx, stamps)
+            n_files = conn.execute("SELECT COUNT(*) FROM files WHERE dataclass=?", (dc_idx,)).fetchone()[0]
+            conn.execute("UPDATE classes SET empty=? WHERE dataclass=?", (int(not n_files), dc_idx))
+        after = set(df.Abspath) if len(df) else set()
+        return before != after
+
+    @staticmethod
+    def __insert(conn, dc_idx, df):
+        """ Insert rows of DataFrame
+        """
+        if not len(df):
+            return
+        columns = [col for col in _columns if col in df.columns]
+        rows = zip(*([df[col].tolist() for col in columns] + [[os.path.dirname(p) for p in df.Abspath]]))
+        conn.executemany("INSERT OR REPLACE INTO files (dataclass, {0}, Dirpath) VALUES (?, {1}?)".format(
+            ', '.join(columns), '?, ' * len(columns)), ([dc_idx] + [_null(v) for v in row] for row in rows))
+
+    @staticmethod
+    def __insert_stamps(conn, dc_idx, stamps):
+        """ Insert stamps of directories
+        """
+        conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                         ((path, dc_idx, mtime, n) for path, (mtime, n) in stamps.items()))
+
+    def status(self, dc_idx):
+        """ Return stored status of dataclass
+
+        :param dc_idx: index of dataclass
+        :return: (single_session, empty) or None if the dataclass is not indexed
+        """
+        row = self.conn.execute("SELECT single_session, empty FROM classes WHERE dataclass=?",
+                                (dc_idx,)).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), bool(row[1])
+
+    def stamps(self, dc_idx):
+        """ Return the stamps of directories at the last scan
+
+        :param dc_idx: index of dataclass
+        :return: dict of {dirpath: (mtime, n_entries)}
+        """
+        rows = self.conn.execute("SELECT path, mtime, n_entries FROM dirs WHERE dataclass=?", (dc_idx,))
+        return dict((path, (mtime, n)) for path, mtime, n in rows)
+
+    def load(self, dc_idx, columns):
+        """ Load all files of dataclass, the filters are applied in memory by the FilterIndex of project
+
+        :param dc_idx: index of dataclass
+        :param columns: list of columns to return (e.g. reorder_columns)
+        :return: pandas.DataFrame
+        """
+        sql = 'SELECT {0} FROM files WHERE dataclass=? ORDER BY Abspath'.format(', '.join(columns))
+        rows = self.conn.execute(sql, (dc_idx,)).fetchall()
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        return df.where(df.notnull(), np.nan)
+
+    def cached_headers(self, paths):
+        """ Stored header metadata of the files
+
+        :param paths: list of absolute paths
+        :return: dict of {abspath: (inode, mtime, size, dims, n_volumes, voxel_size, tr, datatype, nbytes)}
+        """
+        paths = list(paths)
+        output = dict()
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            rows = self.conn.execute("SELECT * FROM headers WHERE Abspath IN ({})".format(
+                ', '.join(['?'] * len(chunk))), chunk)
+            for row in rows:
+                output[row[0]] = tuple(row[1:])
+        return output
+
+    def store_headers(self, rows):
+        """ Store header metadata
+
+        :param rows: list of (abspath, inode, mtime, size, dims, n_volumes, voxel_size, tr, datatype, nbytes)
+        """
+        try:
+            with self.conn as conn:
+                conn.executemany("INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.OperationalError:
+            pass    # the index is busy, the headers are read again next time
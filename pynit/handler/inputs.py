@@ -0,0 +1,61 @@
+"""
+Input resolution table of step execution
+"""
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from .records import Snapshot
+
+Query = namedtuple('Query', ['args', 'kwargs', 'level'])   # level: columns of the task key
+
+
+class InputTable(object):
+    """ Inputs of all tasks of a step run, resolved at once when the run is started
+
+    Each input is queried from the project only once, and the files are partitioned by subject (and session),
+    so the worker takes its pre-resolved files from the table instead of querying the project for each task.
+    The table is not changed even if the project tree is changed during the run.
+    """
+    def __init__(self, prj):
+        """ Initiate table
+
+        :param prj: Project
+        """
+        self.prj = prj
+        self.__tasks = dict()       # input name to {task key: Snapshot}
+        self.__empty = dict()       # input name to empty Snapshot
+
+    def resolve(self, name, query):
+        """ Query all files of the input and partition them into the tasks
+
+        :param name: namespace of input
+        :param query: Query
+        """
+        df = self.prj(*query.args, **query.kwargs).df
+        level = list(query.level)
+        tasks = dict()
+        if not level:
+            tasks[()] = Snapshot(df)
+        elif len(df) and all(column in df.columns for column in level):
+            keys = pd.DataFrame(dict((column, np.asarray(df[column], dtype=object)) for column in level))
+            for key, positions in keys.groupby(level, sort=False).indices.items():
+                key = key if isinstance(key, tuple) else (key,)
+                tasks[key] = Snapshot(df.take(positions))
+        self.__tasks[name] = tasks
+        self.__empty[name] = Snapshot(df.iloc[0:0])
+
+    def get(self, name, *key):
+        """ Files of the input for the task
+
+        :param name: namespace of input
+        :param key: subject (and session) of the task, nothing for group input
+        :return: Snapshot
+        """
+        return self.__tasks[name].get(key, self.__empty[name])
+
+    def __contains__(self, name):
+        return name in self.__tasks
+
+    def __repr__(self):
+        return 'InputTable({0})'.format(', '.join('{0}: {1} task(s)'.format(name, len(tasks))
+                                                  for name, tasks in sorted(self.__tasks.items())))
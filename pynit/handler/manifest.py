@@ -0,0 +1,173 @@
+"""
+Manifest of finished step outputs
+The manifest is written into the step folder when the step is finished, and the scanner takes the files
+of the step from the manifest instead of walking the step tree, as long as the step folder and its sub-folders
+(subject, session) are not changed.
+"""
+import os
+import sys
+import json
+from .scanner import walk_tree, dir_stamp
+from ..tools import methods
+
+MANIFEST = '.manifest.json'     # hidden file, which is not listed as project file
+MANIFEST_VERSION = 2
+
+
+def _native(value):
+    """ The json module returns unicode on python 2, convert it to native str as the scanner does
+    """
+    if sys.version_info[0] == 2 and isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def folder_stamp(path):
+    """ Modified time and number of entries of the folder, same as the stamp of scanner (without racy check)
+
+    :param path: folder path
+    :return: [mtime, n_entries], None if the folder is not existing
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        n_entries = len(os.listdir(path))
+    except OSError:
+        return None
+    return [mtime, n_entries]
+
+
+def writing_manifest(step_path):
+    """ Write the manifest of all files under the step folder
+    The manifest is written to temporary file and renamed, then the stamp of step folder (which is changed
+    by the renaming) is recorded in place, so the stamp in the manifest is same as the finished step folder.
+    The stamp of each sub-folder is taken at the writing time (without racy check), to detect the files
+    added or removed in the sub-folders afterward
+
+    :param step_path: absolute path of step folder
+    :return: dict, manifest (None if the step folder is not existing)
+    """
+    if not os.path.isdir(step_path):
+        return None
+    dirs = []
+    subjects = dict()
+    for dirpath, files, stamp in walk_tree(step_path):
+        rel = os.path.relpath(dirpath, step_path)
+        rel = '' if rel == os.curdir else rel
+        entries = []
+        for filename in sorted(files):
+            if filename.startswith(MANIFEST):
+                continue
+            try:
+                stat = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            entries.append([filename, stat.st_size, stat.st_mtime])
+        dirs.append(dict(path=rel, stamp=folder_stamp(dirpath) or list(stamp), files=entries))
+        parts = methods.path_splitter(rel) if rel else []
+        if len(parts) == 1:
+            subjects.setdefault(parts[0], [])
+        elif len(parts) == 2:
+            subjects.setdefault(parts[0], []).append(parts[1])
+    manifest = dict(version=MANIFEST_VERSION, stamp=None, subjects=subjects, dirs=dirs)
+    path = os.path.join(step_path, MANIFEST)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.rename(tmp_path, path)
+    stamp = folder_stamp(step_path)
+    manifest['stamp'] = stamp
+    if dirs:
+        dirs[0]['stamp'] = stamp
+    with open(path, 'w') as f:      # rewriting the existing file does not change the folder
+        json.dump(manifest, f)
+    return manifest
+
+
+def removing_manifest(step_path):
+    """ Remove the manifest of the step folder before the step is (re-)executed, so the files of the step
+    are walked by the scanner until the manifest is written again, even if the execution is interrupted
+
+    :param step_path: absolute path of step folder
+    :return: None
+    """
+    for path in [os.path.join(step_path, MANIFEST), os.path.join(step_path, MANIFEST + '.tmp')]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def reading_manifest(step_path):
+    """ Read the manifest of the step folder
+
+    :param step_path: absolute path of step folder
+    :return: dict, manifest (None if it is not existing or not readable)
+    """
+    try:
+        with open(os.path.join(step_path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def trusted_manifest(step_path):
+    """ Return the manifest only if the step folder is not changed since the manifest is written.
+    The modified time of each sub-folder is also compared with its stamp in the manifest (single stat call),
+    because adding or removing a file in the sub-folder does not change the step folder
+
+    :param step_path: absolute path of step folder
+    :return: dict, manifest or None
+    """
+    stamp = folder_stamp(step_path)
+    if stamp is None:
+        return None
+    manifest = reading_manifest(step_path)
+    if manifest is None or manifest.get('stamp') != stamp:
+        return None
+    for item in manifest['dirs']:
+        if not item['path']:
+            continue
+        try:
+            mtime = os.stat(os.path.join(step_path, _native(item['path']))).st_mtime
+        except OSError:
+            return None
+        if mtime != item['stamp'][0]:
+            return None
+    return manifest
+
+
+def manifest_entries(step_path, manifest):
+    """ Convert the manifest into the entries of 'walk_tree'
+
+    :param step_path: absolute path of step folder
+    :param manifest: dict, manifest
+    :return: list of (dirpath, filenames, stamp)
+    """
+    entries = []
+    for item in manifest['dirs']:
+        rel = _native(item['path'])
+        dirpath = os.path.join(step_path, rel) if rel else step_path
+        files = [_native(f[0]) for f in item['files']]
+        entries.append((dirpath, files, dir_stamp(*item['stamp'])))
+    return entries
+
+
+def manifest_pruning(dc_path, depth=2):
+    """ Pruning function for the scanner, which takes the entries of the step folder from its manifest
+
+    :param dc_path: absolute path of dataclass folder
+    :param depth: depth of step folder from the dataclass folder (Pipeline/Step)
+    :return: function takes the directory path, returns list of entries or None
+    """
+    def pruning(path):
+        rel = os.path.relpath(path, dc_path)
+        if rel == os.curdir or len(methods.path_splitter(rel)) != depth:
+            return None
+        manifest = trusted_manifest(path)
+        if manifest is None:
+            return None
+        return manifest_entries(path, manifest)
+    return pruning
@@ -0,0 +1,605 @@
+"""
+Execution plan of step
+The Step configuration is compiled into the tasks of each file (or subject, session, group), and each task
+carries its resolved inputs, outputs, temporary folders and commands, which are executed by the interpreter
+instead of the generated function.
+"""
+import os
+import json
+import importlib
+from collections import namedtuple
+from tempfile import mkdtemp
+from shutil import rmtree, move
+from .scheduler import infer_threads, thread_environ, reserving, measured_shell
+from .cache import hashing
+from ..tools import methods
+
+# type 0: shell command, 'values' is list of (namespace, expression) to format the command
+#         'threads' is the number of threads of the command (None to infer from the tool)
+#         'memory' is the peak memory of the command in bytes (None to take from the memory profile)
+# type 1: python code block, 'command' is the source of consecutive python commands
+Command = namedtuple('Command', ['name', 'command', 'values', 'type', 'threads', 'memory'])
+# shell command to launch, 'key' is the command pattern for the memory profile
+Launch = namedtuple('Launch', ['command', 'threads', 'memory', 'key'])
+Task = namedtuple('Task', ['title', 'idx', 'subj', 'sess', 'i', 'inputs', 'values', 'mkdirs', 'checker', 'temps'])
+Unit = namedtuple('Unit', ['idx', 'subj', 'sess', 'tasks'])
+Initializer = namedtuple('Initializer', ['name', 'func', 'args', 'kwargs'])
+COMMITTED = '.committed'    # marker of staging folder, the task is committed and its outputs are being moved
+
+
+class ProcessContext(object):
+    """ Stand-in of Process in the worker process, which has the attributes used in the step commands
+    The project is opened (from its index) and the logger is attached lazily in the worker
+    """
+    def __init__(self, proc):
+        """ Initiate context
+
+        :param proc: Process
+        """
+        self.prj_path = proc.prj.path
+        self.processing = proc.processing
+        self.path = proc.path
+        self.ext = proc.ext
+        self._rpath = proc._rpath
+        self.subjects = proc.subjects
+        self.sessions = proc.sessions
+        self.__prj = None
+        self.__logger = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_ProcessContext__prj'] = None
+        state['_ProcessContext__logger'] = None
+        return state
+
+    @property
+    def prj(self):
+        if self.__prj is None:
+            from .project import Project
+            self.__prj = Project(self.prj_path)
+        return self.__prj
+
+    @property
+    def logger(self):
+        if self.__logger is None:
+            self.__logger = methods.get_logger(os.path.dirname(self.path), self.processing)
+        return self.__logger
+
+
+class ExecutionPlan(object):
+    """ Tasks of the step run, grouped into units (subject, session or group)
+
+    The expressions and code blocks of the step configuration are compiled once (in each process) and evaluated
+    in the namespace of each task by the interpreter. The plan can be pickled to execute the tasks in other process,
+    the Process is replaced with ProcessContext and the global namespace is imported again in the process.
+    """
+    def __init__(self, proc, env, imports, variables, commands, initializers=None):
+        """ Initiate plan
+
+        :param proc: Process
+        :param env: dict, global namespace of the expressions (module namespace)
+        :param imports: list of import statements of the step (set_module)
+        :param variables: list of (name, expression) of the variables defined before the loop (set_var)
+        :param commands: list of Command
+        :param initializers: list of Initializer, the resources loaded once in each worker
+        """
+        self.proc = proc
+        self.imports = imports
+        self.variables = variables
+        self.commands = commands
+        self.initializers = initializers or []
+        self.units = []
+        self.resources = None       # values of initializers, loaded by 'initialize'
+        self.budget = None          # ThreadBudget of the run, commands are not limited if None
+        self.threads = 1            # threads of the command which is not declared or inferred
+        self.memory = None          # MemoryBudget of the run, commands are not limited if None
+        self.profile = None         # MemoryProfile, the peak memory of commands is not measured if None
+        self.cache = None           # StepCache, the tasks are skipped only by the existing output if None
+        self.resume = False         # skip the finished tasks in the step cache, even if their keys are changed
+        self.stage_root = None      # staging folder of the run, the outputs are written in place if None
+        self.staged = set()         # output paths written in staging folder
+        self.consumed = dict()      # input name to position of the file consumed by each task ('i' for the file
+                                    # of the task), all files of the input are consumed if the name is not listed
+        self.__module = env.get('__name__')
+        self.__compiled = dict()
+        self.__env = None
+        self.__setup(env)
+
+    def __setup(self, env):
+        self.__env = dict(env)
+        for statement in self.imports:
+            exec(statement, self.__env)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if not isinstance(self.proc, ProcessContext):
+            state['proc'] = ProcessContext(self.proc)
+        state['resources'] = None
+        state['_ExecutionPlan__compiled'] = dict()
+        state['_ExecutionPlan__env'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__setup(vars(importlib.import_module(self.__module)))
+
+    def __len__(self):
+        return sum(len(unit.tasks) for unit in self.units)
+
+    def __iter__(self):
+        for unit in self.units:
+            for task in unit.tasks:
+                yield task
+
+    def __repr__(self):
+        return 'ExecutionPlan({0} unit(s), {1} task(s), {2} command(s))'.format(len(self.units), len(self),
+                                                                           len(self.commands))
+
+    def render(self):
+        """ Readable description of the plan for debugging, the imports, variables and commands shared by all
+        tasks and the position and outputs of each task
+
+        :return: str
+        """
+        lines = [repr(self)]
+        lines += ['import:  {0}'.format(statement) for statement in self.imports]
+        lines += ['var:     {0} = {1}'.format(name, source) for name, source in self.variables]
+        for cmd in self.commands:
+            if cmd.type == 0:
+                lines.append('shell:   {0}'.format(cmd.command))
+                lines += ['           {0} = {1}'.format(ns, source) for ns, source in cmd.values]
+            else:
+                lines.append('python:')
+                lines += ['           {0}'.format(line) for line in cmd.command.split('\n')]
+        for task in self:
+            lines.append('task:    subj={0}, sess={1}, i={2}'.format(task.subj, task.sess, task.i))
+            lines += ['           {0} = {1}'.format(name, value) for name, value in sorted(task.values.items())]
+        return '\n'.join(lines)
+
+    def compiled(self, source, mode='eval'):
+        """ Compiled code of the source, each source is compiled only once
+
+        :param source: str, expression or statements
+        :param mode: 'eval' or 'exec'
+        :return: code object
+        """
+        code = self.__compiled.get((source, mode))
+        if code is None:
+            code = compile(source, '<step>', mode)
+            self.__compiled[(source, mode)] = code
+        return code
+
+    def schedule(self, budget, workers, memory=None, profile=None):
+        """ Set the budgets of the run, the commands of unknown thread are given
+        the share of the thread budget for each worker
+
+        :param budget: ThreadBudget
+        :param workers: number of parallel workers
+        :param memory: MemoryBudget
+        :param profile: MemoryProfile, to estimate the peak memory of commands and to record the measured peaks
+        """
+        self.budget = budget
+        self.threads = max(budget.capacity // max(workers, 1), 1)
+        self.memory = memory
+        self.profile = profile
+
+    def staging(self, root):
+        """ Write the outputs of each task into its staging folder, and move them into place when all commands
+        of the task are exited successfully. The output shared by several tasks (e.g. folder of subject) is staged
+        as an empty folder for each task, so the task sees only its own files in it, and the files are merged
+        into the shared output when the task is committed
+
+        :param root: staging folder of the run, it needs to be in the same filesystem with the outputs
+        """
+        self.staged = set(path for task in self for path in task.values.values() if isinstance(path, str))
+        self.stage_root = root
+
+    def clear_staging(self):
+        """ Clean the staging folder of the interrupted run. The task interrupted while its outputs are moved
+        into place is rolled forward (the rest of outputs are moved and its key is recorded in the step cache),
+        and the partial outputs of the other tasks are removed
+        """
+        if self.stage_root is None or not os.path.isdir(self.stage_root):
+            return
+        for name in sorted(os.listdir(self.stage_root)):
+            stage_dir = os.path.join(self.stage_root, name)
+            key = self.committed(stage_dir)
+            if key is not None:
+                self.moving(stage_dir)
+                if self.cache is not None and key:
+                    self.cache.record(*key)
+        rmtree(self.stage_root)
+
+    def stage(self, task, namespace):
+        """ Replace the outputs of the task in the namespace with the paths in its staging folder,
+        the absolute path of the output is mirrored in the staging folder
+
+        :param task: Task
+        :param namespace: dict, namespace of the task
+        """
+        outputs = [(name, path) for name, path in task.values.items() if path in self.staged]
+        if not outputs:
+            return
+        methods.mkdir(os.path.dirname(self.stage_root), self.stage_root)
+        stage_dir = mkdtemp(dir=self.stage_root)
+        for name, path in outputs:
+            staged_path = os.path.join(stage_dir, os.path.splitdrive(path)[1].lstrip(os.sep))
+            staged_dir = staged_path if path in task.mkdirs else os.path.dirname(staged_path)
+            if not os.path.isdir(staged_dir):
+                os.makedirs(staged_dir)
+            namespace[name] = staged_path
+        namespace['_staging'] = stage_dir
+
+    @staticmethod
+    def committed(stage_dir):
+        """ Read the commit marker of the staging folder
+
+        :param stage_dir: staging folder of the task
+        :return: list of [task_id, key] of step cache ([] if the task is not cached), None if it is not committed
+        """
+        try:
+            with open(os.path.join(stage_dir, COMMITTED)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    @classmethod
+    def commit(cls, stage_dir, key=None):
+        """ Commit the outputs of the task, the commit marker is renamed into the staging folder (single atomic
+        rename) before any output is moved, so the outputs of the task interrupted in the middle of moving
+        are moved by 'clear_staging' of the next run, instead of being left half committed
+
+        :param stage_dir: staging folder of the task
+        :param key: (task_id, key) of step cache, which is recorded when the task is rolled forward
+        """
+        marker = os.path.join(stage_dir, COMMITTED)
+        with open(marker + '.tmp', 'w') as f:
+            json.dump(list(key) if key else [], f)
+        os.rename(marker + '.tmp', marker)
+        cls.moving(stage_dir)
+
+    @staticmethod
+    def moving(stage_dir):
+        """ Move the files in the staging folder into place, each file is renamed (replaced) atomically
+
+        :param stage_dir: staging folder of the task
+        """
+        for dirpath, _, filenames in os.walk(stage_dir):
+            if dirpath == stage_dir:
+                continue
+            target_dir = os.sep + os.path.relpath(dirpath, stage_dir)
+            try:
+                os.makedirs(target_dir)
+            except OSError:
+                if not os.path.isdir(target_dir):
+                    raise
+            for filename in filenames:
+                target = os.path.join(target_dir, filename)
+                try:
+                    os.rename(os.path.join(dirpath, filename), target)
+                except OSError:     # other filesystem
+                    move(os.path.join(dirpath, filename), target)
+        rmtree(stage_dir)
+
+    def initialize(self):
+        """ Load the resources of initializers, it is called once in each worker process
+        (or once in the main process for thread workers)
+        """
+        if self.resources is None:
+            self.resources = dict((init.name, init.func(*init.args, **init.kwargs)) for init in self.initializers)
+
+    def chains(self):
+        """ Flatten the tasks of all units into the chains which can be executed concurrently
+        The tasks writing the same output (e.g. folder or file of subject level) are kept in the same chain,
+        which is executed in the order of plan, and every other task is a chain of its own
+
+        :return: list of list of Task
+        """
+        chains = []
+        owners = dict()     # output path to index of chain
+        for task in self:
+            paths = [path for path in task.values.values() if isinstance(path, str)]
+            indices = sorted(set(owners[path] for path in paths if path in owners))
+            if not indices:
+                chains.append([task])
+                index = len(chains) - 1
+            else:
+                index = indices[0]
+                for other in indices[1:]:   # the task joins the chains, which are merged in the order of plan
+                    chains[index].extend(chains[other])
+                    chains[other] = None
+                    for path, owner in owners.items():
+                        if owner == other:
+                            owners[path] = index
+                chains[index].append(task)
+            for path in paths:
+                owners[path] = index
+        return [chain for chain in chains if chain is not None]
+
+    def scope(self, local):
+        """ Namespace of the expressions, the local variables are added to the global namespace of plan
+
+        :param local: dict, local variables
+        :return: dict
+        """
+        namespace = dict(self.__env)
+        if self.resources:
+            namespace.update(self.resources)
+        namespace.update(local)
+        return namespace
+
+    def namespace(self, task):
+        """ Namespace of the task (inputs, variables and outputs), 'threads_per_task' is the share of
+        the thread budget for each worker of the run (schedule)
+
+        :param task: Task
+        :return: dict
+        """
+        namespace = self.scope(dict(self=self.proc, title=task.title, idx=task.idx, subj=task.subj, sess=task.sess,
+                                    i=task.i, threads_per_task=self.threads))
+        namespace.update(task.inputs)
+        for name, source in self.variables:
+            namespace[name] = eval(self.compiled(source), namespace)
+        namespace.update(task.values)
+        return namespace
+
+    def identify(self, task):
+        """ Identifier of the task in the step cache, the hash of its position and outputs
+        (relative to the step folder)
+
+        :param task: Task
+        :return: str
+        """
+        outputs = sorted((name, os.path.relpath(value, task.title) if isinstance(value, str) else value)
+                         for name, value in task.values.items())
+        return hashing([task.subj, task.sess, task.i, outputs])
+
+    def fingerprint(self, task, namespace):
+        """ Key of the task in the step cache, the hash of the fingerprints of input files consumed by the task,
+        the rendered commands (or the pattern of command which depends on the previous commands),
+        the python code, the versions of tools and the outputs
+
+        :param task: Task
+        :param namespace: dict, namespace of the task
+        :return: str
+        """
+        inputs = dict()
+        for name, files in task.inputs.items():
+            paths = files.df['Abspath'].values if 'Abspath' in files.columns else []
+            if name in self.consumed:
+                position = task.i if self.consumed[name] == 'i' else self.consumed[name]
+                try:
+                    paths = [paths[position]]
+                except (IndexError, TypeError):
+                    paths = []
+            inputs[name] = [self.cache.file(path) for path in paths]
+        commands = []
+        tools = []
+        for cmd in self.commands:
+            if cmd.type == 0:
+                try:
+                    values = dict((ns, eval(self.compiled(source), dict(namespace))) for ns, source in cmd.values)
+                    command = cmd.command.format(**values)
+                except Exception:
+                    command = cmd.command
+                commands.append(command)
+                if command.split():
+                    tools.append(self.cache.tool(command.split()[0]))
+            else:
+                commands.append(cmd.command)
+        return hashing([inputs, commands, tools, sorted(task.values.items())])
+
+    @staticmethod
+    def outputs_exist(task):
+        """ Check if the outputs of the task are exist, the output is prefix of files if it has no extension
+
+        :param task: Task
+        :return: bool
+        """
+        if task.checker is not None:
+            output_checker, dirpath = task.checker
+            return any(output_checker in f for f in os.listdir(dirpath))
+        for value in task.values.values():
+            if isinstance(value, str) and not os.path.exists(value):
+                dirpath, prefix = os.path.split(value)
+                if not (os.path.isdir(dirpath) and any(f.startswith(prefix) for f in os.listdir(dirpath))):
+                    return False
+        return True
+
+    def prepare(self, task):
+        """ Prepare the namespace of the task, the output folders and the temporary folders are made
+        The task is skipped if it is finished with the same key of step cache and its outputs are exist.
+        (in resume mode, any finished task in the step cache is skipped)
+        If the step is executed before the cache, the task is skipped if the output is exist
+
+        :param task: Task
+        :return: dict, namespace of the task, None if the task is skipped
+        """
+        logger = self.proc.logger
+        namespace = self.namespace(task)
+        if task.mkdirs:
+            methods.mkdir(*task.mkdirs)
+        if self.cache is not None:
+            task_id, key = self.identify(task), self.fingerprint(task, namespace)
+            if self.cache.exists:
+                finished = self.cache.hit(task_id, key) or self.resume and self.cache.finished(task_id)
+                if finished and self.outputs_exist(task):
+                    logger.info("Step::Skipped because the task[{0}] is finished".format(task_id))
+                    return None
+            elif task.checker is not None and self.outputs_exist(task):
+                logger.info("Step::Skipped because the file[{0}] is exist".format(task.checker[0]))
+                self.cache.record(task_id, key)     # the existing output is taken as the result of task
+                return None
+            self.cache.record(task_id, None)    # started, the task is unfinished until its key is recorded
+            namespace['_cache_key'] = (task_id, key)
+        elif task.checker is not None:
+            output_checker, dirpath = task.checker
+            if any(output_checker in f for f in os.listdir(dirpath)):
+                logger.info("Step::Skipped because the file[{0}] is exist".format(output_checker))
+                return None
+        if self.stage_root is not None:
+            self.stage(task, namespace)
+        namespace['stdout_collector'] = []
+        for temp in task.temps:
+            namespace[temp] = mkdtemp()
+            logger.info("SYS::TempFolder[{0}] is generated".format(temp))
+        return namespace
+
+    def interpret(self, namespace):
+        """ Interpreter of the commands, the python code blocks are executed in the namespace and the shell commands
+        are yielded to the caller as Launch, which sends back its (stdout, stderr, exit status). So the same
+        interpreter is driven by the blocking shell (execute) or by the other engine (e.g. asyncio).
+        The task is marked as failed if any command is not exited successfully
+
+        :param namespace: dict, namespace of the task (prepare)
+        :return: generator of Launch
+        """
+        for cmd in self.commands:
+            if cmd.type == 0:
+                values = dict((ns, eval(self.compiled(source), namespace)) for ns, source in cmd.values)
+                command = cmd.command.format(**values)
+                out, err, code = yield self.launch(cmd, command)
+                if code != 0:
+                    namespace['_failed'] = True
+                if cmd.name:
+                    namespace[cmd.name] = out
+                namespace['stdout_collector'].append((command, out, err))
+            else:
+                exec(self.compiled(cmd.command, 'exec'), namespace)
+
+    def close(self, task, namespace):
+        """ Remove the temporary folders of the task, the staged outputs are moved into place and the key of
+        the task is recorded in the step cache only if all commands are exited successfully
+
+        :param task: Task
+        :param namespace: dict, namespace of the task (prepare)
+        :return: list of (command, stdout, stderr)
+        """
+        for temp in task.temps:
+            rmtree(namespace[temp])
+            self.proc.logger.info("SYS::TempFolder[{0}] is closed".format(temp))
+        if namespace.get('_failed'):
+            if '_staging' in namespace:
+                rmtree(namespace['_staging'])
+            self.proc.logger.info("Step::The outputs of the task[{0}] are discarded, because the command "
+                                  "is failed".format(task.values))
+            return namespace['stdout_collector']
+        if '_staging' in namespace:
+            self.commit(namespace['_staging'], namespace.get('_cache_key'))
+        if '_cache_key' in namespace:
+            self.cache.record(*namespace['_cache_key'])
+        return namespace['stdout_collector']
+
+    def discard(self, task, namespace):
+        """ Remove the staging folder and the temporary folders of the task which are left behind,
+        when the task is not closed (e.g. python code block is raised).
+        The committed staging folder is kept to be rolled forward by 'clear_staging'
+
+        :param task: Task
+        :param namespace: dict, namespace of the task (prepare)
+        """
+        stage_dir = namespace.get('_staging')
+        if stage_dir is not None and self.committed(stage_dir) is not None:
+            stage_dir = None
+        for path in [stage_dir] + [namespace.get(temp) for temp in task.temps]:
+            if isinstance(path, str) and os.path.isdir(path):
+                rmtree(path, ignore_errors=True)
+
+    def execute(self, task):
+        """ Execute the task, the shell commands are executed one by one
+
+        :param task: Task
+        :return: list of (command, stdout, stderr), None if the task is skipped because the output is exist
+        """
+        namespace = self.prepare(task)
+        if namespace is None:
+            return None
+        try:
+            interpreter = self.interpret(namespace)
+            try:
+                launch = next(interpreter)
+                while True:
+                    launch = interpreter.send(self.shell(launch))
+            except StopIteration:
+                pass
+            return self.close(task, namespace)
+        finally:
+            self.discard(task, namespace)
+
+    def launch(self, cmd, command):
+        """ Demand of the shell command
+
+        :param cmd: Command
+        :param command: str, rendered shell command
+        :return: Launch
+        """
+        threads = cmd.threads if cmd.threads is not None else infer_threads(command, default=self.threads)
+        memory = cmd.memory
+        if memory is None:
+            memory = (self.profile.get(cmd.command) if self.profile is not None else None) or 0
+        return Launch(command=command, threads=threads, memory=memory, key=cmd.command)
+
+    def shell(self, launch):
+        """ Execute the shell command when its threads and peak memory fit in the budgets,
+        the peak memory is measured and recorded in the profile
+
+        :param launch: Launch
+        :return: stdout, stderr, exit status
+        """
+        with reserving(self.budget, launch.threads) as threads:
+            with reserving(self.memory, launch.memory):
+                env = thread_environ(threads)
+                if self.profile is None:
+                    return methods.execute(launch.command, env=env)
+                out, err, code, peak = measured_shell(launch.command, env=env)
+                self.profile.record(launch.key, peak)
+                return out, err, code
+
+    def execute_chain(self, tasks):
+        """ Execute the tasks in order, the error is logged and the rest of tasks are not executed
+
+        :param tasks: list of Task
+        :return: list of outputs of the executed tasks
+        """
+        output = []
+        for task in tasks:
+            try:
+                collector = self.execute(task)
+            except Exception as e:
+                self.failed(task, e)
+                break
+            if collector is not None:
+                output.append(collector)
+        return output
+
+    def failed(self, task, error):
+        """ Log the error of the task, its outputs are discarded and the rest of its chain is not executed
+
+        :param task: Task
+        :param error: Exception
+        """
+        self.proc.logger.error("Step::The task[{0}] is failed, the outputs are discarded [{1}: {2}]".format(
+            task.values, type(error).__name__, error))
+
+
+# Plan of the worker process, which is set by the initializer of process pool
+_worker_plan = None
+
+
+def initializing(plan):
+    """ Initializer of process pool, the plan is unpickled and its resources are loaded once in each worker
+
+    :param plan: ExecutionPlan
+    """
+    global _worker_plan
+    plan.initialize()
+    _worker_plan = plan
+
+
+def executing(tasks):
+    """ Worker function of process pool
+
+    :param tasks: list of Task
+    :return: list of outputs of the executed tasks
+    """
+    return _worker_plan.execute_chain(tasks)
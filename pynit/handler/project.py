@@ -1,10 +1,17 @@
 import os
 import itertools
-import pickle
+import threading
 import pandas as pd
-import copy as ccopy
 from ..tools import messages
 from ..tools import methods
+from .scanner import scan_tree, update_tree, relisting_tree
+from .manifest import manifest_pruning
+from .index import ProjectIndex
+from .selector import FilterIndex, QueryCache
+from .records import Snapshot
+from .header import collecting_headers, header_frame
+from .compact import compacting, expanding
+from .watcher import TreeWatcher
 
 
 def mk_main_folder(prj):
@@ -34,40 +41,35 @@ def check_arguments(args, residuals, reference):
     return list(set(retrieved)), list(set(residuals))
 
 
-def parsing_datatree(path, ds_type, idx):
+def parsing_datatree(path, ds_type, idx, stamps=None, workers=1, trust_manifest=False):
     """
-    This methods parsing the data tree from the given path
+    This methods parsing the data tree from the given path,
+    all files are collected as columnar records and the DataFrame is built at once.
+    If the 'stamps' dictionary is given, the stamps of scanned directories are updated into it.
+    The directories are listed concurrently if the number of 'workers' is larger than 1,
+    and the files of finished steps are taken from their manifest if 'trust_manifest' is True
     """
     empty_prj = False
     single_session = False
-    df = pd.DataFrame()
-    for f in os.walk(os.path.join(path, ds_type[idx])):
-        if f[2]:
-            import re
-            flist = [fname for fname in f[2] if not re.match(r'^[.].+', fname)]
-            # print(flist)
-            for filename in flist:
-                row = pd.Series(methods.path_splitter(os.path.relpath(f[0], path)))
-                # if row[0] == ds_type[2]:
-                #     pass
-                # else:
-                row['Filename'] = filename
-                row['Abspath'] = os.path.join(f[0], filename)
-                # df = df.append(pd.DataFrame([row]), ignore_index=True)
-                df = df.append(pd.DataFrame([row]), ignore_index=True, sort=True)
+    dc_path = os.path.join(path, ds_type[idx])
+    pruning = manifest_pruning(dc_path) if trust_manifest and idx != 0 else None
+    records = scan_tree(path, dc_path, workers=workers, pruning=pruning)
+    if stamps is not None:
+        stamps.update(records.stamps)
+    df = records.to_dataframe()
     if 1 not in df.columns:
         empty_prj = True
     elif not len(df):
         empty_prj = True
     else:
         if idx == 0:
-            if len(df.columns) is 5:
+            if len(df.columns) == 5:
                 single_session = True
         elif idx == 1:
-            if len(df.columns) is 6:
+            if len(df.columns) == 6:
                 single_session = True
         elif idx == 2:
-            if len(df.columns) is 6:
+            if len(df.columns) == 6:
                 single_session = True
         columns = update_columns(idx, single_session)
         df = df.rename(columns=columns)
@@ -77,6 +79,15 @@ def parsing_datatree(path, ds_type, idx):
         return df.sort_values('Abspath'), single_session, empty_prj
 
 
+def scanned_paths(df):
+    """
+    Set of absolute paths in the scanned DataFrame (compact form is also accepted)
+    """
+    if not len(df):
+        return set()
+    return set(expanding(df)['Abspath'])
+
+
 def initial_filter(df, data_class, exts):
     """
     Filtering out only selected file type in the project folder
@@ -138,6 +149,445 @@ def reorder_columns(idx, single_session):
         return None
 
 
+def converting_ext(value):
+    """
+    Convert the input value of file extension into list (None if empty)
+    """
+    if type(value) == str:
+        return [value]
+    elif type(value) == list:
+        return value
+    elif not value:
+        return None
+    else:
+        methods.raiseerror(messages.Errors.InputTypeError,
+                           'Please use correct type for input.')
+
+
+def converting_tags(key, value):
+    """
+    Convert the input value of 'file_tag' or 'ignore' into list
+    """
+    if type(value) == str:
+        return [value]
+    elif type(value) == list:
+        return value
+    else:
+        if key == 'file_tag':
+            methods.raiseerror(messages.Errors.InputTypeError,
+                               'Please use correct input type for FileTag')
+        else:
+            methods.raiseerror(messages.Errors.InputTypeError,
+                               'Please use correct input type for FileTag to ignore')
+
+
+def parsing_filters(ref, dc_idx, args, filters):
+    """
+    This method classifies the hierarchical arguments into the 'filters' list
+    [subjects, sessions, dtypes(or pipelines), steps(or results), file_tags, ignores]
+    based on the values of the reference (Project or ProjectView), the 'filters' is updated in place.
+    It returns None if all arguments are classified.
+    """
+    pipe_filter = None
+    residuals = list(set(args))
+    if ref.subjects: # If subjects are assigned already
+        subj_filter, residuals = check_arguments(args, residuals, ref.subjects)
+        if filters[0]: # Subject filter
+            filters[0].extend(subj_filter)
+        else:
+            filters[0] = subj_filter[:]
+        if not ref.single_session: # If multi-session project
+            sess_filter, residuals = check_arguments(args, residuals, ref.sessions)
+            if filters[1]: # Session filter
+                filters[1].extend(sess_filter)
+            else:
+                filters[1] = sess_filter[:]
+        else:
+            filters[1] = None
+    else: # If no subjects are detected in this project, pass... (residual is not in subject and session)
+        filters[0] = None
+        filters[1] = None
+
+    if dc_idx == 0: # if dataclass is 0
+        if ref.dtypes: # check if residual arguments is parts of datatype (anat, func, or dti...)
+            dtyp_filter, residuals = check_arguments(args, residuals, ref.dtypes)
+            if filters[2]: # Datatype filter
+                filters[2].extend(dtyp_filter)
+            else:
+                filters[2] = dtyp_filter[:]
+        else:
+            filters[2] = None
+        filters[3] = None
+
+    elif dc_idx == 1:
+        if ref.pipelines:
+            pipe_filter, residuals = check_arguments(args, residuals, ref.pipelines)
+            if filters[2]:
+                filters[2].extend(pipe_filter)
+            else:
+                filters[2] = pipe_filter[:]
+        else:
+            filters[2] = None
+        if ref.steps:
+            step_filter, residuals = check_arguments(args, residuals, ref.steps)
+            if filters[3]:
+                filters[3].extend(step_filter)
+            else:
+                filters[3] = step_filter
+        else:
+            filters[3] = None
+    else:
+        if ref.pipelines:
+            pipe_filter, residuals = check_arguments(args, residuals, ref.pipelines)
+            if filters[2]:
+                filters[2].extend(pipe_filter)
+            else:
+                filters[2] = pipe_filter[:]
+        else:
+            filters[2] = None
+        if ref.results:
+            rslt_filter, residuals = check_arguments(args, residuals, ref.results)
+            if filters[3]:
+                filters[3].extend(rslt_filter)
+            else:
+                filters[3] = rslt_filter[:]
+        else:
+            filters[3] = None
+
+    if len(residuals):
+        if ref.dataclass == ref.ds_type[1]:
+            if len(pipe_filter) == 1:
+                dc_path = os.path.join(ref.path, ref.dataclass, pipe_filter[0])
+                processed = os.listdir(dc_path)
+                if len([step for step in processed if step in residuals]):
+                    methods.raiseerror(messages.Errors.NoFilteredOutput,
+                                       'Cannot find any results from [{residuals}]\n'
+                                       '\t\t\tPlease take a look if you had applied correct filter inputs'
+                                       ''.format(residuals=residuals))
+            else:
+                if not os.path.exists(os.path.join(ref.path, ref.dataclass, residuals[0])):
+                    # Unexpected error
+                    methods.raiseerror(messages.Errors.NoFilteredOutput,
+                                       'Uncertain exception occured, please report to Author (shlee@unc.edu)')
+                else:
+                    # When Processing folder is empty
+                    filters[2] = residuals
+        else:
+            methods.raiseerror(messages.Errors.NoFilteredOutput,
+                               'Wrong filter input:{residuals}'.format(residuals=residuals))
+        return residuals
+    else:
+        return None
+
+
+def check_columns(snapshot, columns):
+    """
+    Check if the requested columns are in the snapshot of DataFrame
+    """
+    missing = [column for column in columns if column not in snapshot.columns]
+    if missing:
+        methods.raiseerror(messages.Errors.InputValueError,
+                           'Column(s) {} is not available, [{}]'.format(missing, ', '.join(snapshot.columns)))
+
+
+def joining_headers(prj, df):
+    """
+    Join the image header metadata columns (dims, n_volumes, voxel_size, tr, datatype, nbytes)
+    to the given DataFrame, the headers are read only if they are not cached in the project index
+    """
+    if not len(df):
+        return df
+    headers = collecting_headers(prj.index, df.Abspath.tolist(), workers=prj.header_workers)
+    return pd.concat([df, header_frame(headers)], axis=1)
+
+
+def summarizing(prj, dc_idx, empty, filters, ext):
+    """
+    Return summary of given project (Project or ProjectView)
+    """
+    summary = '** Project summary'
+    summary = '{}\nProject: {}'.format(summary, os.path.basename(prj.path))
+    if empty:
+        summary = '{}\n[Empty project]'.format(summary)
+    else:
+        summary = '{}\nSelected DataClass: {}\n'.format(summary, prj.dataclass)
+        if prj.pipelines:
+            summary = '{}\nApplied Pipeline(s): {}'.format(summary, prj.pipelines)
+        if prj.steps:
+            summary = '{}\nApplied Step(s): {}'.format(summary, prj.steps)
+        if prj.results:
+            summary = '{}\nProcessed Result(s): {}'.format(summary, prj.results)
+        if prj.subjects:
+            summary = '{}\nSubject(s): {}'.format(summary, prj.subjects)
+        if prj.sessions:
+            summary = '{}\nSession(s): {}'.format(summary, prj.sessions)
+        if prj.dtypes:
+            summary = '{}\nDataType(s): {}'.format(summary, prj.dtypes)
+        if prj.single_session:
+            summary = '{}\nSingle session dataset'.format(summary)
+        summary = '{}\n\nApplied filters'.format(summary)
+        if filters[0]:
+            summary = '{}\nSet subject(s): {}'.format(summary, filters[0])
+        if filters[1]:
+            summary = '{}\nSet session(s): {}'.format(summary, filters[1])
+        if dc_idx == 0:
+            if filters[2]:
+                summary = '{}\nSet datatype(s): {}'.format(summary, filters[2])
+        else:
+            if filters[2]:
+                summary = '{}\nSet Pipeline(s): {}'.format(summary, filters[2])
+            if filters[3]:
+                if dc_idx == 1:
+                    summary = '{}\nSet Step(s): {}'.format(summary, filters[3])
+                else:
+                    summary = '{}\nSet Result(s): {}'.format(summary, filters[3])
+        if ext:
+            summary = '{}\nSet file extension(s): {}'.format(summary, ext)
+        if filters[4]:
+            summary = '{}\nSet file tag(s): {}'.format(summary, filters[4])
+        if filters[5]:
+            summary = '{}\nSet ignore(s): {}'.format(summary, filters[5])
+    return summary
+
+
+class ProjectView(object):
+    """
+    Filtered view of project
+
+    The view shares the scanned DataFrame of the dataclass without copying it, and only keeps
+    the filters and the positions of selected rows, which are looked up from the FilterIndex of the dataclass
+    when they are required first.
+    The hierarchical attributes (subjects, sessions, ...) are also computed lazily from the selected rows.
+    Calling the view with the same arguments of Project (except dataclass) returns the chained view
+    which is filtered further.
+    """
+
+    def __init__(self, prj, dc_idx, engine, single_session, filters=None, ext=None, parent=None):
+        """Initiate view
+
+        :param prj: Project, the project which owns the base DataFrame
+        :param dc_idx: int, index of dataclass
+        :param engine: FilterIndex, index of the scanned DataFrame of dataclass (shared)
+        :param single_session: boolean, True if the dataclass is single session
+        :param filters: list, [subjects, sessions, dtypes(or pipelines), steps(or results), file_tags, ignores]
+        :param ext: list, file extensions
+        :param parent: ProjectView, the view to be filtered further
+        """
+        self.single_session = single_session
+        self.__prj = prj
+        self.__dc_idx = dc_idx
+        self.__engine = engine
+        self.__base = engine.df
+        self.__filters = filters or [None] * 6
+        self.__ext_filter = ext
+        self.__parent = parent
+        self.__rows = None
+        self.__snapshot = None
+        self.__values = dict()
+
+    @property
+    def rows(self):
+        """Positions of selected rows in the base DataFrame
+
+        :return: numpy.ndarray
+        """
+        if self.__rows is None:
+            if self.__parent is not None:
+                rows = self.__engine.select(self.__filters, self.__ext_filter, self.__parent.rows)
+            else:
+                rows = self.__engine.select(self.__filters, self.__ext_filter)
+            self.__rows = rows
+        return self.__rows
+
+    @property
+    def df(self):
+        """Dataframe of selected rows
+
+        :return: pandas.DataFrame
+        """
+        return self.__snap().df
+
+    def records(self):
+        """Iterate selected rows as records (namedtuple), without boxing each row into pandas.Series
+
+        :return: generator of Record
+        """
+        return self.__snap().records()
+
+    def batch(self, *columns):
+        """Column arrays of selected rows
+
+        :param columns: str[, ], Name of columns (e.g. 'Abspath', 'Subject', 'Session'), all columns if not given
+        :return: Record of numpy.ndarray
+        """
+        check_columns(self.__snap(), columns)
+        return self.__snap().batch(columns or None)
+
+    def headers(self):
+        """Dataframe of selected rows with the image header metadata columns
+        (dims, n_volumes, voxel_size, tr, datatype, nbytes)
+
+        :return: pandas.DataFrame
+        """
+        return joining_headers(self.__prj, self.df)
+
+    def __snap(self):
+        """Positionally indexed snapshot of selected rows, it is created only once for the view
+
+        :return: Snapshot
+        """
+        if self.__snapshot is None:
+            self.__snapshot = Snapshot(self.__base.take(self.rows))
+        return self.__snapshot
+
+    @property
+    def project(self):
+        return self.__prj
+
+    @property
+    def path(self):
+        return self.__prj.path
+
+    @property
+    def ds_type(self):
+        return self.__prj.ds_type
+
+    @property
+    def img_ext(self):
+        return self.__prj.img_ext
+
+    @property
+    def index(self):
+        return self.__prj.index
+
+    @property
+    def dataclass(self):
+        return self.ds_type[self.__dc_idx]
+
+    @property
+    def ext(self):
+        if self.__parent is not None and not self.__ext_filter:
+            return self.__parent.ext
+        return self.__ext_filter
+
+    @property
+    def filters(self):
+        """Filters applied from the root view
+
+        :return: list
+        """
+        if self.__parent is None:
+            return self.__filters
+        filters = list(self.__parent.filters)
+        for i, values in enumerate(self.__filters):
+            if values:
+                filters[i] = values
+        return filters
+
+    @property
+    def subjects(self):
+        return self.__unique('Subject')
+
+    @property
+    def sessions(self):
+        if self.single_session:
+            return None
+        return self.__unique('Session')
+
+    @property
+    def dtypes(self):
+        if self.__dc_idx == 0:
+            return self.__unique('DataType')
+        return None
+
+    @property
+    def pipelines(self):
+        if self.__dc_idx != 0:
+            return self.__unique('Pipeline')
+        return None
+
+    @property
+    def steps(self):
+        if self.__dc_idx == 1:
+            return self.__unique('Step')
+        return None
+
+    @property
+    def results(self):
+        if self.__dc_idx == 2:
+            return self.__unique('Report')
+        return None
+
+    @property
+    def summary(self):
+        print(summarizing(self, self.__dc_idx, not len(self), self.filters, self.ext))
+
+    def __unique(self, column):
+        """Sorted unique values of the column in selected rows, None if the view is empty
+        """
+        if column not in self.__values:
+            if len(self):
+                try:
+                    values = self.__engine.values(column, self.rows)
+                except:
+                    methods.raiseerror(messages.Errors.UpdateAttributesFailed,
+                                       "Error is occured during update project's attributes")
+            else:
+                values = None
+            self.__values[column] = values
+        return self.__values[column]
+
+    def __call__(self, *args, **kwargs):
+        """Return view filtered further from current view
+        """
+        filters = [None] * 6
+        ext = None
+        for key, value in kwargs.items():
+            if key == 'ext':
+                ext = converting_ext(value)
+            elif key == 'file_tag':
+                filters[4] = converting_tags(key, value)
+            elif key == 'ignore':
+                filters[5] = converting_tags(key, value)
+            else:
+                methods.raiseerror(messages.Errors.KeywordError,
+                                   "'{key}' is not correct kwarg".format(key=key))
+        if args:
+            parsing_filters(self, self.__dc_idx, args, filters)
+        return ProjectView(self.__prj, self.__dc_idx, self.__engine, self.single_session,
+                           filters=filters, ext=ext, parent=self)
+
+    def __repr__(self):
+        """Return absolute path for selected rows
+        """
+        if not len(self):
+            return str(self.summary)
+        else:
+            return str(self.df.Abspath)
+
+    def __getitem__(self, index):
+        """Return particular data based on input index
+        """
+        if not len(self):
+            return None
+        else:
+            return self.df.loc[index]
+
+    def __iter__(self):
+        """Iterator for selected rows, yielding (index, pandas.Series) (use 'records' for the lightweight rows)
+        """
+        if not len(self):
+            raise messages.EmptyProject
+        else:
+            for row in self.df.iterrows():
+                yield row
+
+    def __len__(self):
+        """Return number of selected rows
+        """
+        return len(self.rows)
+
+
 class Project(object):
     """
     Project handler
@@ -150,6 +600,12 @@ class Project(object):
         :param ds_ref: str, Reference of data structure (default: 'NIRAL')
         :param img_format: str, Reference img format (default: 'NifTi-1')
         :param kwargs: dict, key arguments for options
+            :subparam query_cache: int, Maximum number of filtered views to keep (default: 256, 0 to disable)
+            :subparam scan_workers: int, Number of threads to list directories concurrently (default: 1),
+                                    useful for the project on network filesystem
+            :subparam header_workers: int, Number of threads to read image headers (default: 4)
+            :subparam trust_manifest: bool, Take the files of finished steps from their manifest instead of
+                                      walking the step folders (default: True)
         """
 
         # Define default attributes
@@ -162,6 +618,13 @@ class Project(object):
 
         # Set internal objects
         self.__df = pd.DataFrame()
+        self.__frames = dict()                  # Scanned DataFrame and single_session of each dataclass
+        self.__engines = dict()                 # FilterIndex of each scanned DataFrame
+        self.__cache = QueryCache(kwargs.get('query_cache', 256))   # LRU cache of filtered views
+        self.__scan_workers = kwargs.get('scan_workers', 1)         # Threads for directory listing
+        self.header_workers = kwargs.get('header_workers', 4)       # Threads for reading image headers
+        self.trust_manifest = kwargs.get('trust_manifest', True)    # Skip walking the finished steps
+        self.__lock = threading.RLock()
 
         # Default definition of image format and data structure
         self.img_ext = ['.nii', '.nii.gz']
@@ -171,23 +634,21 @@ class Project(object):
         self.__dc_idx = 0                       # Dataclass index
         self.__ext_filter = self.img_ext        # File extension
         self.__residuals = None
+        self.__snapshot = None                  # Positionally indexed snapshot of current DataFrame
+        self.__watcher = None                   # TreeWatcher to keep the index current
 
         # Generate folders for dataclasses
         mk_main_folder(self)
+        self.__index = ProjectIndex(self.__path)
 
         # self._logger = methods.get_logger(self.__path, 'Project')
-        # Scan project folder
-        dc_idx = []
-        for i in range(3):
-            self.__dc_idx = i
-            self.scan_prj()
-            self.apply()
+        # Select the last non-empty dataclass, each dataclass is scanned lazily when it is touched first
+        for i in reversed(range(3)):
+            self.__select(i)
             if not self.__empty_project:
-                dc_idx.append(i)
-        if dc_idx:
-            self.__dc_idx = max(dc_idx)
-            self.scan_prj()
-            self.apply()
+                break
+        else:
+            self.__select(2)
 
     @property
     def df(self):
@@ -195,8 +656,49 @@ class Project(object):
 
         :return: pandas.DataFrame
         """
-        columns = self.__df.columns
-        return self.__df.reset_index()[columns]
+        return self.__snap().df
+
+    @property
+    def scan_workers(self):
+        """Number of threads to list directories concurrently
+
+        :return: int
+        """
+        return self.__scan_workers
+
+    @scan_workers.setter
+    def scan_workers(self, value):
+        if not isinstance(value, int) or value < 1:
+            methods.raiseerror(messages.Errors.InputValueError,
+                               'The number of scan workers must be a positive integer.')
+        self.__scan_workers = value
+
+    @property
+    def cache_info(self):
+        """Statistics of query cache
+
+        :return: CacheInfo(hits, misses, maxsize, currsize, generation)
+        """
+        return self.__cache.info()
+
+    @property
+    def watching(self):
+        """Mode of running watcher ('inotify' or 'polling'), None if the project is not watched
+
+        :return: str
+        """
+        watcher = self.__watcher
+        if watcher is None or not watcher.is_alive():
+            return None
+        return watcher.mode
+
+    @property
+    def index(self):
+        """Persistent index of project files
+
+        :return: ProjectIndex
+        """
+        return self.__index
 
     @property
     def path(self):
@@ -221,12 +723,13 @@ class Project(object):
         :param idx: int, index of dataclass
         :return: None
         """
-        if idx in range(3):
-            self.__dc_idx = idx
-            self.reset()
-            self.apply()
-        else:
-            methods.raiseerror(messages.Errors.InputDataclassError, 'Wrong dataclass index.')
+        with self.__lock:
+            if idx in range(3):
+                self.__dc_idx = idx
+                self.reset()
+                self.apply()
+            else:
+                methods.raiseerror(messages.Errors.InputDataclassError, 'Wrong dataclass index.')
 
     @property
     def subjects(self):
@@ -266,17 +769,18 @@ class Project(object):
 
     @ext.setter
     def ext(self, value):
-        if type(value) == str:
-            self.__ext_filter = [value]
-        elif type(value) == list:
-            self.__ext_filter = value
-        elif not value:
-            self.__ext_filter = None
-        else:
-            methods.raiseerror(messages.Errors.InputTypeError,
-                               'Please use correct type for input.')
-        self.reset()
-        self.apply()
+        with self.__lock:
+            if type(value) == str:
+                self.__ext_filter = [value]
+            elif type(value) == list:
+                self.__ext_filter = value
+            elif not value:
+                self.__ext_filter = None
+            else:
+                methods.raiseerror(messages.Errors.InputTypeError,
+                                   'Please use correct type for input.')
+            self.reset()
+            self.apply()
 
     @property
     def ref_exts(self, type='all'):
@@ -302,69 +806,279 @@ class Project(object):
             methods.raiseerror(messages.Errors.InputTypeError,
                                "only one of the value in ['all'.'img'.'txt'] is available for type.\n")
 
-    def reload(self):
-        """Reload dataset
+    def reload(self, full=False):
+        """Reload dataset, only the directories changed since the last scan are re-listed
+
+        :param full: boolean, Choose if you want to re-scan all dataset
+        :return: None
+        """
+        with self.__lock:
+            if full:
+                self.reset(rescan=True)
+            elif self.refresh():
+                return
+            else:
+                self.reset()
+            self.apply()
+
+    def refresh(self, dirs=None):
+        """Patch the project index with the directories changed since the last scan,
+        and reload the DataFrame of current dataclass with current filters if any file is added or removed
+
+        :param dirs: list of str, Changed directories (e.g. reported by the watcher), only these directories
+                     are re-listed if given, otherwise all known directories are checked
+        :return: boolean, True if any file is added or removed
+        """
+        with self.__lock:
+            patched = False
+            for i in list(self.__frames.keys()):
+                if dirs is not None:
+                    dc_path = os.path.join(self.__path, self.ds_type[i])
+                    if not any(d == dc_path or d.startswith(dc_path + os.sep) for d in dirs):
+                        continue
+                changed = self.__patch_index(i, dirs)
+                if changed is None:
+                    before = scanned_paths(self.__frames[i][0])
+                    df, _ = self.__scan(i)
+                    changed = scanned_paths(df) != before
+                elif changed:
+                    del self.__frames[i]
+                    self.__cache.invalidate(i)
+                patched = patched or changed
+            if patched:
+                self.__df, self.single_session = self.__load(self.__dc_idx)
+                self.__empty_project = not len(self.__df)
+                self.apply()
+            return patched
+
+    def watch(self, interval=1.0, latency=0.5, polling=False, timeout=30.0):
+        """Start watching the dataclass folders in background, the changes are patched into the index
+        as they happen, so reload is not needed. Linux inotify is used if available, otherwise
+        the changed directories are checked periodically.
+
+        :param interval: float, Seconds between polling (or checking the watcher is stopped)
+        :param latency: float, Seconds to wait for the following events, the burst of events is patched at once
+        :param polling: boolean, Use polling even if inotify is available (e.g. network filesystem)
+        :param timeout: float, Seconds to wait until all directories are watched
+        :return: str, mode of watcher ('inotify' or 'polling')
+        """
+        self.unwatch()
+        roots = [os.path.join(self.__path, ds) for ds in self.ds_type]
+        watcher = TreeWatcher(roots, self.__sync, interval=interval, latency=latency, polling=polling)
+        watcher.start()
+        if not watcher.ready.wait(timeout):
+            watcher.stop(wait=False)
+            methods.raiseerror(messages.Errors.InitiationFailure,
+                               'Watcher is not ready in {} seconds.'.format(timeout))
+        if not watcher.is_alive() and watcher.error is not None:
+            methods.raiseerror(messages.Errors.InitiationFailure,
+                               'Watcher is failed [{}]'.format(watcher.error))
+        self.__watcher = watcher
+        return watcher.mode
+
+    def unwatch(self):
+        """Stop the watcher
+
+        :return: None
+        """
+        watcher, self.__watcher = self.__watcher, None
+        if watcher is not None:
+            watcher.stop()
+
+    def __sync(self, dirs):
+        """Callback of watcher, patch the index with the changed directories and re-apply filters only if changed
+        """
+        self.refresh(dirs)
+
+    def __select(self, dc_idx):
+        """Select dataclass and apply filters
 
+        :param dc_idx: idx, index in range(3)
         :return: None
         """
-        self.reset(rescan=True)
-        self.apply()
+        with self.__lock:
+            self.__dc_idx = dc_idx
+            self.__df, self.single_session = self.__load(dc_idx)
+            self.__empty_project = not len(self.__df)
+            self.apply()
+
+    def __load(self, dc_idx):
+        """Return the DataFrame of dataclass, the dataclass is scanned only when it is touched first
+        and the result is cached for each dataclass. If the dataclass was indexed before,
+        only the directories changed since then are re-listed
+
+        :param dc_idx: idx, index in range(3)
+        :return: pandas.DataFrame (compact form, see handler.compact), single_session
+        """
+        with self.__lock:
+            if dc_idx not in self.__frames:
+                changed = self.__patch_index(dc_idx)
+                if changed is None:
+                    return self.__scan(dc_idx)
+                elif changed:
+                    self.__cache.invalidate(dc_idx)
+                single_session, empty = self.__index.status(dc_idx)
+                if empty:
+                    df = pd.DataFrame()
+                else:
+                    df = compacting(self.__index.load(dc_idx, reorder_columns(dc_idx, single_session)))
+                self.__frames[dc_idx] = (df, single_session)
+            return self.__frames[dc_idx]
+
+    def records(self):
+        """Iterate current dataframe as records (namedtuple), without boxing each row into pandas.Series
+
+        :return: generator of Record
+        """
+        return self.__snap().records()
+
+    def batch(self, *columns):
+        """Column arrays of current dataframe
+
+        :param columns: str[, ], Name of columns (e.g. 'Abspath', 'Subject', 'Session'), all columns if not given
+        :return: Record of numpy.ndarray
+        """
+        check_columns(self.__snap(), columns)
+        return self.__snap().batch(columns or None)
+
+    def headers(self):
+        """Current dataframe with the image header metadata columns
+        (dims, n_volumes, voxel_size, tr, datatype, nbytes)
+
+        :return: pandas.DataFrame
+        """
+        return joining_headers(self, self.df)
+
+    def header(self, path):
+        """Image header metadata of the file, which is read without loading image data
+        and cached in the project index until the file is changed
+
+        :param path: str, Absolute path of image
+        :return: Header(Abspath, dims, n_volumes, voxel_size, tr, datatype, nbytes)
+        """
+        return collecting_headers(self.__index, [path])[0]
+
+    def __snap(self):
+        """Positionally indexed snapshot of current DataFrame, it is re-created only when the DataFrame is changed
+        by applying filters or scanning
+
+        :return: Snapshot
+        """
+        snapshot = self.__snapshot
+        if snapshot is None or snapshot.source is not self.__df:
+            snapshot = Snapshot(self.__df)
+            self.__snapshot = snapshot
+        return snapshot
+
+    def __engine(self, dc_idx):
+        """Return the FilterIndex of dataclass, it is re-created when the DataFrame is re-scanned or patched
+
+        :param dc_idx: idx, index in range(3)
+        :return: FilterIndex, single_session
+        """
+        with self.__lock:
+            df, single_session = self.__load(dc_idx)
+            engine = self.__engines.get(dc_idx)
+            if engine is None or engine.df is not df:
+                engine = FilterIndex(df, dc_idx)
+                self.__engines[dc_idx] = engine
+            return engine, single_session
+
+    def __scan(self, dc_idx, trusted=True):
+        """Scan all files of dataclass, save them to the index and cache the DataFrame
+
+        :param dc_idx: idx, index in range(3)
+        :param trusted: boolean, False to walk all step folders regardless of their manifest
+        :return: pandas.DataFrame, single_session
+        """
+        stamps = dict()
+        df, single_session, empty_prj = parsing_datatree(self.path, self.ds_type, dc_idx, stamps=stamps,
+                                                         workers=self.__scan_workers,
+                                                         trust_manifest=trusted and self.trust_manifest)
+        if not empty_prj:
+            df = initial_filter(df, self.ds_type, self.ref_exts)
+            if len(df):
+                df = df[reorder_columns(dc_idx, single_session)]
+        try:
+            self.__index.store(dc_idx, df, single_session, stamps=stamps)
+        except:
+            pass
+        df = compacting(df)
+        with self.__lock:
+            self.__frames[dc_idx] = (df, single_session)
+            self.__cache.invalidate(dc_idx)
+        return df, single_session
+
+    def __patch_index(self, dc_idx, dirs=None):
+        """Re-list the directories changed since the last scan and patch the index in place
+
+        :param dc_idx: idx, index in range(3)
+        :param dirs: list of changed directories, only these directories are re-listed if given
+        :return: boolean, True if any file is added or removed, None if the dataclass needs to be fully re-scanned
+        """
+        status = self.__index.status(dc_idx)
+        stamps = self.__index.stamps(dc_idx)
+        if status is None or not stamps:
+            return None
+        single_session, empty = status
+        dc_path = os.path.join(self.__path, self.ds_type[dc_idx])
+        pruning = manifest_pruning(dc_path) if self.trust_manifest and dc_idx != 0 else None
+        if dirs is not None:
+            records, relisted, removed = relisting_tree(self.__path, dc_path, stamps, dirs, pruning=pruning)
+        else:
+            records, relisted, removed = update_tree(self.__path, dc_path, stamps,
+                                                     workers=self.__scan_workers, pruning=pruning)
+        if not relisted and not removed:
+            return False
+        if empty:
+            # The data structure of empty dataclass is not known, it is scanned when any file is appeared
+            if len(records) and len(initial_filter(records.to_dataframe(), None, self.ref_exts)):
+                return None
+            return self.__index.patch(dc_idx, pd.DataFrame(), relisted, removed, records.stamps)
+        columns = reorder_columns(dc_idx, single_session)
+        depth = len(columns) - 1        # DataClass + hierarchy columns
+        if records.depth > depth:       # data structure is changed
+            return None
+        df = records.to_dataframe(depth)
+        if len(df):
+            df = df.rename(columns=update_columns(dc_idx, single_session))
+            df = initial_filter(df, self.ds_type, self.ref_exts)[columns]
+        return self.__index.patch(dc_idx, df, relisted, removed, records.stamps)
 
     def reset(self, rescan=False, verbose=False):
         """Reset DataFrame
 
-        :param rescan: boolean, Choose if you want to re-scan all dataset
+        :param rescan: boolean, Choose if you want to re-scan all dataset (the manifest of steps are not trusted)
         :param verbose: boolean
         :return: None
         """
 
-        if rescan:
-            idx = int(self.__dc_idx)
-            for i in range(2):
-                self.__dc_idx = i+1
-                self.scan_prj()
-                if self.__empty_project:
-                    if verbose:
-                        print("Dataclass '{}' is Empty".format(self.ds_type[self.__dc_idx]))
-            self.__dc_idx = idx
-            self.scan_prj()
-        else:
-            prj_file = os.path.join(self.__path, self.ds_type[self.__dc_idx], '.class_dataframe')
-            try:
-                with open(prj_file, 'r') as f:
-                    self.__df = pickle.load(f)
-                if self.__dc_idx == 0:
-                    if self.__empty_project:
-                        pass
-                    else:
-                        if len(self.__df.columns) == 4:
-                            self.single_session = True
-                        else:
-                            self.single_session = False
-                else:
-                    if self.__empty_project:
-                        pass
-                    else:
-                        if len(self.__df.columns) == 5:
-                            self.single_session = True
-                        else:
-                            self.single_session = False
-            except:
-                self.scan_prj()
-        if len(self.__df):
-            self.__empty_project = False
+        with self.__lock:
+            if rescan:
+                for i in sorted(self.__frames.keys()):
+                    if i != self.__dc_idx:
+                        df, _ = self.__scan(i, trusted=False)
+                        if not len(df):
+                            if verbose:
+                                print("Dataclass '{}' is Empty".format(self.ds_type[i]))
+                self.scan_prj(trusted=False)
+            else:
+                df, single_session = self.__load(self.__dc_idx)
+                self.__df = df
+                if not self.__empty_project:
+                    self.single_session = single_session
+            if len(self.__df):
+                self.__empty_project = False
 
-    def save_df(self, dc_idx):
-        """Save Dataframe to pickle file
+    def save_df(self, dc_idx, stamps=None):
+        """Save Dataframe to the project index
 
         :param dc_idx: idx, index in range(3)
+        :param stamps: dict, stamps of scanned directories
         :return: None
         """
-        dc_df = os.path.join(self.__path, self.ds_type[dc_idx], '.class_dataframe')
-        if os.path.exists(dc_df):
-            os.remove(dc_df)
-        with open(dc_df, 'wb') as f:
-            pickle.dump(self.__df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.__lock:
+            self.__index.store(dc_idx, expanding(self.__df), self.single_session, stamps=stamps)
 
     def reset_filters(self, ext=None):
         """Reset filter - Clear all filter information and extension
@@ -372,34 +1086,24 @@ class Project(object):
         :param ext: str, Filter parameter for file extension
         :return: None
         """
-        self.__filters = [None] * 6
-        if not ext:
-            self.ext = self.img_ext
-        else:
-            self.ext = ext
+        with self.__lock:
+            self.__filters = [None] * 6
+            if not ext:
+                self.ext = self.img_ext
+            else:
+                self.ext = ext
 
-    def scan_prj(self):
+    def scan_prj(self, trusted=True):
         """Reload the Dataframe based on current set data class and extension
 
+        :param trusted: boolean, False to walk all step folders regardless of their manifest
         :return: None
         """
-        # Parsing command works
-        self.__df, self.single_session, empty_prj = parsing_datatree(self.path, self.ds_type, self.__dc_idx)
-        # print(self.__df)
-        if not empty_prj:
-            self.__df = initial_filter(self.__df, self.ds_type, self.ref_exts)
-            if len(self.__df):
-                self.__df = self.__df[reorder_columns(self.__dc_idx, self.single_session)]
-                self.__empty_project = False
-            else:
-                self.__empty_project = True
+        with self.__lock:
+            # Parsing command works
+            self.__df, self.single_session = self.__scan(self.__dc_idx, trusted=trusted)
+            self.__empty_project = not len(self.__df)
             self.__update()
-        else:
-            self.__empty_project = True
-        try:
-            self.save_df(self.__dc_idx)
-        except:
-            pass
 
     def set_filters(self, *args, **kwargs):
         """Set filters
@@ -410,137 +1114,46 @@ class Project(object):
             :subparam ignore: str or list of str, Keywords of neglect for filename
         :return: None
         """
-        self.reset_filters(self.ext)
-        pipe_filter = None
-        if kwargs:
-            for key in kwargs.keys():
-                if key == 'dataclass':
-                    self.dataclass = kwargs['dataclass']
-                elif key == 'ext':
-                    self.ext = kwargs['ext']
-                elif key == 'file_tag':
-                    if type(kwargs['file_tag']) == str:
-                        self.__filters[4] = [kwargs['file_tag']]
-                    elif type(kwargs['file_tag']) == list:
-                        self.__filters[4] = kwargs['file_tag']
-                    else:
-                        methods.raiseerror(messages.Errors.InputTypeError,
-                                                 'Please use correct input type for FileTag')
-                elif key == 'ignore':
-                    if type(kwargs['ignore']) == str:
-                        self.__filters[5] = [kwargs['ignore']]
-                    elif type(kwargs['ignore']) == list:
-                        self.__filters[5] = kwargs['ignore']
-                    else:
-                        methods.raiseerror(messages.Errors.InputTypeError,
-                                                 'Please use correct input type for FileTag to ignore')
-                else:
-                    methods.raiseerror(messages.Errors.KeywordError,
-                                             "'{key}' is not correct kwarg")
-        else:
-            pass
-        if args:
-            residuals = list(set(args))
-            if self.subjects: # If subjects are assigned already
-                subj_filter, residuals = check_arguments(args, residuals, self.subjects)
-                # print(subj_filter)
-                if self.__filters[0]: # Subject filter
-                    self.__filters[0].extend(subj_filter)
-                else:
-                    self.__filters[0] = subj_filter[:]
-                if not self.single_session: # If multi-session project
-                    sess_filter, residuals = check_arguments(args, residuals, self.sessions)
-                    if self.__filters[1]: # Session filter
-                        self.__filters[1].extend(sess_filter)
-                    else:
-                        self.__filters[1] = sess_filter[:]
-                else:
-                    self.__filters[1] = None
-            else: # If no subjects are detected in this project, pass... (residual is not in subject and session)
-                self.__filters[0] = None
-                self.__filters[1] = None
-
-            if self.__dc_idx == 0: # if dataclass is 0
-                if self.dtypes: # check if residual arguments is parts of datatype (anat, func, or dti...)
-                    dtyp_filter, residuals = check_arguments(args, residuals, self.dtypes)
-                    if self.__filters[2]: # Datatype filter
-                        self.__filters[2].extend(dtyp_filter)
-                    else:
-                        self.__filters[2] = dtyp_filter[:]
-                else:
-                    self.__filters[2] = None
-                self.__filters[3] = None
-
-            elif self.__dc_idx == 1:
-                if self.pipelines:
-                    pipe_filter, residuals = check_arguments(args, residuals, self.pipelines)
-                    if self.__filters[2]:
-                        self.__filters[2].extend(pipe_filter)
-                    else:
-                        self.__filters[2] = pipe_filter[:]
-                else:
-                    self.__filters[2] = None
-                if self.steps:
-                    step_filter, residuals = check_arguments(args, residuals, self.steps)
-                    if self.__filters[3]:
-                        self.__filters[3].extend(step_filter)
-                    else:
-                        self.__filters[3] = step_filter
-                else:
-                    self.__filters[3] = None
-            else:
-                if self.pipelines:
-                    pipe_filter, residuals = check_arguments(args, residuals, self.pipelines)
-                    if self.__filters[2]:
-                        self.__filters[2].extend(pipe_filter)
-                    else:
-                        self.__filters[2] = pipe_filter[:]
-                else:
-                    self.__filters[2] = None
-                if self.results:
-                    rslt_filter, residuals = check_arguments(args, residuals, self.results)
-                    if self.__filters[3]:
-                        self.__filters[3].extend(rslt_filter)
-                    else:
-                        self.__filters[3] = rslt_filter[:]
-                else:
-                    self.__filters[3] = None
-
-            if len(residuals):
-                if self.dataclass == self.ds_type[1]:
-                    if len(pipe_filter) == 1:
-                        dc_path = os.path.join(self.path, self.dataclass, pipe_filter[0])
-                        processed = os.listdir(dc_path)
-                        if len([step for step in processed if step in residuals]):
-                            # self._logger.debug('set_filters::Wrong filter(s)-{}'.format(residuals))
-                            methods.raiseerror(messages.Errors.NoFilteredOutput,
-                                               'Cannot find any results from [{residuals}]\n'
-                                               '\t\t\tPlease take a look if you had applied correct filter inputs'
-                                               ''.format(residuals=residuals))
-                    else:
-                        if not os.path.exists(os.path.join(self.path, self.dataclass, residuals[0])):
-                            # Unexpected error
-                            # self._logger.debug('set_filters::Exception on residual-{}'.format(residuals))
-                            # self._logger.debug('set_filters::filters - {}, {}'.format(args, kwargs))
-                            methods.raiseerror(messages.Errors.NoFilteredOutput,
-                                               'Uncertain exception occured, please report to Author (shlee@unc.edu)')
+        with self.__lock:
+            self.reset_filters(self.ext)
+            if kwargs:
+                for key in kwargs.keys():
+                    if key == 'dataclass':
+                        self.dataclass = kwargs['dataclass']
+                    elif key == 'ext':
+                        self.ext = kwargs['ext']
+                    elif key == 'file_tag':
+                        if type(kwargs['file_tag']) == str:
+                            self.__filters[4] = [kwargs['file_tag']]
+                        elif type(kwargs['file_tag']) == list:
+                            self.__filters[4] = kwargs['file_tag']
                         else:
-                            # When Processing folder is empty
-                            self.__filters[2] = residuals
-                else:
-                    # self._logger.debug('set_filters::Wrong filter(s)-{}'.format(residuals))
-                    methods.raiseerror(messages.Errors.NoFilteredOutput,
-                                       'Wrong filter input:{residuals}'.format(residuals=residuals))
+                            methods.raiseerror(messages.Errors.InputTypeError,
+                                                     'Please use correct input type for FileTag')
+                    elif key == 'ignore':
+                        if type(kwargs['ignore']) == str:
+                            self.__filters[5] = [kwargs['ignore']]
+                        elif type(kwargs['ignore']) == list:
+                            self.__filters[5] = kwargs['ignore']
+                        else:
+                            methods.raiseerror(messages.Errors.InputTypeError,
+                                                     'Please use correct input type for FileTag to ignore')
+                    else:
+                        methods.raiseerror(messages.Errors.KeywordError,
+                                                 "'{key}' is not correct kwarg")
             else:
-                self.__residuals = None
+                pass
+            if args:
+                self.__residuals = parsing_filters(self, self.__dc_idx, args, self.__filters)
 
     def apply(self):
         """Applying all filters to current dataframe
 
         :return: None
         """
-        self.__df = self.applying_filters(self.__df)
-        self.__update()
+        with self.__lock:
+            self.__df = self.applying_filters(self.__df)
+            self.__update()
 
     def applying_filters(self, df):
         """Applying current filters to the given dataframe
@@ -549,6 +1162,11 @@ class Project(object):
         :return: pandas.DataFrame
         """
         if len(df):
+            frame = self.__frames.get(self.__dc_idx)
+            if frame is not None and df is frame[0]:
+                # Scanned DataFrame, use the inverted index instead of evaluating every row
+                engine, _ = self.__engine(self.__dc_idx)
+                return df.take(engine.select(self.__filters, self.ext))
             # if self.__dc_idx != 2:
             if self.__filters[0]:
                 df = df[df.Subject.isin(self.__filters[0])]
@@ -581,49 +1199,7 @@ class Project(object):
     def __summary(self):
         """Print summary of current project
         """
-        summary = '** Project summary'
-        summary = '{}\nProject: {}'.format(summary, os.path.basename(self.path))
-        if self.__empty_project:
-            summary = '{}\n[Empty project]'.format(summary)
-        else:
-            summary = '{}\nSelected DataClass: {}\n'.format(summary, self.dataclass)
-            if self.pipelines:
-                summary = '{}\nApplied Pipeline(s): {}'.format(summary, self.pipelines)
-            if self.steps:
-                summary = '{}\nApplied Step(s): {}'.format(summary, self.steps)
-            if self.results:
-                summary = '{}\nProcessed Result(s): {}'.format(summary, self.results)
-            if self.subjects:
-                summary = '{}\nSubject(s): {}'.format(summary, self.subjects)
-            if self.sessions:
-                summary = '{}\nSession(s): {}'.format(summary, self.sessions)
-            if self.dtypes:
-                summary = '{}\nDataType(s): {}'.format(summary, self.dtypes)
-            if self.single_session:
-                summary = '{}\nSingle session dataset'.format(summary)
-            summary = '{}\n\nApplied filters'.format(summary)
-            if self.__filters[0]:
-                summary = '{}\nSet subject(s): {}'.format(summary, self.__filters[0])
-            if self.__filters[1]:
-                summary = '{}\nSet session(s): {}'.format(summary, self.__filters[1])
-            if self.__dc_idx == 0:
-                if self.__filters[2]:
-                    summary = '{}\nSet datatype(s): {}'.format(summary, self.__filters[2])
-            else:
-                if self.__filters[2]:
-                    summary = '{}\nSet Pipeline(s): {}'.format(summary, self.__filters[2])
-                if self.__filters[3]:
-                    if self.__dc_idx == 1:
-                        summary = '{}\nSet Step(s): {}'.format(summary, self.__filters[3])
-                    else:
-                        summary = '{}\nSet Result(s): {}'.format(summary, self.__filters[3])
-            if self.__ext_filter:
-                summary = '{}\nSet file extension(s): {}'.format(summary, self.__ext_filter)
-            if self.__filters[4]:
-                summary = '{}\nSet file tag(s): {}'.format(summary, self.__filters[4])
-            if self.__filters[5]:
-                summary = '{}\nSet ignore(s): {}'.format(summary, self.__filters[5])
-        print(summary)
+        print(summarizing(self, self.__dc_idx, self.__empty_project, self.__filters, self.__ext_filter))
 
     def __update(self):
         """Update attributes of Project object based on current set filter information
@@ -670,13 +1246,38 @@ class Project(object):
             self.__empty_project = True
 
     def __call__(self, dc_id, *args, **kwargs):
-        """Return DataFrame followed applying filters
+        """Return filtered view of the dataclass, the scanned DataFrame is shared without copying
+
+        :return: ProjectView
         """
-        prj = ccopy.copy(self)
-        prj.dataclass = dc_id
-        prj.set_filters(*args, **kwargs)
-        prj.apply()
-        return prj
+        ext = self.ext or self.img_ext
+        if 'dataclass' in kwargs.keys():
+            dc_id = kwargs.pop('dataclass')
+        if 'ext' in kwargs.keys():
+            ext = converting_ext(kwargs.pop('ext'))
+        if dc_id not in range(3):
+            methods.raiseerror(messages.Errors.InputDataclassError, 'Wrong dataclass index.')
+        for key in ['file_tag', 'ignore']:
+            if key in kwargs.keys():
+                kwargs[key] = converting_tags(key, kwargs[key])
+        try:
+            query = (dc_id, frozenset(args), tuple(ext or []),
+                     tuple(sorted((key, tuple(value)) for key, value in kwargs.items())))
+            hash(query)
+        except TypeError:
+            query = None
+        if query is not None:
+            view = self.__cache.get(query)
+            if view is not None:
+                return view
+        with self.__lock:
+            engine, single_session = self.__engine(dc_id)
+            generation = self.__cache.generation
+        view = ProjectView(self, dc_id, engine, single_session, ext=ext)(*args, **kwargs)
+        if query is not None:
+            len(view)   # select rows before caching
+            self.__cache.put(query, view, generation, scope=dc_id)
+        return view
 
     def __repr__(self):
         """Return absolute path for current filtered dataframe
@@ -695,7 +1296,7 @@ class Project(object):
             return self.df.loc[index]
 
     def __iter__(self):
-        """Iterator for dataframe
+        """Iterator for dataframe, yielding (index, pandas.Series) (use 'records' for the lightweight rows)
         """
         if self.__empty_project:
             raise messages.EmptyProject
@@ -709,4 +1310,4 @@ class Project(object):
         if self.__empty_project:
             return 0
         else:
-            return len(self.df)
\ No newline at end of file
+            return len(self.__df)
\ No newline at end of file
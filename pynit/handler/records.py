@@ -0,0 +1,109 @@
+"""
+Lightweight row records of project DataFrame
+"""
+import numpy as np
+from collections import namedtuple
+from .compact import expanding
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+_record_types = dict()
+
+
+def _getitem(self, key):
+    """ Item access by position or by column name (same as pandas.Series)
+    """
+    if isinstance(key, (int, np.integer, slice)):
+        return tuple.__getitem__(self, key)
+    try:
+        return getattr(self, key)
+    except (AttributeError, TypeError):
+        raise KeyError(key)
+
+
+def _get(self, key, default=None):
+    try:
+        return _getitem(self, key)
+    except (KeyError, IndexError):
+        return default
+
+
+def record_type(columns):
+    """ Namedtuple class of the row record for given columns, the class is created once for each set of columns.
+    The record can be accessed by attribute (row.Abspath), by column name (row['Abspath']) or by position
+
+    :param columns: list of column names
+    :return: class
+    """
+    key = tuple(columns)
+    if key not in _record_types:
+        base = namedtuple('Record', [str(c) for c in columns], rename=True)
+        _record_types[key] = type('Record', (base,), dict(__slots__=(), __getitem__=_getitem, get=_get))
+    return _record_types[key]
+
+
+class Snapshot(object):
+    """ Positionally indexed snapshot of the filtered DataFrame
+
+    The DataFrame is expanded only once when the snapshot is created ('Abspath' is built for the rows if the source
+    is in compact form, the index labels of the source are kept), and each row is accessed by its position
+    as a record from the column arrays without building the DataFrame (or Series) again.
+    The snapshot must be re-created when the source DataFrame is changed (filters or scan).
+    """
+    def __init__(self, source):
+        """ Initiate snapshot
+
+        :param source: filtered DataFrame
+        """
+        self.source = source
+        self.df = expanding(source)
+        self.columns = list(self.df.columns)
+        self.record = record_type(self.columns)
+        self.__values = None
+
+    def __len__(self):
+        return len(self.df)
+
+    def __getstate__(self):
+        # the record class is created at runtime, so it is re-created after unpickling
+        return dict(source=self.source, df=self.df, columns=self.columns)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.record = record_type(self.columns)
+        self.__values = None
+
+    @property
+    def values(self):
+        """ List of column arrays
+        """
+        if self.__values is None:
+            self.__values = [np.asarray(self.df[column]) for column in self.columns]
+        return self.__values
+
+    def __getitem__(self, index):
+        """ Return the record at the position
+        """
+        return self.record(*[v[index] for v in self.values])
+
+    def records(self):
+        """ Iterate records of all rows
+
+        :return: generator of Record
+        """
+        make = self.record._make
+        for row in zip(*self.values):
+            yield make(row)
+
+    def batch(self, columns=None):
+        """ Column arrays of all rows as a record of arrays
+
+        :param columns: list of column names, all columns if not given
+        :return: Record of numpy.ndarray
+        """
+        if columns is None:
+            return self.record(*self.values)
+        arrays = dict(zip(self.columns, self.values))
+        return record_type(columns)(*[arrays[column] for column in columns])
@@ -0,0 +1,350 @@
+"""
+Project tree scanner
+"""
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing.pool import ThreadPool
+from ..tools import methods
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+_hidden = re.compile(r'^[.].+')
+_racy_window = 2.0      # seconds, the directory modified within this window is re-listed on next update
+
+
+def listing_dir(path):
+    """ List files and sub-directories of the given directory with single system call per entry
+    The symbolic link of directory is neither listed as file nor as directory (same as os.walk)
+
+    :param path: directory path
+    :type path: str
+    :return: list of filenames, list of sub-directory names
+    :rtype: list, list
+    """
+    files = []
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(path):
+            abspath = os.path.join(path, name)
+            if os.path.isdir(abspath):
+                if not os.path.islink(abspath):
+                    dirs.append(name)
+            else:
+                files.append(name)
+    return files, dirs
+
+
+def dir_stamp(mtime, n_entries):
+    """ Stamp of directory at the scanning time, (modified time, number of entries)
+    If the directory is modified just before the scanning, the change made right after the scanning
+    may have same modified time (coarse timestamp on NFS), so the mtime is stored as -1 to re-list it next time
+
+    :param mtime: modified time of directory, which is taken before listing the entries
+    :param n_entries: number of entries listed in the directory
+    :return: tuple of (mtime, n_entries)
+    """
+    if time.time() - mtime < _racy_window:
+        mtime = -1.0
+    return mtime, n_entries
+
+
+def listing_stamp(path):
+    """ Stat and list the directory, the modified time is taken before listing
+
+    :param path: directory path
+    :return: list of filenames, list of sub-directory names, stamp (None if the directory can't be listed)
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        files, dirs = listing_dir(path)
+    except OSError:
+        return None
+    return files, dirs, dir_stamp(mtime, len(files) + len(dirs))
+
+
+def mapping_levels(func, top, workers=1):
+    """ Apply the function to the directories of tree level by level (breadth first)
+    The function returns (result, list of sub-directories to visit next), or None to skip the directory.
+    The directories of each level are processed concurrently by the bounded thread pool if 'workers' > 1,
+    and the results are returned in the order of visiting, which does not depend on the number of workers
+
+    :param func: function takes the directory path
+    :param top: top directory
+    :param workers: number of threads
+    :return: list of (path, result)
+    """
+    pool = ThreadPool(workers) if workers > 1 else None
+    output = []
+    try:
+        level = [top]
+        while level:
+            if pool is not None:
+                results = pool.map(func, level, chunksize=1)
+            else:
+                results = [func(path) for path in level]
+            next_level = []
+            for path, result in zip(level, results):
+                if result is None:
+                    continue
+                value, subdirs = result
+                output.append((path, value))
+                next_level.extend(subdirs)
+            level = next_level
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return output
+
+
+def walk_tree(top, workers=1, pruning=None):
+    """ Walk the directory tree from the top, yielding the path, the filenames and the stamp of each directory.
+    If 'workers' > 1, the directories of each level are listed concurrently (see 'mapping_levels')
+    and the results are merged in the same order of serial walking (depth first, sorted by name).
+    If 'pruning' is given, it is called with each directory path before listing, and if it returns
+    the list of (dirpath, filenames, stamp) for the sub-tree (e.g. from step manifest), the sub-tree is not walked
+
+    :param top: top directory
+    :type top: str
+    :param workers: number of threads
+    :type workers: int
+    :param pruning: function takes the directory path, returns list of entries or None
+    :return: generator of (dirpath, filenames, stamp)
+    """
+    if workers > 1:
+        def listing(path):
+            if pruning is not None:
+                entries = pruning(path)
+                if entries is not None:
+                    return entries, []
+            listed = listing_stamp(path)
+            if listed is None:
+                return None
+            files, dirs, stamp = listed
+            return [(path, files, stamp)], [os.path.join(path, d) for d in sorted(dirs)]
+
+        output = [entry for _, entries in mapping_levels(listing, top, workers) for entry in entries]
+        output.sort(key=lambda item: methods.path_splitter(item[0]))
+        for entry in output:
+            yield entry
+        return
+
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        if pruning is not None:
+            entries = pruning(path)
+            if entries is not None:
+                for entry in entries:
+                    yield entry
+                continue
+        listed = listing_stamp(path)
+        if listed is None:
+            continue
+        files, dirs, stamp = listed
+        yield path, files, stamp
+        stack.extend(os.path.join(path, d) for d in reversed(sorted(dirs)))
+
+
+class TreeRecords(object):
+    """ Columnar container for the file records of scanned tree
+
+    Each file is stored as hierarchy (list of folder names from the project root), filename and absolute path,
+    and the stamp of each scanned directory is kept to detect the changes afterward
+    """
+    def __init__(self):
+        self.levels = []
+        self.filenames = []
+        self.abspaths = []
+        self.stamps = dict()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def append_dir(self, prj_path, dirpath, files):
+        """ Append all visible files inside the directory
+
+        :param prj_path: project root path
+        :param dirpath: directory which contains files
+        :param files: list of filenames
+        """
+        parts = methods.path_splitter(os.path.relpath(dirpath, prj_path))
+        for filename in files:
+            if not _hidden.match(filename):
+                self.levels.append(parts)
+                self.filenames.append(filename)
+                self.abspaths.append(os.path.join(dirpath, filename))
+
+    @property
+    def depth(self):
+        """ The deepest level of hierarchy
+        """
+        if not len(self):
+            return 0
+        return max(len(parts) for parts in self.levels)
+
+    def to_dataframe(self, depth=None):
+        """ Build DataFrame at once, the hierarchy is located at integer columns (0, 1, 2, ...)
+        and the level which is not existing is filled with NaN
+
+        :param depth: number of hierarchy columns, the deepest level of records is used if not given
+        :return: pandas.DataFrame
+        """
+        if not len(self):
+            return pd.DataFrame()
+        if depth is None:
+            depth = self.depth
+        data = dict()
+        for i in range(depth):
+            data[i] = [parts[i] if len(parts) > i else np.nan for parts in self.levels]
+        data['Filename'] = self.filenames
+        data['Abspath'] = self.abspaths
+        return pd.DataFrame(data, columns=list(range(depth)) + ['Filename', 'Abspath'])
+
+
+def scan_tree(prj_path, dc_path, workers=1, pruning=None):
+    """ Scan all files under the dataclass folder into columnar records
+
+    :param prj_path: project root path
+    :param dc_path: dataclass folder path
+    :param workers: number of threads to list directories concurrently
+    :param pruning: function to take the entries of sub-tree without walking (see 'walk_tree')
+    :return: TreeRecords
+    """
+    records = TreeRecords()
+    for dirpath, files, stamp in walk_tree(dc_path, workers, pruning):
+        records.stamps[dirpath] = stamp
+        if files:
+            records.append_dir(prj_path, dirpath, files)
+    return records
+
+
+def update_tree(prj_path, dc_path, stamps, workers=1, pruning=None):
+    """ Re-list only the directories changed since the last scan
+    Every known directory is checked with single stat call, and the directory is re-listed only if its
+    modified time is different from the stamp, the sub-directories of unchanged directory are taken from the stamps.
+    If 'workers' > 1, the directories of each level are checked concurrently (see 'mapping_levels'),
+    and the sub-tree of unchanged directory is not checked if 'pruning' returns its entries (see 'walk_tree')
+
+    :param prj_path: project root path
+    :param dc_path: dataclass folder path
+    :param stamps: dict of {dirpath: (mtime, n_entries)} at the last scan
+    :param workers: number of threads
+    :param pruning: function takes the directory path, returns list of entries or None
+    :return: TreeRecords of re-listed directories, list of re-listed directories, list of removed directories
+    """
+    children = dict()
+    for path in stamps.keys():
+        children.setdefault(os.path.dirname(path), []).append(path)
+
+    def descendants(top):
+        prefix = top + os.sep
+        return [top] + [path for path in stamps.keys() if path.startswith(prefix)]
+
+    def checking(path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None, []
+        stamp = stamps.get(path)
+        if stamp is not None and stamp[0] == mtime:
+            if pruning is not None and pruning(path) is not None:
+                return (mtime, None), []
+            return (mtime, None), children.get(path, [])
+        try:
+            files, dirs = listing_dir(path)
+        except OSError:
+            return None, []
+        return (mtime, files, dirs), [os.path.join(path, d) for d in dirs]
+
+    records = TreeRecords()
+    relisted = []
+    removed = []
+    for path, checked in mapping_levels(checking, dc_path, workers):
+        if checked is None:
+            removed.extend(descendants(path))
+        elif checked[1] is not None:
+            mtime, files, dirs = checked
+            records.stamps[path] = dir_stamp(mtime, len(files) + len(dirs))
+            relisted.append(path)
+            if files:
+                records.append_dir(prj_path, path, files)
+            subdirs = [os.path.join(path, d) for d in dirs]
+            for old in children.get(path, []):
+                if old not in subdirs:
+                    removed.extend(descendants(old))
+    return records, relisted, sorted(set(removed))
+
+
+def relisting_tree(prj_path, dc_path, stamps, dirs, pruning=None):
+    """ Re-list only the given directories (e.g. reported by the watcher), the other known directories are not checked.
+    The sub-directories which are not in the stamps are walked (new sub-tree), and the known sub-directories
+    which are not existing anymore are removed with their sub-tree
+
+    :param prj_path: project root path
+    :param dc_path: dataclass folder path
+    :param stamps: dict of {dirpath: (mtime, n_entries)} at the last scan
+    :param dirs: list of changed directories, the directories outside of the dataclass folder are ignored
+    :param pruning: function takes the directory path, returns list of entries or None (see 'walk_tree')
+    :return: TreeRecords of re-listed directories, list of re-listed directories, list of removed directories
+    """
+    children = dict()
+    for path in stamps.keys():
+        children.setdefault(os.path.dirname(path), []).append(path)
+
+    def descendants(top):
+        prefix = top + os.sep
+        return [top] + [path for path in stamps.keys() if path.startswith(prefix)]
+
+    prefix = dc_path + os.sep
+    records = TreeRecords()
+    relisted = []
+    removed = []
+    visited = set()
+    for path in sorted(set(d for d in dirs if d == dc_path or d.startswith(prefix))):
+        if path in visited:
+            continue
+        visited.add(path)
+        listed = listing_stamp(path)
+        if listed is None:
+            if path in stamps:
+                removed.extend(descendants(path))
+            continue
+        files, subdirs, stamp = listed
+        records.stamps[path] = stamp
+        relisted.append(path)
+        if files:
+            records.append_dir(prj_path, path, files)
+        subdirs = [os.path.join(path, d) for d in subdirs]
+        for old in children.get(path, []):
+            if old not in subdirs:
+                removed.extend(descendants(old))
+        for subdir in subdirs:
+            if subdir in stamps or subdir in visited:
+                continue
+            for dirpath, sub_files, sub_stamp in walk_tree(subdir, pruning=pruning):
+                visited.add(dirpath)
+                records.stamps[dirpath] = sub_stamp
+                relisted.append(dirpath)
+                if sub_files:
+                    records.append_dir(prj_path, dirpath, sub_files)
+    return records, relisted, sorted(set(removed))
@@ -0,0 +1,327 @@
+"""
+Thread and memory budget of step execution
+The cores of the machine are treated as a budget, each shell command declares (or is inferred) its number of threads
+and it is admitted only while the sum of the threads of running commands fits in the budget.
+The command is executed with OMP_NUM_THREADS and ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS of its threads,
+so the multi-threaded tools (AFNI, ANTs) do not take all cores in each parallel task.
+In the same way, the launch of the command is delayed while its peak memory (declared, or learned from the previous
+runs) does not fit in the memory budget or in the available memory of the machine.
+"""
+import os
+import re
+import json
+import shlex
+import threading
+import multiprocessing
+from subprocess import PIPE, Popen
+from contextlib import contextmanager
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+THREAD_ENVIRONS = ['OMP_NUM_THREADS', 'ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS']
+
+# option of the tools to set the number of threads
+THREAD_OPTIONS = {'antsSyN': '-n',
+                  'antsRegistrationSyN.sh': '-n',
+                  'antsRegistrationSyNQuick.sh': '-n',
+                  'onesample_ttest': '-j',
+                  '3dMEMA': '-jobs'}
+
+# I/O bound tools, which are not counted in the thread budget
+LIGHTWEIGHT_TOOLS = ['3dinfo', '3dcopy', '3drefit', '3dNotes', '1d_tool.py', 'nifti_tool',
+                     'cp', 'mv', 'ln', 'rm', 'mkdir']
+
+
+def infer_threads(command, default=1):
+    """ Infer the number of threads of the command from the thread option of the tool
+
+    :param command: str, rendered shell command
+    :param default: int, number of threads of unknown tools
+    :return: int, number of threads (0 for lightweight tools)
+    """
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        return default
+    if not args:
+        return 0
+    tool = os.path.basename(args[0])
+    if tool in LIGHTWEIGHT_TOOLS:
+        return 0
+    option = THREAD_OPTIONS.get(tool)
+    if option in args:
+        i = args.index(option)
+        if i + 1 < len(args) and args[i + 1].isdigit():
+            return max(int(args[i + 1]), 1)
+    return default
+
+
+def thread_environ(threads, environ=None):
+    """ Environment variables of the command for given number of threads
+
+    :param threads: int, number of threads
+    :param environ: dict, base environment (default: os.environ)
+    :return: dict
+    """
+    env = dict(os.environ if environ is None else environ)
+    for key in THREAD_ENVIRONS:
+        env[key] = str(max(threads, 1))
+    return env
+
+
+def parse_size(size):
+    """ Convert the size of memory into bytes
+
+    :param size: int (bytes) or str with unit (e.g. '512M', '8G')
+    :return: int, bytes
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    matched = re.match(r'^\s*([0-9.]+)\s*([KMGT]?)B?\s*$', str(size).upper())
+    if matched is None:
+        raise ValueError('Wrong size of memory: {}'.format(size))
+    value, unit = matched.groups()
+    return int(float(value) * 1024 ** ' KMGT'.index(unit or ' '))
+
+
+def available_memory():
+    """ Available memory of the machine, None if psutil is not installed
+    """
+    return psutil.virtual_memory().available if psutil is not None else None
+
+
+def process_memory(process):
+    """ Resident memory of the process and its children
+
+    :param process: psutil.Process
+    :return: int, bytes
+    """
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+def measured_shell(cmd, env=None, interval=0.2):
+    """ Execute shell command and sample its peak memory, same as methods.execute
+
+    :param cmd: str, command to execute
+    :param env: dict, environment variables of the command (default: inherited)
+    :param interval: sampling interval (seconds)
+    :return: stdout, error, exit status, peak memory (bytes)
+    """
+    try:
+        processor = Popen(shlex.split(cmd), stdout=PIPE, stderr=PIPE, env=env)
+    except OSError:
+        return None, None, None, 0
+    peak = [0]
+    finished = threading.Event()
+
+    def sampling():
+        try:
+            process = psutil.Process(processor.pid)
+            while not finished.is_set():
+                peak[0] = max(peak[0], process_memory(process))
+                finished.wait(interval)
+        except psutil.Error:   # the process is finished
+            pass
+
+    sampler = threading.Thread(target=sampling)
+    sampler.daemon = True
+    sampler.start()
+    out, err = processor.communicate()
+    finished.set()
+    sampler.join()
+    return out, err, processor.returncode, peak[0]
+
+
+class MemoryProfile(object):
+    """ Peak memory of the commands learned from the previous runs
+    The peaks are appended to the profile file as json lines, so the workers (threads or processes)
+    can record them without locking. The profile is compacted into the largest peak of each command when it is loaded
+    """
+    def __init__(self, path):
+        """ Initiate profile
+
+        :param path: path of profile file
+        """
+        self.path = path
+        self.peaks = dict()
+
+    def load(self):
+        """ Load and compact the profile
+
+        :return: dict, command to peak memory (bytes)
+        """
+        peaks = dict()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        key, peak = json.loads(line)
+                    except ValueError:
+                        continue
+                    peaks[key] = max(peak, peaks.get(key, 0))
+        except (IOError, OSError):
+            pass
+        self.peaks = peaks
+        if peaks:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps([key, peak]) + '\n' for key, peak in sorted(peaks.items()))
+            os.rename(tmp_path, self.path)
+        return peaks
+
+    def get(self, key):
+        return self.peaks.get(key)
+
+    def record(self, key, peak):
+        """ Record the peak memory of the command
+
+        :param key: str, command pattern
+        :param peak: int, bytes
+        """
+        if peak and peak > self.peaks.get(key, 0):
+            self.peaks[key] = peak
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps([key, peak]) + '\n')
+            except (IOError, OSError):
+                pass
+
+
+class Budget(object):
+    """ Budget shared by the workers of a step run, the demand is admitted while it fits in the capacity.
+    The demand which is larger than the capacity is admitted when nothing else is running
+
+    The budget is shared across the worker processes if the context of multiprocessing is given,
+    it can be sent to the worker processes only when they are started (e.g. initializer of process pool)
+    """
+    interval = None     # seconds to check again the demand, if the condition is not only changed by the workers
+
+    def __init__(self, capacity, context=None):
+        """ Initiate budget
+
+        :param capacity: int, capacity of the budget
+        :param context: multiprocessing context (or module) to share the budget across processes
+        """
+        self.capacity = capacity
+        self.shared = context is not None
+        if self.shared:
+            self.__condition = context.Condition()
+            self.__used = context.Value('l', 0, lock=False)
+        else:
+            self.__condition = threading.Condition()
+            self.__used = None
+        self.__local = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if not self.shared:     # threading budget can't be shared, the copy has its own budget
+            state['_Budget__condition'] = None
+            state['_Budget__local'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not self.shared:
+            self.__condition = threading.Condition()
+
+    def __repr__(self):
+        return '{0}({1}/{2})'.format(self.__class__.__name__, self.used, self.capacity)
+
+    @property
+    def used(self):
+        return self.__used.value if self.shared else self.__local
+
+    def __add(self, amount):
+        if self.shared:
+            self.__used.value += amount
+        else:
+            self.__local += amount
+
+    def fits(self, amount):
+        return self.used + amount <= self.capacity
+
+    def acquire(self, amount):
+        """ Wait until the demand fits in the budget
+
+        :param amount: demand of the command
+        :return: acquired amount
+        """
+        amount = min(amount, self.capacity)
+        with self.__condition:
+            while self.used and not self.fits(amount):
+                self.__condition.wait(self.interval)
+            self.__add(amount)
+        return amount
+
+    def release(self, amount):
+        with self.__condition:
+            self.__add(-amount)
+            self.__condition.notify_all()
+
+    @contextmanager
+    def reserve(self, amount):
+        """ Context of the command running with given demand
+
+        :param amount: demand of the command
+        """
+        amount = self.acquire(amount)
+        try:
+            yield amount
+        finally:
+            self.release(amount)
+
+
+@contextmanager
+def reserving(budget, amount):
+    """ Reserve the demand in the budget, nothing is reserved if the budget is None
+
+    :param budget: Budget or None
+    :param amount: demand of the command
+    """
+    if budget is None:
+        yield amount
+    else:
+        with budget.reserve(amount) as amount:
+            yield amount
+
+
+class ThreadBudget(Budget):
+    """ Budget of threads, the capacity is the number of cores
+    """
+    def __init__(self, capacity=None, context=None):
+        super(ThreadBudget, self).__init__(capacity or multiprocessing.cpu_count(), context=context)
+
+
+class MemoryBudget(Budget):
+    """ Budget of memory (bytes), the command is also delayed while its peak memory is larger than
+    the available memory of the machine, which is checked every 'interval' seconds
+    """
+    def __init__(self, capacity=None, interval=1.0, context=None):
+        """ Initiate budget
+
+        :param capacity: bytes, or str with unit (e.g. '16G'), or float for the fraction of available memory
+                         (default: 90% of available memory)
+        :param interval: seconds to check the available memory again
+        :param context: multiprocessing context (or module) to share the budget across processes
+        """
+        if capacity is None or isinstance(capacity, float) and capacity <= 1:
+            available = available_memory()
+            if available is None:
+                raise EnvironmentError('psutil is required to estimate the memory budget')
+            capacity = int(available * (capacity or 0.9))
+        super(MemoryBudget, self).__init__(parse_size(capacity), context=context)
+        self.interval = interval
+
+    def fits(self, amount):
+        if not super(MemoryBudget, self).fits(amount):
+            return False
+        available = available_memory()
+        return available is None or amount <= available
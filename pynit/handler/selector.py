@@ -0,0 +1,292 @@
+"""
+Indexed filter engine
+"""
+import re
+import threading
+import numpy as np
+import pandas as pd
+from collections import namedtuple, OrderedDict
+
+_max_patterns = 64      # maximum number of filename patterns to keep the matched mask
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize', 'generation'])
+
+
+def hierarchy_columns(dc_idx):
+    """ Columns of the hierarchical filters [subjects, sessions, dtypes(or pipelines), steps(or results)]
+
+    :param dc_idx: index of dataclass
+    :return: list of column names (None if the filter is not used for the dataclass)
+    """
+    if dc_idx == 0:
+        return ['Subject', 'Session', 'DataType', None]
+    elif dc_idx == 1:
+        return ['Subject', 'Session', 'Pipeline', 'Step']
+    else:
+        return ['Subject', 'Session', 'Pipeline', 'Report']
+
+
+def splitting_ext(filename):
+    """ Extension of filename, which is the suffix from the first dot (whole filename if there is no dot)
+
+    :param filename: str
+    :return: str
+    """
+    idx = filename.find('.')
+    if idx < 0:
+        return filename
+    return filename[idx:]
+
+
+class FilterIndex(object):
+    """ Inverted index of the scanned DataFrame of dataclass
+
+    Each hierarchical column is stored as categorical codes with the sorted row positions of each value,
+    so the equality filters are evaluated by looking up the positions of the shortest filter
+    and checking the codes of the others on these rows only.
+    The extension of each filename is also stored as code to evaluate the 'ext' filter without regex on every row,
+    and the matched mask of 'file_tag' and 'ignore' patterns is kept after the first evaluation.
+    The index is built lazily for each column, and must be re-created if the DataFrame is changed.
+    """
+    def __init__(self, df, dc_idx):
+        """ Initiate index
+
+        :param df: scanned DataFrame of dataclass
+        :param dc_idx: index of dataclass
+        """
+        self.df = df
+        self.dc_idx = dc_idx
+        self.__columns = dict()     # column: (codes, categories, {value: code})
+        self.__postings = dict()    # column: list of row positions of each code
+        self.__ext = None           # (codes, categories)
+        self.__ext_luts = dict()    # pattern: (lookup table of extension codes, matched rows)
+        self.__masks = dict()       # pattern: boolean mask of filenames
+
+    def __len__(self):
+        return len(self.df)
+
+    def codes(self, column):
+        """ Categorical codes of the column (-1 for the missing value)
+
+        :param column: name of column
+        :return: numpy.ndarray, list of categories, dict of {value: code}
+        """
+        if column not in self.__columns:
+            values = self.df[column]
+            if hasattr(values, 'cat'):
+                # Compact form, the categories of scanned DataFrame are sorted and all used
+                codes, categories = values.cat.codes.values, list(values.cat.categories)
+            else:
+                codes, categories = pd.factorize(values.values, sort=True)
+                categories = list(categories)
+            self.__columns[column] = (codes, categories, dict((v, i) for i, v in enumerate(categories)))
+        return self.__columns[column]
+
+    def postings(self, column):
+        """ Sorted row positions of each category of the column
+
+        :param column: name of column
+        :return: list of numpy.ndarray
+        """
+        if column not in self.__postings:
+            codes, categories, _ = self.codes(column)
+            order = np.argsort(codes, kind='mergesort')
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+            order = order[len(codes) - counts.sum():]
+            self.__postings[column] = np.split(order, np.cumsum(counts)[:-1])
+        return self.__postings[column]
+
+    def positions(self, column, values):
+        """ Row positions which have one of the values in the column
+
+        :param column: name of column
+        :param values: list of values
+        :return: sorted numpy.ndarray
+        """
+        _, _, lookup = self.codes(column)
+        postings = self.postings(column)
+        selected = [postings[lookup[v]] for v in set(values) if v in lookup]
+        if not selected:
+            return np.array([], dtype=np.intp)
+        elif len(selected) == 1:
+            return selected[0]
+        return np.sort(np.concatenate(selected))
+
+    def values(self, column, rows=None):
+        """ Sorted unique values of the column in the given rows
+
+        :param column: name of column
+        :param rows: row positions, all rows if not given
+        :return: list of values
+        """
+        codes, categories, _ = self.codes(column)
+        if rows is None:
+            return categories[:]
+        return [categories[c] for c in np.unique(codes[rows]) if c >= 0]
+
+    def __matching(self, column, values, rows):
+        """ Return the rows which have one of the values in the column
+        """
+        codes, categories, lookup = self.codes(column)
+        lut = np.zeros(len(categories) + 1, dtype=bool)
+        for v in values:
+            if v in lookup:
+                lut[lookup[v] + 1] = True
+        return rows[lut[codes[rows].astype(np.intp) + 1]]
+
+    def __ext_matching(self, ext, rows=None):
+        """ Return the rows which the filename ends with one of the extensions, all rows are checked
+        if 'rows' is not given and the result is kept for the extensions
+        """
+        if self.__ext is None:
+            exts = [splitting_ext(f) for f in self.df['Filename'].values]
+            self.__ext = pd.factorize(np.array(exts, dtype=object))
+        codes, categories = self.__ext
+        pattern = '|'.join([r"{ext}$".format(ext=e) for e in ext])
+        if pattern not in self.__ext_luts:
+            lut = np.array([re.search(pattern, c) is not None for c in categories], dtype=bool)
+            self.__ext_luts[pattern] = (lut, np.flatnonzero(lut[codes]))
+        lut, selected = self.__ext_luts[pattern]
+        if rows is None:
+            return selected
+        return rows[lut[codes[rows]]]
+
+    def __filename_mask(self, pattern, rows):
+        """ Boolean mask of the rows which the filename contains the pattern
+        """
+        if pattern not in self.__masks:
+            if len(self.__masks) >= _max_patterns:
+                self.__masks.clear()
+            self.__masks[pattern] = self.df['Filename'].str.contains(pattern).values.astype(bool)
+        return self.__masks[pattern][rows]
+
+    def select(self, filters, ext=None, rows=None):
+        """ Row positions selected by the filters
+
+        :param filters: filter list used in Project handler
+                        [subjects, sessions, datatypes(or pipelines), steps(or reports), file_tags, ignores]
+        :param ext: list of file extensions
+        :param rows: row positions to be filtered, all rows if not given
+        :return: sorted numpy.ndarray
+        """
+        if not len(self.df):
+            return np.array([], dtype=np.intp)
+        equals = [(column, values) for column, values in zip(hierarchy_columns(self.dc_idx), filters[:4])
+                  if values and column is not None and column in self.df.columns]
+        if rows is None:
+            if equals:
+                # Start from the shortest posting list
+                positions = [self.positions(column, values) for column, values in equals]
+                i = int(np.argmin([len(p) for p in positions]))
+                rows = positions[i]
+                equals.pop(i)
+            elif ext:
+                rows = self.__ext_matching(ext)
+                ext = None
+            else:
+                rows = np.arange(len(self.df))
+        for column, values in equals:
+            if not len(rows):
+                break
+            rows = self.__matching(column, values, rows)
+        if ext and len(rows):
+            rows = self.__ext_matching(ext, rows)
+        if filters[4] is not None and len(rows):
+            rows = rows[self.__filename_mask('|'.join(list(filters[4])), rows)]
+        if filters[5] is not None and len(rows):
+            rows = rows[~self.__filename_mask('|'.join(list(filters[5])), rows)]
+        return rows
+
+
+class QueryCache(object):
+    """ LRU cache of project queries
+
+    Each entry is tagged with its scope (the dataclass of query) and the scan generation of the project
+    at the time it is stored. When a scope is re-scanned, only the entries of the scope become stale,
+    and the entry of an old generation is regarded as a miss.
+    """
+    def __init__(self, maxsize=256):
+        """ Initiate cache
+
+        :param maxsize: maximum number of entries, the cache is disabled if 0
+        """
+        self.maxsize = maxsize
+        self.generation = 0
+        self.__entries = OrderedDict()
+        self.__expired = dict()     # generation when each scope is invalidated last
+        self.__floor = 0            # generation when all scopes are invalidated last
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def invalidate(self, scope=None):
+        """ Increase the scan generation, the stored entries of the scope become stale
+
+        :param scope: scope of entries (e.g. index of dataclass), all entries if not given
+        """
+        with self.__lock:
+            self.generation += 1
+            if scope is None:
+                self.__floor = self.generation
+                self.__expired.clear()
+                self.__entries.clear()
+            else:
+                self.__expired[scope] = self.generation
+                for key in [key for key, entry in self.__entries.items() if entry[0] == scope]:
+                    del self.__entries[key]
+
+    def __stale(self, scope, generation):
+        """ True if the scope is invalidated after the generation
+        """
+        return generation < max(self.__floor, self.__expired.get(scope, 0))
+
+    def get(self, key):
+        """ Return the stored value of the key, None if it is not stored or stale
+
+        :param key: hashable normalized query
+        :return: stored value or None
+        """
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None or self.__stale(entry[0], entry[1]):
+                self.__misses += 1
+                return None
+            self.__entries[key] = entry
+            self.__hits += 1
+            return entry[2]
+
+    def put(self, key, value, generation, scope=None):
+        """ Store the value of the key
+
+        :param key: hashable normalized query
+        :param value: result of query
+        :param generation: scan generation when the query is started
+        :param scope: scope of entry (e.g. index of dataclass)
+        """
+        if not self.maxsize:
+            return
+        with self.__lock:
+            if self.__stale(scope, generation):
+                return
+            self.__entries.pop(key, None)
+            self.__entries[key] = (scope, generation, value)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        """ Remove all entries and reset the statistics
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+    def info(self):
+        """ Statistics of cache
+
+        :return: CacheInfo(hits, misses, maxsize, currsize, generation)
+        """
+        return CacheInfo(self.__hits, self.__misses, self.maxsize, len(self.__entries), self.generation)
@@ -9,7 +9,7 @@ class Step(BaseProcessor):
     The fundamental mechanism is that by applying given inputs, outputs, and command, this class generating
     customized function and executed it.
     """
-    def __init__(self, procobj, n_thread='max'):
-        super(Step, self).__init__(procobj, n_thread=n_thread)
+    def __init__(self, procobj, n_thread='max', executor='thread'):
+        super(Step, self).__init__(procobj, n_thread=n_thread, executor=executor)
 
 
@@ -0,0 +1,194 @@
+"""
+Filesystem watcher to keep the project index current
+Linux inotify is used where available (through ctypes), otherwise the tree is polled periodically.
+The events are coalesced and the callback is called once for each burst of changes, with the changed directories.
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from .scanner import walk_tree
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_mask = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_event = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """ Minimal inotify binding, the directories are watched one by one (inotify is not recursive)
+    """
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        try:
+            self.__add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'inotify is not supported by libc')
+        self.__add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.paths = dict()         # watch descriptor to directory path
+
+    def add(self, path):
+        """ Watch the directory, return False if it can't be watched (removed, or out of watches)
+        """
+        encoded = path.encode(sys.getfilesystemencoding()) if not isinstance(path, bytes) else path
+        wd = self.__add_watch(self.fd, encoded, _mask)
+        if wd < 0:
+            return False
+        self.paths[wd] = path
+        return True
+
+    def read(self, timeout):
+        """ Wait for the events up to timeout (seconds)
+
+        :return: list of (directory path, mask, name), None if the event queue is overflowed
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        overflow = False
+        i = 0
+        while i + _event.size <= len(buf):
+            wd, mask, _, length = _event.unpack_from(buf, i)
+            name = buf[i + _event.size:i + _event.size + length].rstrip(b'\0')
+            i += _event.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+            elif wd in self.paths:
+                if not isinstance(name, str):
+                    name = name.decode(sys.getfilesystemencoding())
+                events.append((self.paths[wd], mask, name))
+        return None if overflow else events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TreeWatcher(threading.Thread):
+    """ Background thread to watch the directory trees, the callback is called when the trees are changed
+    The events are coalesced until no more event comes for 'latency' seconds, and the callback is called
+    with the list of directories where the events are occurred.
+    If inotify is not available (or 'polling' is True, or the event queue is overflowed), the callback is called
+    with None (every 'interval' seconds for polling) and it should detect the changes itself
+    (e.g. comparing the modified time of directories)
+    """
+    def __init__(self, roots, callback, interval=1.0, latency=0.5, polling=False):
+        super(TreeWatcher, self).__init__()
+        self.daemon = True
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.callback = callback
+        self.interval = interval
+        self.latency = latency
+        self.error = None           # last exception raised by the callback (or the watcher itself)
+        self.__stopped = threading.Event()
+        self.ready = threading.Event()      # set when all directories are watched (or polling is started, or failed)
+        self.__inotify = None
+        if not polling:
+            try:
+                self.__inotify = Inotify()
+            except OSError:
+                self.__inotify = None
+
+    @property
+    def mode(self):
+        return 'polling' if self.__inotify is None else 'inotify'
+
+    def stop(self, wait=True):
+        self.__stopped.set()
+        if wait and self.is_alive() and self is not threading.current_thread():
+            self.join()
+
+    def __watching(self, top):
+        """ Watch all directories under the top, return False if any of them can't be watched
+        """
+        watched = True
+        for dirpath, _, _ in walk_tree(top):
+            watched = self.__inotify.add(dirpath) and watched
+        return watched
+
+    def __calling(self, dirs=None):
+        try:
+            self.callback(dirs)
+        except Exception as e:
+            self.error = e
+
+    def __polling(self):
+        while not self.__stopped.wait(self.interval):
+            self.__calling()
+
+    def run(self):
+        try:
+            if self.__inotify is not None:
+                try:
+                    if all([self.__watching(root) for root in self.roots]):
+                        self.ready.set()
+                        self.__notifying()
+                        return
+                finally:
+                    self.__inotify.close()
+                self.__inotify = None   # out of watches, fall back to polling
+            self.ready.set()
+            self.__polling()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def __notifying(self):
+        while not self.__stopped.is_set():
+            events = self.__inotify.read(self.interval)
+            if events == []:
+                continue
+            # Coalescing the burst of events
+            dirs = set()
+            while not self.__stopped.is_set():
+                if events is None:
+                    # Overflowed, some created directories may not be watched yet and the changes are not known
+                    for root in self.roots:
+                        self.__watching(root)
+                    dirs = None
+                else:
+                    for path, mask, name in events:
+                        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                            changed = [path, os.path.dirname(path)]
+                        elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                            self.__watching(os.path.join(path, name))
+                            changed = [path, os.path.join(path, name)]
+                        else:
+                            changed = [path]
+                        if dirs is not None:
+                            dirs.update(changed)
+                events = self.__inotify.read(self.latency)
+                if events == []:
+                    break
+            self.__calling(sorted(dirs) if dirs is not None else None)
@@ -4,6 +4,7 @@ from shutil import copy
 from pynit.tools import messages
 from pynit.tools import methods
 from pynit.handler.project import Project
+from pynit.handler.scanner import walk_tree
 from pynit.pipelines import pipelines
 from pynit.process import Process
 from ..tools import progressbar, display, clear_output, HTML as title, display_html
@@ -258,16 +259,23 @@ class Pipelines(object):
                         pass
             del inspect
 
-    def run(self, idx, **kwargs):
+    def run(self, idx, resume=False, **kwargs):
         """Execute selected pipeline
 
         :param idx: index of available pipeline
+        :param resume: if True, each step executes only its unfinished tasks (e.g. after crash or reboot)
         :type idx: int
+        :type resume: bool
         :return:
         """
         self.set_param(**kwargs)
         display(title('---=[[[ Running "{}" pipeline ]]]=---'.format(self.selected.avail[idx])))
-        exec('self.selected.pipe_{}()'.format(self.selected.avail[idx]))
+        proc = self.get_proc()
+        proc._resume = resume
+        try:
+            exec('self.selected.pipe_{}()'.format(self.selected.avail[idx]))
+        finally:
+            proc._resume = False
 
     def get_proc(self):
         if self._proc:
@@ -297,11 +305,9 @@ class Pipelines(object):
                 if len(overlapped):
                     if verbose:
                         print('Notice: existing path')
-                    checked_files = []
-                    for f in os.walk(os.path.join(processing_path, overlapped[0])):
-                        checked_files.extend(f[2])
-                    if len(checked_files):
-                        if verbose:
+                    if verbose:
+                        # stop walking at the first directory which has any file
+                        if any(files for _, files, _ in walk_tree(os.path.join(processing_path, overlapped[0]))):
                             print('Notice: Last step path is not empty')
                     return overlapped[0]
                 else:
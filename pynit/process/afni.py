@@ -1,7 +1,6 @@
 from base import *
 from pynit.handler.images import TempFile, Template
 from pynit.handler.step import Step
-import multiprocessing
 
 
 class AFNI_Process(BaseProcess):
@@ -40,12 +39,14 @@ class AFNI_Process(BaseProcess):
             cmd01 = "3dvolreg -prefix {temp_01} -Fourier -verbose -base 0 {func}"
         step.set_cmd(cmd01)
         if cbv != None:
-            cmd02 = "3dinfo -nv {func}"
+            # only the image header is read, without building the project in the worker
+            step.set_module('pynit.handler.header', sub='reading_header')
+            cmd02 = "reading_header({func})[1]"
             step.set_var(name='bold', value='int(int(ttime)/3)', type=1)
             step.set_var(name='bold_output', value='methods.splitnifti(output)+"_BOLD.nii.gz"', type=1)
             step.set_var(name='cbv', value='int(int(ttime)*2/3)', type=1)
             step.set_var(name='cbv_output', value='methods.splitnifti(output)+"_CBV.nii.gz"', type=1)
-            step.set_cmd(cmd02, name='ttime')
+            step.set_cmd(cmd02, name='ttime', type=1)
             options = ['"[0..{bold}]"',
                        '"[{cbv}..$]"']
             cmd03 = "3dTstat -prefix {bold_output} -mean {temp_01}" + options[0]
@@ -1125,7 +1126,7 @@ class AFNI_Process(BaseProcess):
         step.set_output(name='output', dc=1, type=1, prefix='MEMA_1sampTtest')
         step.set_var(name='idx_coef', value=idx_coef)
         step.set_var(name='idx_tval', value=idx_tval)
-        step.set_var(name='jobs', value=multiprocessing.cpu_count())
+        step.set_var(name='jobs', value='threads_per_task')
         step.set_var(name='group', value='subj')
         cmd = 'onesample_ttest -i {func} -o {output} -b {idx_coef} -t {idx_tval} -j {jobs} -g {group}'
         step.set_cmd(cmd)
@@ -1,6 +1,5 @@
 from base import *
 from pynit.handler.step import Step
-import multiprocessing
 
 class ANTs_Process(BaseProcess):
     # def __init__(self, *args, **kwargs):
@@ -28,7 +27,7 @@ class ANTs_Process(BaseProcess):
         step = Step(self, n_thread=n_thread)
         step.set_input(name='meanfunc', path=meanfunc, idx=0)
         step.set_input(name='anat', path=anat, type=1, idx=0)
-        step.set_var(name='thread', value=multiprocessing.cpu_count())
+        step.set_var(name='thread', value='threads_per_task')
         step.set_output(name='prefix', ext='remove')
         cmd = 'antsSyN -f {anat} -m {meanfunc} -o {prefix} -n {thread}'
         step.set_cmd(cmd)
@@ -93,7 +92,7 @@ class ANTs_Process(BaseProcess):
         step.set_message('** Processing spatial normalization.....')
         step.set_input(name='anat', path=anat, idx=0)
         step.set_var(name='tmpobj', value=tmpobj.template_path)
-        step.set_var(name='thread', value=multiprocessing.cpu_count())
+        step.set_var(name='thread', value='threads_per_task')
         step.set_output(name='prefix', ext='remove')
         cmd = 'antsSyN -f {tmpobj} -m {anat} -o {prefix} -n {thread}'
         step.set_cmd(cmd)
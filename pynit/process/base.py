@@ -38,6 +38,7 @@ class BaseProcess(object):
         self._history = {}
         self._rhistory = {}
         self._tempfiles = []
+        self._resume = False    # resume mode of the steps (Pipelines.run)
         self._viewer = viewer
 
         # Update information
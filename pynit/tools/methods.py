@@ -23,22 +23,34 @@ def splitext(path):
     return str(path)
 
 
-def shell(cmd, logger=None):
+def shell(cmd, logger=None, env=None):
     """ Execute shell command
 
     :param cmd: str, command to execute
+    :param env: dict, environment variables of the command (default: inherited)
     :return: stdout, error
     """
+    out, err, _ = execute(cmd, logger=logger, env=env)
+    return out, err
+
+
+def execute(cmd, logger=None, env=None):
+    """ Execute shell command, same as shell but the exit status is also returned
+
+    :param cmd: str, command to execute
+    :param env: dict, environment variables of the command (default: inherited)
+    :return: stdout, error, exit status (None if the command can't be executed)
+    """
     try:
-        processor = Popen(shlex.split(cmd), stdout=PIPE, stderr=PIPE)
+        processor = Popen(shlex.split(cmd), stdout=PIPE, stderr=PIPE, env=env)
         if logger != None:
             logger.info("Shell::Success [{}]".format(cmd))
         out, err = processor.communicate()
-        return out, err
+        return out, err, processor.returncode
     except OSError as e:
         if logger != None:
             logger.info("Shell::Error [{}]".format(e))
-        return None, None
+        return None, None, None
 
 
 def get_logger(path, name):
@@ -98,7 +110,8 @@ def mkdir(*paths):
                     try:
                         os.mkdir(parentdir)
                     except:
-                        raiseerror(messages.InputPathError, '{} is not exists'.format(os.path.dirname(parentdir)))
+                        if not os.path.isdir(parentdir):    # not created by other worker at the same time
+                            raiseerror(messages.InputPathError, '{} is not exists'.format(os.path.dirname(parentdir)))
                 try:
                     os.mkdir(basedir)
                 except:
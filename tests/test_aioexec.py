@@ -0,0 +1,71 @@
+import os
+import asyncio
+import threading
+from pynit.handler.aioexec import AsyncBudget, AsyncExecutor, reserving, shell
+from pynit.handler.scheduler import ThreadBudget
+from pynit.handler.plan import Command
+from test_plan import making_plan, executed
+
+
+def test_reserving_limits_amount_to_capacity():
+    async def reserved():
+        budget = AsyncBudget(ThreadBudget(4))
+        async with reserving(budget, 8) as amount:
+            used = budget.used
+        return amount, used, budget.used
+
+    async def unlimited():
+        async with reserving(None, 8) as amount:
+            return amount
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(reserved()) == (4, 4, 0)
+        assert loop.run_until_complete(unlimited()) == 8
+    finally:
+        loop.close()
+
+
+def test_executor_runs_chains(tmp_path):
+    plan, subj_path, log_dir = making_plan(tmp_path)
+    outputs = list(AsyncExecutor().imap_unordered(plan, plan.chains()))
+    assert outputs == [[[]], [[]], [[]]]
+    assert sorted(os.listdir(subj_path)) == ['file_0.txt', 'file_1.txt', 'file_2.txt']
+    assert executed(log_dir) == [0, 1, 2]
+
+
+
+def test_python_blocks_run_off_the_loop_thread(tmp_path):
+    plan, _, log_dir = making_plan(tmp_path, n_tasks=1)
+    plan.commands.append(Command(name=None, values=[], type=1, threads=None, memory=None,
+                                 command="import threading\nraise ValueError(threading.get_ident())"))
+    threads = []
+
+    def failed(task, e):        # failure is logged on the loop thread
+        threads.append((int(str(e)), threading.get_ident()))
+
+    plan.failed = failed
+    assert list(AsyncExecutor().imap_unordered(plan, plan.chains())) == [[]]
+    (block, loop), = threads
+    assert block != loop
+
+
+def test_shell_streams_lines_into_logger():
+    class Logger(object):
+        def __init__(self):
+            self.lines = []
+
+        def info(self, msg):
+            pass
+
+        def debug(self, msg):
+            self.lines.append(msg)
+
+    logger = Logger()
+    loop = asyncio.new_event_loop()
+    try:
+        out, err, code = loop.run_until_complete(shell("sh -c 'echo a; echo b 1>&2; printf c'", logger=logger))
+    finally:
+        loop.close()
+    assert (out, err, code) == (b'a\nc', b'b\n', 0)
+    assert sorted(logger.lines) == ['Shell::stderr [b]', 'Shell::stdout [a]', 'Shell::stdout [c]']
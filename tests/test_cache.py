@@ -0,0 +1,37 @@
+import os
+from pynit.handler.cache import StepCache, tool_fingerprint, hashing
+
+
+def executable(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+    return path
+
+
+def test_tool_fingerprint_follows_executable(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    path = executable(os.path.join(str(tmp_path), '3dcopy'), '#!/bin/sh\n')
+    fingerprint = tool_fingerprint('3dcopy')
+    assert fingerprint[:2] == ['3dcopy', path]
+    executable(path, '#!/bin/sh\necho reinstalled\n')
+    assert tool_fingerprint('3dcopy') != fingerprint
+    assert tool_fingerprint('missing_tool') == ['missing_tool', None, None, None]
+
+
+def test_step_cache_keeps_last_key(tmp_path):
+    cache = StepCache(str(tmp_path))
+    assert cache.load() == {}
+    assert not cache.exists
+    cache.record('task', None)
+    cache.record('task', hashing(['a']))
+    cache.record('other', hashing(['b']))
+
+    cache = StepCache(str(tmp_path))
+    cache.load()
+    assert cache.exists
+    assert cache.hit('task', hashing(['a']))
+    assert not cache.hit('task', hashing(['b']))
+    assert cache.finished('other')
+    with open(cache.path) as f:
+        assert len(f.readlines()) == 2     # compacted into the last key of each task
@@ -0,0 +1,17 @@
+import os
+import pandas as pd
+from pynit.handler.compact import compacting, expanding
+
+
+def test_compact_round_trip():
+    paths = ['/prj/Data/sub-00/anat/sub-00_T2w.nii.gz', '/prj/Data/sub-00/func/sub-00_bold.nii.gz',
+             '/prj/Data/sub-01/anat/sub-01_T2w.nii.gz']
+    df = pd.DataFrame(dict(Subject=['sub-00', 'sub-00', 'sub-01'], DataType=['anat', 'func', 'anat'],
+                           Filename=[os.path.basename(p) for p in paths], Abspath=paths),
+                      columns=['Subject', 'DataType', 'Filename', 'Abspath'])
+    compact = compacting(df)
+    assert list(compact.columns) == ['Subject', 'DataType', 'Filename', 'Dirpath']
+    assert list(compact.Dirpath.cat.categories) == sorted(set(os.path.dirname(p) for p in paths))
+    assert expanding(compact).equals(df)
+    assert expanding(compact.iloc[[2, 0]]).Abspath.tolist() == [paths[2], paths[0]]
+    assert expanding(compact.iloc[0:0]).empty
@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import nibabel as nib
+from pynit.handler import header
+from pynit.handler.header import reading_header, collecting_headers
+from pynit.handler.index import ProjectIndex
+
+
+def test_reading_header_counts_volumes(tmp_path):
+    path = os.path.join(str(tmp_path), 'sub-00_bold.nii.gz')
+    img = nib.Nifti1Image(np.zeros((2, 3, 4, 5), dtype=np.int16), np.eye(4))
+    img.header.set_zooms((1.0, 1.0, 2.0, 1.5))
+    img.to_filename(path)
+    dims, n_volumes, voxel_size, tr, datatype = reading_header(path)
+    assert (dims, n_volumes, voxel_size, tr, datatype) == ('2x3x4x5', 5, '1x1x2', 1.5, 'int16')
+
+
+def test_reading_header_of_broken_file(tmp_path):
+    path = os.path.join(str(tmp_path), 'broken.nii.gz')
+    open(path, 'w').close()
+    assert reading_header(path) == (None, None, None, None, None)
+
+
+def test_headers_are_cached_until_file_changes(tmp_path, monkeypatch):
+    paths = []
+    for i, n_volumes in enumerate([3, 7]):
+        path = os.path.join(str(tmp_path), 'sub-0{0}_bold.nii.gz'.format(i))
+        nib.Nifti1Image(np.zeros((2, 2, 2, n_volumes), dtype=np.int16), np.eye(4)).to_filename(path)
+        paths.append(path)
+    index = ProjectIndex(str(tmp_path))
+    read = []
+
+    def counting(path):
+        read.append(path)
+        return reading_header(path)
+
+    monkeypatch.setattr(header, 'reading_header', counting)
+    missing = os.path.join(str(tmp_path), 'missing.nii.gz')
+    assert [h.n_volumes for h in collecting_headers(index, paths + [missing], workers=2)] == [3, 7, None]
+    assert sorted(read) == paths
+    del read[:]
+    assert [h.n_volumes for h in collecting_headers(index, paths)] == [3, 7]
+    assert read == []
+    nib.Nifti1Image(np.zeros((2, 2, 2, 9), dtype=np.int16), np.eye(4)).to_filename(paths[1])
+    os.utime(paths[1], (0, 0))
+    assert [h.n_volumes for h in collecting_headers(index, paths)] == [3, 9]
+    assert read == [paths[1]]
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import pandas as pd
+from pynit.handler.index import ProjectIndex
+
+COLUMNS = ['Subject', 'DataType', 'Filename', 'Abspath']
+
+
+def frame(root, *names):
+    rows = []
+    for subj, filename in names:
+        rows.append([subj, 'anat', filename, os.path.join(str(root), 'Data', subj, 'anat', filename)])
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_store_and_load(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    anat = os.path.join(str(tmp_path), 'Data', 'sub-00', 'anat')
+    index.store(0, frame(tmp_path, ('sub-00', 'a.nii'), ('sub-01', 'b.nii')), True, stamps={anat: (1.0, 1)})
+    assert index.status(0) == (True, False)
+    assert index.status(1) is None
+    assert index.stamps(0) == {anat: (1.0, 1)}
+    df = ProjectIndex(str(tmp_path)).load(0, COLUMNS)
+    assert df.Filename.tolist() == ['a.nii', 'b.nii']
+
+
+def test_patch_reports_changed_rows(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    index.store(0, frame(tmp_path, ('sub-00', 'a.nii'), ('sub-01', 'b.nii')), True, stamps={})
+    anat = os.path.join(str(tmp_path), 'Data', 'sub-00', 'anat')
+    assert index.patch(0, frame(tmp_path, ('sub-00', 'a.nii')), [anat], [], {anat: (2.0, 1)}) is False
+    assert index.patch(0, frame(tmp_path, ('sub-00', 'a.nii'), ('sub-00', 'c.nii')), [anat], [],
+                       {anat: (3.0, 2)}) is True
+    assert index.load(0, COLUMNS).Filename.tolist() == ['a.nii', 'c.nii', 'b.nii']
+    assert index.stamps(0)[anat] == (3.0, 2)
+    assert index.patch(0, frame(tmp_path), [], [anat], {}) is True
+    assert index.load(0, COLUMNS).Filename.tolist() == ['b.nii']
+
+
+def test_patch_returns_none_while_index_is_locked(tmp_path):
+    index = ProjectIndex(str(tmp_path), timeout=0.1)
+    index.store(0, frame(tmp_path, ('sub-00', 'a.nii')), True, stamps={})
+    other = sqlite3.connect(index.path)
+    other.execute('BEGIN EXCLUSIVE')
+    try:
+        anat = os.path.join(str(tmp_path), 'Data', 'sub-00', 'anat')
+        assert index.patch(0, frame(tmp_path), [anat], [], {anat: (1.0, 0)}) is None
+    finally:
+        other.rollback()
+        other.close()
+    assert index.load(0, COLUMNS).Filename.tolist() == ['a.nii']
@@ -0,0 +1,20 @@
+import os
+from pynit.handler.inputs import InputTable, Query
+from test_project import touching, filtered_project
+
+
+def test_inputs_are_partitioned_by_subject(tmp_path):
+    prj = filtered_project(tmp_path)
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-01', 'func', 'sub-01_bold.nii.gz'))
+    prj.reload()
+    table = InputTable(prj)
+    table.resolve('anat', Query(args=[0, 'anat'], kwargs=dict(), level=('Subject',)))
+    table.resolve('group', Query(args=[0], kwargs=dict(file_tag='bold'), level=()))
+    assert 'anat' in table
+    assert [record.Filename for record in table.get('anat', 'sub-01').records()] == ['sub-01_T2w.nii.gz']
+    assert len(table.get('anat', 'sub-02')) == 0
+    assert [record.Subject for record in table.get('group').records()] == ['sub-01']
+
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-01', 'anat', 'sub-01_T1w.nii.gz'))
+    prj.reload()
+    assert len(table.get('anat', 'sub-01')) == 1      # the table is not changed during the run
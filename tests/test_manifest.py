@@ -0,0 +1,45 @@
+import os
+from pynit.handler import scanner
+from pynit.handler.manifest import writing_manifest, trusted_manifest, removing_manifest, MANIFEST
+from pynit.handler.project import Project
+
+
+def touching(path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+
+def finished_step(root):
+    step = os.path.join(str(root), 'Processing', 'A_Pipeline', '010_Step')
+    touching(os.path.join(step, 'sub-00', 'sub-00_bold.nii.gz'))
+    writing_manifest(step)
+    return step
+
+
+def test_manifest_is_trusted_until_changed(tmp_path):
+    step = finished_step(tmp_path)
+    manifest = trusted_manifest(step)
+    assert manifest is not None
+    assert manifest['subjects'] == {'sub-00': []}
+    touching(os.path.join(step, 'sub-00', 'sub-00_mask.nii.gz'))
+    assert trusted_manifest(step) is None
+
+
+def test_removed_manifest_is_not_trusted(tmp_path):
+    step = finished_step(tmp_path)
+    removing_manifest(step)
+    assert not os.path.exists(os.path.join(step, MANIFEST))
+    assert trusted_manifest(step) is None
+
+
+def test_reload_lists_file_added_to_finished_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, '_racy_window', 0)
+    step = finished_step(tmp_path)
+    prj = Project(str(tmp_path))
+    assert prj.dataclass == 'Processing'
+    assert len(prj) == 1
+    touching(os.path.join(step, 'sub-00', 'sub-00_mask.nii.gz'))
+    prj.reload()
+    assert len(prj) == 2
+    assert sorted(prj.df.Filename) == ['sub-00_bold.nii.gz', 'sub-00_mask.nii.gz']
@@ -0,0 +1,227 @@
+import os
+import pickle
+import logging
+import multiprocessing
+import pytest
+from pynit.handler import plan as plan_module
+from pynit.handler.plan import (ExecutionPlan, ProcessContext, Command, Task, Unit, COMMITTED,
+                               initializing, executing)
+from pynit.handler.cache import StepCache
+from pynit.handler.scheduler import ThreadBudget
+
+BLOCK = "\n".join(["with open(output, 'w') as f:",
+                    "    f.write(str(i))",
+                    "open(os.path.join(log_dir, str(i)), 'w').close()",
+                    "if i == crash_at:",
+                    "    os._exit(3)"])
+
+
+class Proc(object):
+    logger = logging.getLogger('pynit.tests')
+
+
+class Process(Proc):
+    """ Attributes of Process which are taken by ProcessContext
+    """
+    def __init__(self, root):
+        self.prj = Proc()
+        self.prj.path = str(root)
+        self.processing = 'A_Pipeline'
+        self.path = os.path.join(str(root), 'Processing', self.processing)
+        self._rpath = os.path.join(str(root), 'Results', self.processing)
+        self.ext = ['.nii', '.nii.gz']
+        self.subjects = ['sub-00']
+        self.sessions = None
+
+
+def making_plan(root, crash_at=None, resume=False, n_tasks=3):
+    step = os.path.join(str(root), 'Processing', 'A_Pipeline', '010_Step')
+    log_dir = os.path.join(str(root), 'executed')
+    for path in [step, log_dir]:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    env = dict(__name__=__name__, os=os, log_dir=log_dir, crash_at=crash_at)
+    plan = ExecutionPlan(Proc(), env, [], [], [Command(name=None, command=BLOCK, values=[], type=1,
+                                                       threads=None, memory=None)])
+    subj_path = os.path.join(step, 'sub-00')
+    tasks = [Task(title=step, idx=0, subj='sub-00', sess=None, i=i, inputs={},
+                  values=dict(output=os.path.join(subj_path, 'file_{}.txt'.format(i))),
+                  mkdirs=[subj_path], checker=None, temps=[]) for i in range(n_tasks)]
+    plan.units.append(Unit(idx=0, subj='sub-00', sess=None, tasks=tasks))
+    plan.cache = StepCache(step)
+    plan.cache.load()
+    plan.resume = resume
+    plan.staging(os.path.join(str(root), '.staging', 'step'))
+    plan.clear_staging()
+    return plan, subj_path, log_dir
+
+
+def executed(log_dir):
+    names = sorted(int(name) for name in os.listdir(log_dir))
+    for name in os.listdir(log_dir):
+        os.remove(os.path.join(log_dir, name))
+    return names
+
+
+def test_chains_keep_tasks_of_shared_output_together(tmp_path):
+    plan, subj_path, _ = making_plan(tmp_path)
+    shared = Task(title='', idx=0, subj='sub-00', sess=None, i=0, inputs={},
+                  values=dict(output=os.path.join(subj_path, 'file_0.txt'), folder=subj_path),
+                  mkdirs=[], checker=None, temps=[])
+    plan.units[0].tasks.append(shared)
+    chains = plan.chains()
+    assert len(chains) == 3
+    assert chains[0] == [plan.units[0].tasks[0], shared]
+
+
+def test_outputs_are_committed_into_place(tmp_path):
+    plan, subj_path, log_dir = making_plan(tmp_path)
+    assert plan.execute_chain(list(plan)) == [[], [], []]
+    assert sorted(os.listdir(subj_path)) == ['file_0.txt', 'file_1.txt', 'file_2.txt']
+    assert not os.listdir(plan.stage_root)
+    assert executed(log_dir) == [0, 1, 2]
+    plan, _, log_dir = making_plan(tmp_path)
+    plan.execute_chain(list(plan))
+    assert executed(log_dir) == []      # all tasks are hit in the step cache
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='the crash is simulated in forked process')
+def test_resume_after_crash_runs_only_unfinished_tasks(tmp_path):
+    plan, subj_path, log_dir = making_plan(tmp_path, crash_at=1)
+    child = multiprocessing.get_context('fork').Process(target=plan.execute_chain, args=(list(plan),))
+    child.start()
+    child.join()
+    assert child.exitcode == 3
+    assert os.listdir(subj_path) == ['file_0.txt']     # the partial output of the crashed task is staged
+    assert executed(log_dir) == [0, 1]
+
+    plan, subj_path, log_dir = making_plan(tmp_path, resume=True)
+    assert not os.path.exists(plan.stage_root)
+    plan.execute_chain(list(plan))
+    assert executed(log_dir) == [1, 2]
+    assert sorted(os.listdir(subj_path)) == ['file_0.txt', 'file_1.txt', 'file_2.txt']
+
+
+def test_interrupted_commit_is_rolled_forward(tmp_path, monkeypatch):
+    plan, subj_path, log_dir = making_plan(tmp_path, n_tasks=1)
+    rename = os.rename
+
+    def failing(src, dst):
+        if os.path.basename(dst) == 'file_0.txt':
+            raise KeyboardInterrupt
+        return rename(src, dst)
+
+    monkeypatch.setattr(plan_module.os, 'rename', failing)
+    with pytest.raises(KeyboardInterrupt):
+        plan.execute_chain(list(plan))
+    monkeypatch.undo()
+    stage_dirs = os.listdir(plan.stage_root)
+    assert len(stage_dirs) == 1
+    assert os.path.isfile(os.path.join(plan.stage_root, stage_dirs[0], COMMITTED))
+    assert not os.listdir(subj_path)
+
+    plan, subj_path, log_dir = making_plan(tmp_path, n_tasks=1)
+    assert os.listdir(subj_path) == ['file_0.txt']
+    executed(log_dir)
+    plan.execute_chain(list(plan))
+    assert executed(log_dir) == []      # the rolled forward task is recorded in the step cache
+
+
+def test_failed_python_block_discards_staging(tmp_path):
+    plan, subj_path, log_dir = making_plan(tmp_path, n_tasks=2)
+    plan.commands.append(Command(name=None, command="raise ValueError(i)", values=[], type=1,
+                                 threads=None, memory=None))
+    assert plan.execute_chain(list(plan)) == []
+    assert executed(log_dir) == [0]     # the rest of chain is not executed
+    assert not os.listdir(subj_path)
+    assert not os.listdir(plan.stage_root)
+
+
+def test_render_describes_commands_and_tasks(tmp_path):
+    plan, subj_path, _ = making_plan(tmp_path, n_tasks=2)
+    plan.commands.append(Command(name=None, command="3dcopy {input} {output}", values=[('input', 'output')],
+                                 type=0, threads=None, memory=None))
+    rendered = plan.render().split('\n')
+    assert rendered[0] == repr(plan)
+    assert 'shell:   3dcopy {input} {output}' in rendered
+    assert '           input = output' in rendered
+    assert '           output = {0}'.format(os.path.join(subj_path, 'file_1.txt')) in rendered
+    assert len([line for line in rendered if line.startswith('task:')]) == 2
+
+
+def test_threads_per_task_is_resolved_at_run_time(tmp_path):
+    plan, _, _ = making_plan(tmp_path, n_tasks=1)
+    plan.variables.append(('thread', 'threads_per_task'))
+    task = plan.units[0].tasks[0]
+    assert plan.namespace(task)['thread'] == 1
+    plan.schedule(ThreadBudget(8), 4)
+    assert plan.namespace(task)['thread'] == 2
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='the workers inherit the test modules by fork')
+def test_plan_is_executed_in_process_pool(tmp_path):
+    plan, subj_path, log_dir = making_plan(tmp_path)
+    plan.proc = Process(tmp_path)
+    pool = multiprocessing.get_context('fork').Pool(2, initializer=initializing, initargs=(plan,))
+    try:
+        outputs = list(pool.imap_unordered(executing, plan.chains()))
+    finally:
+        pool.close()
+        pool.join()
+    assert outputs == [[[]], [[]], [[]]]
+    assert sorted(os.listdir(subj_path)) == ['file_0.txt', 'file_1.txt', 'file_2.txt']
+    assert executed(log_dir) == [0, 1, 2]
+    assert isinstance(pickle.loads(pickle.dumps(plan)).proc, ProcessContext)
+
+
+def unit_tasks(root, subj, outputs):
+    step = os.path.join(str(root), 'Processing', 'A_Pipeline', '010_Step')
+    return Unit(idx=0, subj=subj, sess=None, tasks=[
+        Task(title=step, idx=0, subj=subj, sess=None, i=i, inputs={},
+             values=dict(output=os.path.join(step, output)), mkdirs=[], checker=None, temps=[])
+        for i, output in enumerate(outputs)])
+
+
+def test_chains_flatten_tasks_of_all_subjects(tmp_path):
+    plan, _, _ = making_plan(tmp_path, n_tasks=0)
+    plan.units[:] = [unit_tasks(tmp_path, subj, ['{0}_{1}.txt'.format(subj, i) for i in range(2)])
+                     for subj in ['sub-00', 'sub-01']]
+    chains = plan.chains()
+    assert [len(chain) for chain in chains] == [1, 1, 1, 1]
+    assert [(chain[0].subj, chain[0].i) for chain in chains] == [('sub-00', 0), ('sub-00', 1),
+                                                                 ('sub-01', 0), ('sub-01', 1)]
+
+
+def test_multi_tasks_of_shared_output_are_serialized(tmp_path):
+    plan, _, _ = making_plan(tmp_path, n_tasks=0)
+    plan.units[:] = [unit_tasks(tmp_path, subj, ['MEMA_1sampTtest']) for subj in ['sub-00', 'sub-01']]
+    plan.units.append(unit_tasks(tmp_path, 'sub-02', ['sub-02_stats']))
+    chains = plan.chains()
+    assert [[task.subj for task in chain] for chain in chains] == [['sub-00', 'sub-01'], ['sub-02']]
+
+
+def test_sources_are_compiled_once(tmp_path):
+    plan, _, _ = making_plan(tmp_path, n_tasks=1)
+    code = plan.compiled('i + 1')
+    assert plan.compiled('i + 1') is code
+    assert plan.compiled('i + 1', 'exec') is not code
+    plan.proc = Process(tmp_path)
+    restored = pickle.loads(pickle.dumps(plan))     # code objects are compiled again in the other process
+    assert eval(restored.compiled('i + 1'), dict(i=1)) == 2
+
+
+def test_interpreter_yields_shell_commands(tmp_path):
+    plan, subj_path, _ = making_plan(tmp_path, n_tasks=1)
+    plan.commands[:] = [Command(name='listed', command='ls {folder}', values=[('folder', 'os.path.dirname(output)')],
+                                type=0, threads=2, memory=None),
+                        Command(name=None, command="result = listed.strip()", values=[], type=1,
+                                threads=None, memory=None)]
+    namespace = plan.namespace(plan.units[0].tasks[0])
+    namespace['stdout_collector'] = []
+    interpreter = plan.interpret(namespace)
+    launch = next(interpreter)
+    assert (launch.command, launch.threads, launch.key) == ('ls {0}'.format(subj_path), 2, 'ls {folder}')
+    with pytest.raises(StopIteration):
+        interpreter.send((' out\n', '', 0))
+    assert namespace['result'] == 'out'
+    assert namespace['stdout_collector'] == [(launch.command, ' out\n', '')]
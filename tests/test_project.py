@@ -0,0 +1,138 @@
+import os
+import time
+import pandas as pd
+from pynit.handler import project as project_module
+from pynit.handler.project import Project
+
+
+def touching(path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+
+def filtered_project(root):
+    for subj in ['sub-00', 'sub-01']:
+        touching(os.path.join(str(root), 'Data', subj, 'anat', '{}_T2w.nii.gz'.format(subj)))
+    prj = Project(str(root))
+    prj.set_filters('sub-00')
+    prj.apply()
+    return prj
+
+
+def test_refresh_keeps_filters(tmp_path):
+    prj = filtered_project(tmp_path)
+    assert len(prj) == 1
+    assert prj.refresh() is False
+    assert len(prj) == 1
+    assert prj.subjects == ['sub-00']
+    assert list(prj.df.Subject.unique()) == ['sub-00']
+
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-00', 'anat', 'sub-00_T1w.nii.gz'))
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-01', 'anat', 'sub-01_T1w.nii.gz'))
+    assert prj.refresh() is True
+    assert len(prj) == 2
+    assert list(prj.df.Subject.unique()) == ['sub-00']
+
+
+def test_polling_keeps_filters(tmp_path):
+    prj = filtered_project(tmp_path)
+    assert prj.watch(interval=0.1, polling=True) == 'polling'
+    try:
+        time.sleep(0.5)
+        assert len(prj) == 1
+        assert prj.subjects == ['sub-00']
+        assert list(prj.df.Subject.unique()) == ['sub-00']
+    finally:
+        prj.unwatch()
+
+
+def test_watcher_patches_changed_dirs(tmp_path):
+    prj = filtered_project(tmp_path)
+    prj.watch(interval=0.1, latency=0.1)
+    try:
+        touching(os.path.join(str(tmp_path), 'Data', 'sub-00', 'func', 'sub-00_bold.nii.gz'))
+        for _ in range(50):
+            if len(prj) == 2:
+                break
+            time.sleep(0.1)
+        assert len(prj) == 2
+        assert list(prj.df.Subject.unique()) == ['sub-00']
+    finally:
+        prj.unwatch()
+
+
+def test_rows_are_pandas_series(tmp_path):
+    prj = filtered_project(tmp_path)
+    prj.set_filters('sub-01')
+    prj.apply()
+    label, row = next(iter(prj))
+    assert isinstance(row, pd.Series)
+    assert row.Subject == 'sub-01'
+    assert prj[label].Abspath == row.Abspath
+    assert [record.Abspath for record in prj.records()] == [row.Abspath]
+
+
+def test_dataframe_columns_keep_object_dtype(tmp_path):
+    prj = filtered_project(tmp_path)
+    assert prj.df.Subject.dtype == object
+    assert list(prj.df.groupby('Subject').size().index) == ['sub-00']
+
+
+def test_reload_relists_changed_dirs_only(tmp_path, monkeypatch):
+    prj = filtered_project(tmp_path)
+
+    def scanning(*args, **kwargs):
+        raise AssertionError('the whole tree is scanned')
+
+    monkeypatch.setattr(project_module, 'scan_tree', scanning)
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-00', 'func', 'sub-00_bold.nii.gz'))
+    prj.reload()
+    assert len(prj) == 2
+    assert prj.subjects == ['sub-00']
+
+
+def test_dataclass_is_scanned_when_touched_first(tmp_path, monkeypatch):
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-00', 'anat', 'sub-00_T2w.nii.gz'))
+    touching(os.path.join(str(tmp_path), 'Processing', 'A_Pipeline', '010_Step', 'sub-00', 'sub-00_T2w.nii.gz'))
+    scanned = []
+    scan_tree = project_module.scan_tree
+
+    def scanning(prj_path, dc_path, **kwargs):
+        scanned.append(os.path.basename(dc_path))
+        return scan_tree(prj_path, dc_path, **kwargs)
+
+    monkeypatch.setattr(project_module, 'scan_tree', scanning)
+    prj = Project(str(tmp_path))
+    assert prj.dataclass == 'Processing'
+    assert 'Data' not in scanned
+    prj.dataclass = 0
+    assert scanned.count('Data') == 1
+    assert prj.subjects == ['sub-00']
+
+
+def test_views_share_the_scanned_frame(tmp_path):
+    prj = filtered_project(tmp_path)
+    touching(os.path.join(str(tmp_path), 'Data', 'sub-01', 'func', 'sub-01_bold.nii.gz'))
+    prj.reload()
+    view = prj(0, 'sub-01')
+    assert len(view) == 2
+    assert view.subjects == ['sub-01']
+    assert view.dtypes == ['anat', 'func']
+    chained = view('func')
+    assert list(chained.df.Filename) == ['sub-01_bold.nii.gz']
+    assert prj(0, 'sub-01') is view            # same query returns the cached view
+    assert len(prj) == 1                        # the filters of project are not changed
+
+
+def test_records_and_batch(tmp_path):
+    prj = filtered_project(tmp_path)
+    prj.set_filters()
+    prj.apply()
+    records = list(prj.records())
+    assert [record.Subject for record in records] == ['sub-00', 'sub-01']
+    assert records[1]['Filename'] == 'sub-01_T2w.nii.gz'
+    assert records[1].get('Missing') is None
+    batch = prj.batch('Subject', 'Abspath')
+    assert list(batch.Subject) == ['sub-00', 'sub-01']
+    assert list(batch.Abspath) == list(prj.df.Abspath)
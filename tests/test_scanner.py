@@ -0,0 +1,78 @@
+import os
+from pynit.handler import scanner
+from pynit.handler.scanner import scan_tree, update_tree, relisting_tree
+
+
+def touching(path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+
+def data_tree(root):
+    for subj in ['sub-00', 'sub-01']:
+        touching(os.path.join(str(root), 'Data', subj, 'anat', '{}_T2w.nii.gz'.format(subj)))
+    return os.path.join(str(root), 'Data')
+
+
+def test_relisting_tree_lists_only_given_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, '_racy_window', 0)
+    dc_path = data_tree(tmp_path)
+    stamps = scan_tree(str(tmp_path), dc_path).stamps
+    anat = os.path.join(dc_path, 'sub-00', 'anat')
+    touching(os.path.join(anat, 'sub-00_T1w.nii.gz'))
+    touching(os.path.join(dc_path, 'sub-02', 'func', 'sub-02_bold.nii.gz'))
+    records, relisted, removed = relisting_tree(str(tmp_path), dc_path, stamps, [anat, '/outside'])
+    assert relisted == [anat]
+    assert removed == []
+    assert sorted(records.filenames) == ['sub-00_T1w.nii.gz', 'sub-00_T2w.nii.gz']
+
+
+def test_relisting_tree_walks_new_and_removes_missing_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, '_racy_window', 0)
+    dc_path = data_tree(tmp_path)
+    stamps = scan_tree(str(tmp_path), dc_path).stamps
+    sub01 = os.path.join(dc_path, 'sub-01')
+    os.remove(os.path.join(sub01, 'anat', 'sub-01_T2w.nii.gz'))
+    os.rmdir(os.path.join(sub01, 'anat'))
+    os.rmdir(sub01)
+    touching(os.path.join(dc_path, 'sub-02', 'func', 'sub-02_bold.nii.gz'))
+    records, relisted, removed = relisting_tree(str(tmp_path), dc_path, stamps, [dc_path])
+    assert records.filenames == ['sub-02_bold.nii.gz']
+    assert os.path.join(dc_path, 'sub-02', 'func') in relisted
+    assert removed == [sub01, os.path.join(sub01, 'anat')]
+
+
+def test_update_tree_checks_all_known_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, '_racy_window', 0)
+    dc_path = data_tree(tmp_path)
+    stamps = scan_tree(str(tmp_path), dc_path).stamps
+    records, relisted, removed = update_tree(str(tmp_path), dc_path, stamps)
+    assert (len(records), relisted, removed) == (0, [], [])
+    anat = os.path.join(dc_path, 'sub-01', 'anat')
+    touching(os.path.join(anat, 'sub-01_T1w.nii.gz'))
+    records, relisted, removed = update_tree(str(tmp_path), dc_path, stamps)
+    assert relisted == [anat]
+    assert sorted(records.filenames) == ['sub-01_T1w.nii.gz', 'sub-01_T2w.nii.gz']
+
+
+def test_scan_tree_builds_hierarchy_columns(tmp_path):
+    dc_path = data_tree(tmp_path)
+    touching(os.path.join(dc_path, 'sub-00', 'anat', '.hidden'))
+    touching(os.path.join(dc_path, 'README'))
+    df = scan_tree(str(tmp_path), dc_path).to_dataframe()
+    assert list(df.columns) == [0, 1, 2, 'Filename', 'Abspath']
+    assert list(df.Filename) == ['README', 'sub-00_T2w.nii.gz', 'sub-01_T2w.nii.gz']
+    assert df[1].isnull().tolist() == [True, False, False]
+    assert df[0].tolist() == ['Data'] * 3
+    assert df.Abspath[1] == os.path.join(dc_path, 'sub-00', 'anat', 'sub-00_T2w.nii.gz')
+
+
+def test_parallel_walk_keeps_serial_order(tmp_path):
+    dc_path = data_tree(tmp_path)
+    for subj in ['sub-02', 'sub-10']:
+        for dtype in ['func', 'anat']:
+            touching(os.path.join(dc_path, subj, dtype, '{0}_{1}.nii.gz'.format(subj, dtype)))
+    serial = list(scanner.walk_tree(dc_path))
+    assert list(scanner.walk_tree(dc_path, workers=4)) == serial
+    assert [os.path.relpath(path, dc_path) for path, _, _ in serial][:3] == ['.', 'sub-00', 'sub-00/anat']
@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from pynit.handler import scheduler
+from pynit.handler.scheduler import (infer_threads, thread_environ, parse_size, reserving,
+                                     ThreadBudget, MemoryBudget, MemoryProfile)
+
+
+def test_infer_threads_from_tool_options():
+    assert infer_threads('antsSyN -f a.nii -m b.nii -o out -n 4') == 4
+    assert infer_threads('3dMEMA -jobs 2 -prefix out', default=3) == 2
+    assert infer_threads('3dinfo -nv a.nii', default=3) == 0
+    assert infer_threads('3dvolreg -prefix out a.nii', default=3) == 3
+    assert infer_threads('antsSyN -n max', default=3) == 3
+    assert thread_environ(0, environ=dict(PATH='/bin')) == dict(PATH='/bin', OMP_NUM_THREADS='1',
+                                                               ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS='1')
+
+
+def test_thread_budget_bounds_running_threads():
+    budget = ThreadBudget(4)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def command(threads):
+        with reserving(budget, threads) as reserved:
+            with lock:
+                running.append(reserved)
+                peak.append(sum(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(reserved)
+
+    workers = [threading.Thread(target=command, args=(n,)) for n in [2, 3, 2, 8, 1]]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert max(peak) == 4       # the command larger than the budget takes the whole budget
+    assert budget.used == 0
+
+
+def test_memory_budget_waits_for_available_memory(monkeypatch):
+    available = [parse_size('1G')]
+    monkeypatch.setattr(scheduler, 'available_memory', lambda: available[0])
+    budget = MemoryBudget('4G', interval=0.01)
+    assert budget.capacity == 4 * 1024 ** 3
+    assert budget.fits(parse_size('512M'))
+    assert not budget.fits(parse_size('2G'))        # fits in the budget, but not in the machine
+    with budget.reserve(parse_size('512M')):
+        admitted = []
+        waiting = threading.Thread(target=lambda: admitted.append(budget.acquire(parse_size('2G'))))
+        waiting.start()
+        time.sleep(0.05)
+        assert not admitted
+        available[0] = parse_size('8G')
+        waiting.join(1)
+    assert admitted == [parse_size('2G')]
+    assert MemoryBudget(0.5).capacity == parse_size('4G')
+
+
+def test_memory_profile_keeps_peaks(tmp_path):
+    path = os.path.join(str(tmp_path), 'profile')
+    profile = MemoryProfile(path)
+    profile.record('3dvolreg {func}', 100)
+    profile.record('3dvolreg {func}', 50)
+    profile.record('3dvolreg {func}', 300)
+    profile = MemoryProfile(path)
+    assert profile.load() == {'3dvolreg {func}': 300}
+    with open(path) as f:
+        assert len(f.readlines()) == 1
@@ -0,0 +1,64 @@
+import pandas as pd
+from pynit.handler.selector import FilterIndex, QueryCache
+from pynit.handler.compact import compacting
+
+
+def data_frame():
+    rows = [('sub-00', 'ses-0', 'anat', 'sub-00_T2w.nii.gz'),
+            ('sub-00', 'ses-1', 'func', 'sub-00_bold.nii.gz'),
+            ('sub-01', 'ses-0', 'func', 'sub-01_bold.nii.gz'),
+            ('sub-01', 'ses-0', 'func', 'sub-01_bold.json'),
+            ('sub-02', 'ses-1', 'anat', 'sub-02_T2w.nii.gz')]
+    df = pd.DataFrame(rows, columns=['Subject', 'Session', 'DataType', 'Filename'])
+    df['Abspath'] = ['/prj/Data/{0}'.format(f) for f in df.Filename]
+    return df
+
+
+def applying(df, filters, ext=None):
+    """ Same filters evaluated with pandas masks (Project.applying_filters before the index)
+    """
+    for column, values in zip(['Subject', 'Session', 'DataType'], filters[:3]):
+        if values:
+            df = df[df[column].isin(values)]
+    if filters[4] is not None:
+        df = df[df.Filename.str.contains('|'.join(filters[4]))]
+    if filters[5] is not None:
+        df = df[~df.Filename.str.contains('|'.join(filters[5]))]
+    if ext:
+        df = df[df.Filename.str.contains('|'.join(r"{0}$".format(e) for e in ext))]
+    return list(df.index)
+
+
+def test_select_matches_pandas_filters():
+    df = data_frame()
+    cases = [([None] * 6, None),
+             ([['sub-00', 'sub-01'], None, ['func'], None, None, None], None),
+             ([None, ['ses-0'], None, None, None, ['json']], None),
+             ([None, None, None, None, ['bold'], None], ['.nii.gz']),
+             ([['sub-03'], None, None, None, None, None], None)]
+    for engine in [FilterIndex(df, 0), FilterIndex(compacting(df), 0)]:
+        for filters, ext in cases:
+            assert list(engine.select(filters, ext)) == applying(df, filters, ext)
+    engine = FilterIndex(df, 0)
+    rows = engine.select([['sub-00', 'sub-01'], None, None, None, None, None])
+    assert list(engine.select([None, ['ses-0'], None, None, None, None], rows=rows)) == [0, 2, 3]
+    assert engine.values('DataType', rows) == ['anat', 'func']
+
+
+def test_query_cache_invalidates_scope():
+    cache = QueryCache(maxsize=2)
+    cache.put('a', 1, cache.generation, scope=0)
+    cache.put('b', 2, cache.generation, scope=1)
+    assert cache.get('a') == 1
+    generation = cache.generation
+    cache.invalidate(scope=1)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    cache.put('c', 3, generation, scope=1)       # started before the scope is invalidated
+    assert cache.get('c') is None
+    cache.put('c', 3, cache.generation, scope=1)
+    cache.put('d', 4, cache.generation, scope=1)
+    assert cache.get('a') is None               # least recently used entry is evicted
+    cache.invalidate()
+    assert len(cache) == 0
+    assert cache.info().generation == 2
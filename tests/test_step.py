@@ -0,0 +1,24 @@
+import os
+import logging
+from pynit.handler.base import BaseProcessor
+from pynit.handler.project import Project
+
+
+class Process(object):
+    def __init__(self, root):
+        self.prj = Project(str(root))
+        self.processing = 'A_Pipeline'
+        self.path = os.path.join(self.prj.path, 'Processing', self.processing)
+        self.logger = logging.getLogger('pynit.tests')
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+
+def test_memory_admission_is_opt_in(tmp_path):
+    step = BaseProcessor(Process(tmp_path), n_thread=2)
+    assert step._memory is None
+    assert step._BaseProcessor__memory_budget() == (None, None)
+    step.set_memory('1G', interval=0.5)
+    assert step._memory == (1024 ** 3, 0.5)
+    step.set_memory(False)
+    assert step._memory is None
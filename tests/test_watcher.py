@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import pytest
+from pynit.handler import watcher
+from pynit.handler.watcher import TreeWatcher
+
+
+def waiting(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_polling_calls_back_without_dirs(tmp_path):
+    calls = []
+    tw = TreeWatcher([str(tmp_path)], calls.append, interval=0.05, polling=True)
+    tw.start()
+    try:
+        assert tw.ready.wait(5)
+        assert tw.mode == 'polling'
+        assert waiting(lambda: len(calls) > 1)
+        assert set(calls) == {None}
+    finally:
+        tw.stop()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on Linux')
+def test_inotify_reports_changed_dirs(tmp_path):
+    calls = []
+    tw = TreeWatcher([str(tmp_path)], calls.append, interval=0.05, latency=0.05)
+    tw.start()
+    try:
+        assert tw.ready.wait(5)
+        new_dir = os.path.join(str(tmp_path), 'sub-00')
+        os.mkdir(new_dir)
+        assert waiting(lambda: calls)
+        assert str(tmp_path) in calls[0]
+        assert new_dir in calls[0]
+    finally:
+        tw.stop()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on Linux')
+def test_failed_watcher_is_ready_with_error(tmp_path, monkeypatch):
+    def failing(top):
+        raise RuntimeError('walk failed')
+        yield
+
+    monkeypatch.setattr(watcher, 'walk_tree', failing)
+    tw = TreeWatcher([str(tmp_path)], lambda dirs: None)
+    tw.start()
+    assert tw.ready.wait(5)
+    tw.join(5)
+    assert not tw.is_alive()
+    assert isinstance(tw.error, RuntimeError)